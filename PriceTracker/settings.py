@@ -81,12 +81,70 @@ WSGI_APPLICATION = 'PriceTracker.wsgi.application'
 # Database
 # https://docs.djangoproject.com/en/5.2/ref/settings/#databases
 
-DATABASES = {
-    'default': {
-        'ENGINE': 'django.db.backends.sqlite3',
-        'NAME': BASE_DIR / 'db.sqlite3',
+# DATABASE_ENGINE picks sqlite (default) or postgresql. PostgreSQL reads
+# DATABASE_NAME, DATABASE_USER, DATABASE_PASSWORD, DATABASE_HOST and
+# DATABASE_PORT, plus DATABASE_REPLICA_HOST for a read replica.
+#
+# SQLite runs in WAL mode so readers never wait for a writer. The 'default'
+# connection is the single writer and starts transactions IMMEDIATE, so a
+# second writer waits up to SQLITE_BUSY_TIMEOUT ms instead of failing with
+# "database is locked"; reads go through a query_only 'replica' connection
+# to the same file (catalog.routers.ReadWriteRouter). Set
+# DATABASE_READ_REPLICA=0 to use one connection for everything.
+DATABASE_ENGINE = os.environ.get('DATABASE_ENGINE', 'sqlite')
+DATABASE_CONN_MAX_AGE = int(os.environ.get('DATABASE_CONN_MAX_AGE', 0 if DATABASE_ENGINE == 'sqlite' else 60))
+
+if DATABASE_ENGINE == 'postgresql':
+    DATABASES = {
+        'default': {
+            'ENGINE': 'django.db.backends.postgresql',
+            'NAME': os.environ.get('DATABASE_NAME', 'pricetracker'),
+            'USER': os.environ.get('DATABASE_USER', ''),
+            'PASSWORD': os.environ.get('DATABASE_PASSWORD', ''),
+            'HOST': os.environ.get('DATABASE_HOST', ''),
+            'PORT': os.environ.get('DATABASE_PORT', ''),
+            'CONN_MAX_AGE': DATABASE_CONN_MAX_AGE,
+            'CONN_HEALTH_CHECKS': True,
+        }
     }
-}
+    if os.environ.get('DATABASE_REPLICA_HOST'):
+        DATABASES['replica'] = {
+            **DATABASES['default'],
+            'HOST': os.environ['DATABASE_REPLICA_HOST'],
+            'PORT': os.environ.get('DATABASE_REPLICA_PORT', DATABASES['default']['PORT']),
+            'TEST': {'MIRROR': 'default'},
+        }
+elif DATABASE_ENGINE == 'sqlite':
+    SQLITE_PRAGMAS = {
+        'synchronous': 'NORMAL',
+        'mmap_size': int(os.environ.get('SQLITE_MMAP_SIZE', 256 * 1024 * 1024)),
+        # Negative: KiB rather than pages.
+        'cache_size': int(os.environ.get('SQLITE_CACHE_SIZE', -64 * 1024)),
+        'busy_timeout': int(os.environ.get('SQLITE_BUSY_TIMEOUT', 5000)),
+        'temp_store': 'MEMORY',
+    }
+    _sqlite_init = ';'.join(f'PRAGMA {name}={value}' for name, value in SQLITE_PRAGMAS.items())
+    DATABASES = {
+        'default': {
+            'ENGINE': 'django.db.backends.sqlite3',
+            'NAME': os.environ.get('DATABASE_NAME', BASE_DIR / 'db.sqlite3'),
+            'CONN_MAX_AGE': DATABASE_CONN_MAX_AGE,
+            'OPTIONS': {
+                'init_command': f'PRAGMA journal_mode=WAL;{_sqlite_init}',
+                'transaction_mode': 'IMMEDIATE',
+            },
+        }
+    }
+    if os.environ.get('DATABASE_READ_REPLICA', '1').lower() in ('1', 'true', 'yes'):
+        DATABASES['replica'] = {
+            **DATABASES['default'],
+            'OPTIONS': {'init_command': f'{_sqlite_init};PRAGMA query_only=ON'},
+            'TEST': {'MIRROR': 'default'},
+        }
+else:
+    raise ValueError(f"Unknown DATABASE_ENGINE {DATABASE_ENGINE!r}; use sqlite or postgresql.")
+
+DATABASE_ROUTERS = ['catalog.routers.ReadWriteRouter'] if 'replica' in DATABASES else []
 
 
 # Password validation
@@ -135,4 +193,90 @@ STATICFILES_DIRS = [
 DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
 
 MEDIA_URL = '/media/'
-MEDIA_ROOT = os.path.join(BASE_DIR, 'media') # BASE_DIR is usually defined at the top of settings.py
\ No newline at end of file
+MEDIA_ROOT = os.path.join(BASE_DIR, 'media') # BASE_DIR is usually defined at the top of settings.py
+
+# Catalog search
+# Upper bound on ranked full-text matches returned to the item list; the list
+# tells the user when more matched.
+CATALOG_SEARCH_MAX_RESULTS = int(os.environ.get('CATALOG_SEARCH_MAX_RESULTS', 500))
+
+# Bulk price ingestion (POST /catalog/api/prices/ingest/). The endpoint is
+# disabled while no token is configured.
+CATALOG_INGEST_TOKEN = os.environ.get('CATALOG_INGEST_TOKEN', '')
+CATALOG_INGEST_BATCH_SIZE = int(os.environ.get('CATALOG_INGEST_BATCH_SIZE', 1000))
+# NDJSON uploads are read line by line and have no size limit; a JSON array
+# has to be loaded whole, so its body may be at most this many bytes.
+CATALOG_INGEST_MAX_JSON_SIZE = int(os.environ.get('CATALOG_INGEST_MAX_JSON_SIZE', 64 * 1024 * 1024))
+
+# Price refresh: maps a product URL host to a dotted path of a custom price extractor.
+CATALOG_PRICE_EXTRACTORS = {}
+
+# Cache. CACHE_BACKEND picks locmem (default), file or redis (through the
+# redis package); CACHE_LOCATION is the directory or redis URL for the latter two.
+_CACHE_BACKENDS = {
+    'locmem': 'django.core.cache.backends.locmem.LocMemCache',
+    'file': 'django.core.cache.backends.filebased.FileBasedCache',
+    'redis': 'django.core.cache.backends.redis.RedisCache',
+}
+CACHE_BACKEND = os.environ.get('CACHE_BACKEND', 'locmem')
+CACHES = {
+    'default': {
+        'BACKEND': _CACHE_BACKENDS[CACHE_BACKEND],
+        'LOCATION': os.environ.get('CACHE_LOCATION', {
+            'locmem': 'pricetracker',
+            'file': os.path.join(BASE_DIR, 'cache'),
+            'redis': 'redis://127.0.0.1:6379/1',
+        }[CACHE_BACKEND]),
+    }
+}
+# Seconds a cached page fragment lives; writes invalidate it earlier.
+CATALOG_CACHE_TIMEOUT = int(os.environ.get('CATALOG_CACHE_TIMEOUT', 600))
+
+# Price alerts: delivery backend (catalog.alerts.EmailAlertBackend or
+# catalog.alerts.FileAlertBackend) and the file the latter appends to.
+CATALOG_ALERT_BACKEND = os.environ.get('CATALOG_ALERT_BACKEND', 'catalog.alerts.EmailAlertBackend')
+CATALOG_ALERT_FILE = os.environ.get('CATALOG_ALERT_FILE', os.path.join(BASE_DIR, 'price_alerts.log'))
+EMAIL_BACKEND = os.environ.get('EMAIL_BACKEND', 'django.core.mail.backends.console.EmailBackend')
+
+# Unit prices: slugs of package-size attributes, preferred in this order when
+# an item has several. Attributes flagged is_package_size and the slugs in
+# catalog.unitprice.PACKAGE_SIZE_SLUGS count as package sizes too.
+CATALOG_UNIT_PRICE_ATTRIBUTES = [
+    slug for slug in os.environ.get('CATALOG_UNIT_PRICE_ATTRIBUTES', '').split(',') if slug
+]
+
+# Currencies: exchange rates are stored as base-currency units per unit of
+# another currency; listings and statistics are shown in the display currency.
+CATALOG_BASE_CURRENCY = os.environ.get('CATALOG_BASE_CURRENCY', 'HUF')
+CATALOG_DISPLAY_CURRENCY = os.environ.get('CATALOG_DISPLAY_CURRENCY', CATALOG_BASE_CURRENCY)
+
+# Item image thumbnails: widths in pixels (each also made as WebP) and the
+# size of the background process pool; 0 renders them inline.
+CATALOG_THUMBNAIL_WIDTHS = [
+    int(width) for width in os.environ.get('CATALOG_THUMBNAIL_WIDTHS', '160,320,640').split(',') if width
+]
+CATALOG_THUMBNAIL_WORKERS = int(os.environ.get('CATALOG_THUMBNAIL_WORKERS', 2))
+
+# Serve the search, last-purchase and price history endpoints with the async
+# views in catalog/async_views.py. Turn on when running under ASGI.
+CATALOG_ASYNC_VIEWS = os.environ.get('CATALOG_ASYNC_VIEWS', '').lower() in ('1', 'true', 'yes')
+
+# Request profiling (catalog.profiling.ProfilingMiddleware): Server-Timing
+# headers and per-view percentiles at /catalog/_perf/ for a sample of requests.
+CATALOG_PROFILING = os.environ.get('CATALOG_PROFILING', '').lower() in ('1', 'true', 'yes')
+CATALOG_PROFILING_SAMPLE_RATE = float(os.environ.get('CATALOG_PROFILING_SAMPLE_RATE', 0.1))
+CATALOG_PROFILING_REPEAT_THRESHOLD = int(os.environ.get('CATALOG_PROFILING_REPEAT_THRESHOLD', 5))
+if CATALOG_PROFILING:
+    MIDDLEWARE.insert(0, 'catalog.profiling.ProfilingMiddleware')
+
+# Price history archival (catalog.archive): rows older than this many days
+# move to per-month archive tables, leaving daily rollups behind. The tables
+# go to the CATALOG_ARCHIVE_DATABASE alias; with SQLite, DATABASE_ARCHIVE_NAME
+# puts them in a separate file.
+CATALOG_ARCHIVE_AFTER_DAYS = int(os.environ.get('CATALOG_ARCHIVE_AFTER_DAYS', 365))
+if DATABASE_ENGINE == 'sqlite' and os.environ.get('DATABASE_ARCHIVE_NAME'):
+    DATABASES['archive'] = {
+        **DATABASES['default'],
+        'NAME': os.environ['DATABASE_ARCHIVE_NAME'],
+    }
+CATALOG_ARCHIVE_DATABASE = 'archive' if 'archive' in DATABASES else 'default'
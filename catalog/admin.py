@@ -1,9 +1,52 @@
 # PriceTracker/catalog/admin.py
 from django.contrib import admin
-from .models import Tag, Store, Item, PriceHistory, AttributeGroup, AttributeDefinition, ItemSpecification
+from django.core.paginator import Paginator
+from django.db import connections
+from django.db.models import Max
+from django.utils.functional import cached_property
+from .models import Tag, Store, Item, PriceHistory, LatestPrice, PriceAlert, AttributeGroup, AttributeDefinition, ItemSpecification, ExchangeRate
+
+class EstimatedCountPaginator(Paginator):
+    """Paginator that estimates the size of large unfiltered changelists.
+
+    An exact COUNT(*) over millions of rows takes longer than the page query
+    itself. Without filters the count comes from PostgreSQL's planner
+    statistics or, elsewhere, from MAX(id); tables estimated below
+    ``EXACT_COUNT_BELOW`` rows, and filtered changelists, are still counted
+    exactly.
+    """
+    EXACT_COUNT_BELOW = 10000
+
+    @cached_property
+    def count(self):
+        query = getattr(self.object_list, 'query', None)
+        if query is None or query.where:
+            return super().count
+        estimate = self.estimate(self.object_list)
+        if estimate is None or estimate < self.EXACT_COUNT_BELOW:
+            return super().count
+        return estimate
+
+    @staticmethod
+    def estimate(queryset):
+        model = queryset.model
+        connection = connections[queryset.db]
+        if connection.vendor == 'postgresql':
+            with connection.cursor() as cursor:
+                cursor.execute("SELECT reltuples FROM pg_class WHERE relname = %s", [model._meta.db_table])
+                row = cursor.fetchone()
+            # reltuples is -1 until the table has been analyzed.
+            if row and row[0] >= 0:
+                return int(row[0])
+            return None
+        return model._default_manager.using(queryset.db).aggregate(max_id=Max('pk'))['max_id'] or 0
 
 admin.site.register(Tag)
-admin.site.register(Store)
+
+@admin.register(Store)
+class StoreAdmin(admin.ModelAdmin):
+    list_display = ('name', 'website_url')
+    search_fields = ('name',)
 
 @admin.register(AttributeGroup)
 class AttributeGroupAdmin(admin.ModelAdmin):
@@ -12,8 +55,8 @@ class AttributeGroupAdmin(admin.ModelAdmin):
 
 @admin.register(AttributeDefinition)
 class AttributeDefinitionAdmin(admin.ModelAdmin):
-    list_display = ('name', 'group', 'value_type', 'unit', 'slug', 'display_order')
-    list_filter = ('group', 'value_type')
+    list_display = ('name', 'group', 'value_type', 'unit', 'is_package_size', 'slug', 'display_order')
+    list_filter = ('group', 'value_type', 'is_package_size')
     search_fields = ('name', 'slug', 'group__name')
     prepopulated_fields = {'slug': ('name',)}
 
@@ -35,12 +78,61 @@ class ItemAdmin(admin.ModelAdmin):
     list_filter = ('tags',)
     inlines = [ItemSpecificationInline]
 
+    def get_queryset(self, request):
+        return super().get_queryset(request).prefetch_related('tags')
+
     def get_tags_display(self, obj):
         return ", ".join([tag.name for tag in obj.tags.all()])
     get_tags_display.short_description = 'Tags'
 
+class ItemWithHistoryFilter(admin.SimpleListFilter):
+    """Offers only items that have price history, read from LatestPrice
+    instead of a DISTINCT over the whole history table.
+
+    The sidebar lists the first ``LIMIT`` of them by name, plus the selected
+    one; the changelist search (item name) reaches the rest.
+    """
+    title = 'item'
+    parameter_name = 'item'
+    LIMIT = 100
+
+    def lookups(self, request, model_admin):
+        with_history = Item.objects.filter(pk__in=LatestPrice.objects.values('item_id')).order_by('name')
+        choices = list(with_history.values_list('pk', 'name')[:self.LIMIT])
+        selected = self.value()
+        if selected and selected.isdigit() and int(selected) not in {pk for pk, _ in choices}:
+            choices += with_history.filter(pk=selected).values_list('pk', 'name')
+        return choices
+
+    def queryset(self, request, queryset):
+        if self.value():
+            return queryset.filter(item_id=self.value())
+        return queryset
+
 @admin.register(PriceHistory)
 class PriceHistoryAdmin(admin.ModelAdmin):
     list_display = ('item', 'store', 'price', 'currency', 'date_recorded', 'on_sale', 'pre_sale_price', 'product_url')
-    list_filter = ('item__name', 'store__name', 'on_sale', 'date_recorded')
-    search_fields = ('item__name', 'store__name', 'product_url')
\ No newline at end of file
+    list_filter = (ItemWithHistoryFilter, 'store', 'on_sale', 'date_recorded')
+    list_select_related = ('item', 'store')
+    search_fields = ('item__name', 'store__name', 'product_url')
+    autocomplete_fields = ('item', 'store')
+    paginator = EstimatedCountPaginator
+    show_full_result_count = False
+
+
+@admin.register(PriceAlert)
+class PriceAlertAdmin(admin.ModelAdmin):
+    list_display = ('email', 'item', 'store', 'kind', 'threshold', 'is_active', 'triggered_at', 'triggered_price')
+    list_filter = ('kind', 'is_active')
+    list_select_related = ('item', 'store')
+    search_fields = ('email', 'item__name')
+    autocomplete_fields = ('item', 'store')
+    raw_id_fields = ('triggered_entry',)
+
+
+@admin.register(ExchangeRate)
+class ExchangeRateAdmin(admin.ModelAdmin):
+    list_display = ('currency', 'rate_date', 'rate')
+    list_filter = ('currency',)
+    date_hierarchy = 'rate_date'
+    ordering = ('-rate_date', 'currency')
@@ -0,0 +1,225 @@
+# PriceTracker/catalog/alerts.py
+import json
+from bisect import bisect_right
+from datetime import timedelta
+from decimal import Decimal
+
+from django.conf import settings
+from django.core.mail import send_mail
+from django.db import router, transaction
+from django.db.models import F, Sum
+from django.utils import timezone
+from django.utils.module_loading import import_string
+
+from .cache import get_or_build, invalidate
+from .currency import MissingRate, base_currency, get_rate_cache
+from .models import LatestPrice, PriceAlert, PriceHistory
+
+AVERAGE_DAYS = 30
+
+
+def alert_namespace(item_id):
+    return f'alerts:{item_id}'
+
+
+class ThresholdIndex:
+    """The active alerts of one item, each kind sorted by threshold.
+
+    ``below`` fires for every threshold strictly above the new price and
+    ``drop_pct`` for every threshold at or under the observed drop, so each
+    check is a bisect plus the alerts that actually fire.
+    """
+    def __init__(self, alerts):
+        self.thresholds = {}
+        self.entries = {}
+        for kind, _ in PriceAlert.KIND_CHOICES:
+            rows = sorted(
+                (alert.threshold, alert.pk, alert.store_id) for alert in alerts if alert.kind == kind
+            )
+            self.thresholds[kind] = [threshold for threshold, _, _ in rows]
+            self.entries[kind] = [(alert_id, store_id) for _, alert_id, store_id in rows]
+
+    def __bool__(self):
+        return any(self.thresholds.values())
+
+    @property
+    def watches_drops(self):
+        return bool(self.thresholds[PriceAlert.KIND_DROP_PCT])
+
+    @staticmethod
+    def _for_store(entries, store_id):
+        return [alert_id for alert_id, alert_store in entries if alert_store in (None, store_id)]
+
+    def below(self, store_id, price):
+        kind = PriceAlert.KIND_BELOW
+        start = bisect_right(self.thresholds[kind], price)
+        return self._for_store(self.entries[kind][start:], store_id)
+
+    def dropped(self, store_id, drop_pct):
+        kind = PriceAlert.KIND_DROP_PCT
+        end = bisect_right(self.thresholds[kind], drop_pct)
+        return self._for_store(self.entries[kind][:end], store_id)
+
+
+def threshold_index(item_id):
+    """The item's ThresholdIndex, cached until one of its alerts changes."""
+    def build():
+        return ThresholdIndex(list(PriceAlert.objects.filter(item_id=item_id, is_active=True)))
+    return get_or_build('alert_thresholds', (item_id,), (alert_namespace(item_id),), build)
+
+
+def _recent_averages(pairs, exclude_ids, now):
+    """Observation-weighted average price per (item, store, currency) over the last AVERAGE_DAYS."""
+    rows = (
+        PriceHistory.objects.filter(
+            item_id__in={item_id for item_id, _ in pairs},
+            store_id__in={store_id for _, store_id in pairs},
+            date_recorded__gte=now - timedelta(days=AVERAGE_DAYS),
+        )
+        .exclude(pk__in=exclude_ids)
+        .values('item_id', 'store_id', 'currency')
+        .annotate(total=Sum(F('price') * F('observation_count')), observations=Sum('observation_count'))
+        .order_by()
+    )
+    return {
+        (row['item_id'], row['store_id'], row['currency']): Decimal(row['total']) / row['observations']
+        for row in rows if row['observations']
+    }
+
+
+def _current_entries(candidates):
+    """The candidates that are (or are about to become) their pair's LatestPrice.
+
+    The post_save path runs before LatestPrice is updated and bulk ingestion
+    after, so an entry counts as current when nothing newer is recorded.
+    Backdated rows, such as an import of old prices, never fire alerts.
+    """
+    latest = {
+        (row['item_id'], row['store_id']): (row['date_recorded'], row['price_entry_id'])
+        for row in LatestPrice.objects.filter(
+            item_id__in={item_id for item_id, _ in candidates},
+            store_id__in={store_id for _, store_id in candidates},
+        ).values('item_id', 'store_id', 'date_recorded', 'price_entry_id')
+    }
+    return {
+        pair: entry for pair, entry in candidates.items()
+        if pair not in latest or (entry.date_recorded, entry.pk) >= latest[pair]
+    }
+
+
+def _base_price(rates, entry):
+    """The entry's price in the base currency, which 'below' thresholds are in; None without a rate."""
+    try:
+        return rates.convert(entry.price, entry.currency, base_currency(), day=entry.date_recorded)
+    except MissingRate:
+        return None
+
+
+def evaluate_entries(entries):
+    """Checks the alerts of the items touched by newly saved PriceHistory rows.
+
+    Only the newest entry of each item/store pair is considered, and only
+    if it is the pair's current price. 'below' thresholds are compared in
+    the base currency; drops are measured against the average of the same
+    currency. Triggered alerts are deactivated right away and delivered
+    once the transaction commits. Returns the triggered alerts.
+    """
+    newest = {}
+    for entry in entries:
+        pair = (entry.item_id, entry.store_id)
+        if pair not in newest or (entry.date_recorded, entry.pk) >= (newest[pair].date_recorded, newest[pair].pk):
+            newest[pair] = entry
+    indexes = {item_id: threshold_index(item_id) for item_id in {item_id for item_id, _ in newest}}
+    candidates = {pair: entry for pair, entry in newest.items() if indexes[pair[0]]}
+    if candidates:
+        candidates = _current_entries(candidates)
+    if not candidates:
+        return []
+
+    drop_pairs = [pair for pair in candidates if indexes[pair[0]].watches_drops]
+    averages = {}
+    if drop_pairs:
+        averages = _recent_averages(
+            drop_pairs, [candidates[pair].pk for pair in drop_pairs], timezone.now(),
+        )
+
+    rates = get_rate_cache()
+    fired = {}
+    for (item_id, store_id), entry in candidates.items():
+        index = indexes[item_id]
+        price = _base_price(rates, entry)
+        if price is not None:
+            for alert_id in index.below(store_id, price):
+                fired.setdefault(alert_id, entry)
+        average = averages.get((item_id, store_id, entry.currency))
+        if average:
+            drop_pct = (average - entry.price) * 100 / average
+            if drop_pct > 0:
+                for alert_id in index.dropped(store_id, drop_pct):
+                    fired.setdefault(alert_id, entry)
+    if not fired:
+        return []
+
+    now = timezone.now()
+    alerts = list(PriceAlert.objects.select_related('item').filter(pk__in=fired, is_active=True))
+    for alert in alerts:
+        entry = fired[alert.pk]
+        alert.is_active = False
+        alert.triggered_at = now
+        alert.triggered_price = entry.price
+        alert.triggered_entry = entry
+    PriceAlert.objects.bulk_update(alerts, ['is_active', 'triggered_at', 'triggered_price', 'triggered_entry'])
+    invalidate(*(alert_namespace(item_id) for item_id in {alert.item_id for alert in alerts}))
+
+    backend = get_backend()
+    transaction.on_commit(lambda: backend.deliver(alerts), using=router.db_for_write(PriceAlert))
+    return alerts
+
+
+def alert_message(alert):
+    entry = alert.triggered_entry
+    if alert.kind == PriceAlert.KIND_DROP_PCT:
+        condition = f"dropped at least {alert.threshold}% below its {AVERAGE_DAYS}-day average"
+    else:
+        condition = f"went below {alert.threshold}"
+    subject = f"Price alert: {alert.item.name}"
+    body = (
+        f"The price of {alert.item.name} at {entry.store.name} {condition}.\n"
+        f"New price: {entry.price} {entry.currency}"
+    )
+    return subject, body
+
+
+class EmailAlertBackend:
+    """Sends each alert with Django's mail framework (so EMAIL_BACKEND decides
+    whether it goes to SMTP, the console or a file)."""
+    def deliver(self, alerts):
+        for alert in alerts:
+            subject, body = alert_message(alert)
+            send_mail(subject, body, None, [alert.email])
+
+
+class FileAlertBackend:
+    """Appends one JSON line per alert to ``CATALOG_ALERT_FILE``."""
+    def __init__(self, path=None):
+        self.path = path or settings.CATALOG_ALERT_FILE
+
+    def deliver(self, alerts):
+        with open(self.path, 'a', encoding='utf-8') as handle:
+            for alert in alerts:
+                subject, body = alert_message(alert)
+                handle.write(json.dumps({
+                    'alert_id': alert.pk,
+                    'email': alert.email,
+                    'item_id': alert.item_id,
+                    'kind': alert.kind,
+                    'threshold': str(alert.threshold),
+                    'price': str(alert.triggered_price),
+                    'triggered_at': alert.triggered_at.isoformat(),
+                    'subject': subject,
+                    'body': body,
+                }) + '\n')
+
+
+def get_backend():
+    return import_string(getattr(settings, 'CATALOG_ALERT_BACKEND', 'catalog.alerts.EmailAlertBackend'))()
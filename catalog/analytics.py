@@ -0,0 +1,397 @@
+# PriceTracker/catalog/analytics.py
+from datetime import date, datetime, timedelta
+
+import numpy as np
+from django.db.models import BigIntegerField, Func
+from django.utils import timezone
+
+from .currency import get_rate_cache
+from .models import PriceHistory, PriceRollup
+
+SERIES_FIELDS = (
+    'item_id', 'store_id', 'recorded_us', 'price', 'on_sale', 'pre_sale_price', 'observation_count', 'currency',
+)
+DEFAULT_WINDOW = 7
+MEDIAN_DAYS = 90
+SECONDS_PER_DAY = 86400
+EPOCH_ORDINAL = date(1970, 1, 1).toordinal()
+
+
+class EpochMicroseconds(Func):
+    """Microseconds since the Unix epoch of a datetime column, computed by the database.
+
+    Saves a datetime object and a .timestamp() call per row. The column is
+    referenced twice on SQLite, so pass a plain field name.
+    """
+    output_field = BigIntegerField()
+    template = 'CAST(EXTRACT(EPOCH FROM %(expressions)s) * 1000000 AS BIGINT)'
+
+    def as_sqlite(self, compiler, connection, **extra_context):
+        # Stored as 'YYYY-MM-DD HH:MM:SS[.ffffff]' in UTC. The %% survive
+        # both the template and the query parameter formatting.
+        return self.as_sql(
+            compiler, connection,
+            template=(
+                "(CAST(strftime('%%%%s', %(expressions)s) AS INTEGER) * 1000000"
+                " + CAST(substr(%(expressions)s || '.000000', 21, 6) AS INTEGER))"
+            ),
+            **extra_context,
+        )
+
+
+def local_day_ordinals(seconds):
+    """Date ordinals of the local calendar day of Unix timestamps.
+
+    The UTC offset is looked up once per distinct UTC day rather than per
+    row; only rows on a day with an offset change get their own lookup.
+    """
+    seconds = np.asarray(seconds, dtype=np.float64)
+    if not len(seconds):
+        return np.empty(0, dtype=np.int64)
+    tz = timezone.get_current_timezone()
+
+    def offset(timestamp):
+        return datetime.fromtimestamp(timestamp, tz).utcoffset().total_seconds()
+
+    utc_days, index = np.unique(np.floor_divide(seconds, SECONDS_PER_DAY).astype(np.int64), return_inverse=True)
+    starts = np.array([offset(day * SECONDS_PER_DAY) for day in utc_days.tolist()])
+    ends = np.array([offset((day + 1) * SECONDS_PER_DAY) for day in utc_days.tolist()])
+    offsets = starts[index]
+    for row in np.flatnonzero(starts[index] != ends[index]).tolist():
+        offsets[row] = offset(seconds[row])
+    return np.floor_divide(seconds + offsets, SECONDS_PER_DAY).astype(np.int64) + EPOCH_ORDINAL
+
+
+def date_ordinals(days):
+    """Date ordinals of an array of dates, converted by NumPy rather than per row."""
+    return np.asarray(days, dtype='datetime64[D]').astype(np.int64) + EPOCH_ORDINAL
+
+
+class PriceSeries:
+    """Price rows as parallel NumPy arrays, sorted by (item, store, date).
+
+    Every statistic is computed per (item, store) group; ``starts`` holds the
+    index of each group's first row and ``group_of_row`` maps rows back to
+    their group. ``weights`` is each row's observation_count, so run-length
+    rows count as often as the observations they stand for.
+    """
+    def __init__(self, item_ids, store_ids, timestamps, prices, on_sale, pre_sale_prices, weights,
+                 currencies=None, days=None):
+        size = len(prices)
+        self.currencies = np.asarray(currencies if currencies is not None else [''] * size, dtype=str)
+        # Local calendar day of each row as a date ordinal, for exchange rate lookups.
+        self.days = np.asarray(days if days is not None else np.zeros(size), dtype=np.int64)
+        self.item_ids = np.asarray(item_ids, dtype=np.int64)
+        self.store_ids = np.asarray(store_ids, dtype=np.int64)
+        self.timestamps = np.asarray(timestamps, dtype=np.float64)
+        self.prices = np.asarray(prices, dtype=np.float64)
+        self.on_sale = np.asarray(on_sale, dtype=bool)
+        # None (no pre-sale price) becomes NaN.
+        self.pre_sale_prices = np.asarray(pre_sale_prices, dtype=np.float64)
+        self.weights = np.asarray(weights, dtype=np.float64)
+
+        if size:
+            boundary = (np.diff(self.item_ids) != 0) | (np.diff(self.store_ids) != 0)
+            self.starts = np.concatenate(([0], np.flatnonzero(boundary) + 1))
+        else:
+            self.starts = np.empty(0, dtype=np.intp)
+        self.ends = np.append(self.starts[1:], size).astype(np.intp)
+        self.group_of_row = np.repeat(np.arange(len(self.starts)), self.ends - self.starts)
+
+    def __len__(self):
+        return len(self.prices)
+
+    @property
+    def group_count(self):
+        return len(self.starts)
+
+    @classmethod
+    def load(cls, entries):
+        """Loads a PriceHistory queryset with a single values_list query.
+
+        Timestamps come from the database as epoch microseconds and local
+        days are derived from them with array arithmetic. Rows are sorted
+        here with np.lexsort rather than by the database, so no index has
+        to match the (item, store, date) order.
+        """
+        rows = entries.order_by().annotate(recorded_us=EpochMicroseconds('date_recorded')).values_list('id', *SERIES_FIELDS)
+        columns = list(zip(*rows)) or [()] * (len(SERIES_FIELDS) + 1)
+        ids, item_ids, store_ids, recorded_us, prices, on_sale, pre_sale_prices, weights, currencies = (
+            np.asarray(column) for column in columns
+        )
+        timestamps = recorded_us.astype(np.int64) / 1e6
+        days = local_day_ordinals(timestamps)
+        order = np.lexsort((ids, timestamps, store_ids, item_ids))
+        return cls(
+            item_ids[order], store_ids[order], timestamps[order], prices[order],
+            on_sale[order], pre_sale_prices[order], weights[order], currencies[order], days[order],
+        )
+
+    def converted(self, currency, rates):
+        """A copy with prices converted to ``currency`` at each row's daily rate.
+
+        Rows in a currency without any known rate are left out.
+        """
+        prices = rates.convert_array(self.prices, self.currencies, self.days, currency)
+        pre_sale_prices = rates.convert_array(self.pre_sale_prices, self.currencies, self.days, currency)
+        keep = ~np.isnan(prices)
+        return PriceSeries(
+            self.item_ids[keep], self.store_ids[keep], self.timestamps[keep], prices[keep],
+            self.on_sale[keep], pre_sale_prices[keep], self.weights[keep],
+            np.full(int(keep.sum()), currency), self.days[keep],
+        )
+
+
+def _range_reduce(ufunc, values, first, last):
+    """``ufunc`` (np.fmin or np.fmax) over values[first[i]:last[i] + 1] for every i.
+
+    A sparse table: level k holds the reduction of each run of 2**k values,
+    and every range is covered by two overlapping runs of one level.
+    """
+    lengths = last - first + 1
+    levels = [values]
+    while 2 ** len(levels) <= lengths.max():
+        previous, step = levels[-1], 2 ** (len(levels) - 1)
+        levels.append(ufunc(previous[:-step], previous[step:]))
+    level = np.floor(np.log2(lengths)).astype(np.intp)
+    result = np.empty(len(first))
+    for k in np.unique(level).tolist():
+        rows = np.flatnonzero(level == k)
+        result[rows] = ufunc(levels[k][first[rows]], levels[k][last[rows] - 2 ** k + 1])
+    return result
+
+
+def rolling_stats(series, window=DEFAULT_WINDOW):
+    """Per-row min, max and mean over the group's last ``window`` observations.
+
+    Observations rather than rows: a run-length row stands for
+    observation_count of them, so the figures don't change when
+    compaction merges rows. The oldest row in a window may count only
+    partly towards the mean.
+    """
+    size = len(series)
+    if not size:
+        empty = np.empty(0)
+        return {'min': empty, 'max': empty, 'mean': empty}
+    rows = np.arange(size)
+    group_start = series.starts[series.group_of_row]
+    observations = np.concatenate(([0.0], np.cumsum(series.weights)))
+    weighted = np.concatenate(([0.0], np.cumsum(series.prices * series.weights)))
+
+    # The first row whose last observation is among the window's.
+    threshold = observations[rows + 1] - window
+    first = np.maximum(np.searchsorted(observations[1:], threshold, side='right'), group_start)
+    first = np.minimum(first, rows)
+
+    counted = np.minimum(observations[rows + 1] - observations[group_start], window)
+    excess = (observations[rows + 1] - observations[first]) - counted
+    rolling_mean = (weighted[rows + 1] - weighted[first] - series.prices[first] * excess) / counted
+    return {
+        'min': _range_reduce(np.fmin, series.prices, first, rows),
+        'max': _range_reduce(np.fmax, series.prices, first, rows),
+        'mean': rolling_mean,
+    }
+
+
+def _weighted_group_median(groups, values, weights, group_count):
+    """Lower weighted median of ``values`` per group; NaN for groups without rows."""
+    medians = np.full(group_count, np.nan)
+    if not len(values):
+        return medians
+    order = np.lexsort((values, groups))
+    groups, values, weights = groups[order], values[order], weights[order]
+    cumulative = np.cumsum(weights)
+    starts = np.flatnonzero(np.concatenate(([True], groups[1:] != groups[:-1])))
+    before = np.concatenate(([0.0], cumulative[starts[1:] - 1]))
+    totals = np.add.reduceat(weights, starts)
+    middle = np.searchsorted(cumulative, before + totals / 2, side='left')
+    medians[groups[starts]] = values[middle]
+    return medians
+
+
+def _safe_divide(numerator, denominator):
+    with np.errstate(divide='ignore', invalid='ignore'):
+        return np.where(denominator > 0, numerator / denominator, np.nan)
+
+
+ROLLUP_FIELDS = (
+    'item_id', 'store_id', 'day', 'currency', 'min_price', 'max_price', 'price_sum', 'observations',
+    'first_recorded_us', 'sale_observations', 'discount_sum', 'discount_observations', 'max_discount',
+)
+
+
+def rollup_totals(rollups, currency=None, rates=None):
+    """Per (item, store) totals of daily PriceRollup rows.
+
+    With ``currency`` each day's prices are converted at that day's rate;
+    days in a currency without any known rate are left out, as rows are.
+    The days are summed per pair with np.add.reduceat, like group_stats().
+    """
+    rows = list(
+        rollups.order_by().annotate(first_recorded_us=EpochMicroseconds('first_recorded')).values_list(*ROLLUP_FIELDS)
+    )
+    if not rows:
+        return {}
+    columns = dict(zip(ROLLUP_FIELDS, (np.asarray(column) for column in zip(*rows))))
+    low = columns['min_price'].astype(np.float64)
+    high = columns['max_price'].astype(np.float64)
+    price_sum = columns['price_sum'].astype(np.float64)
+    if currency:
+        rates = rates or get_rate_cache()
+        days = date_ordinals(columns['day'])
+        currencies = columns['currency'].astype(str)
+        low = rates.convert_array(low, currencies, days, currency)
+        high = rates.convert_array(high, currencies, days, currency)
+        price_sum = rates.convert_array(price_sum, currencies, days, currency)
+    keep = ~np.isnan(low)
+    if not keep.any():
+        return {}
+    item_ids = columns['item_id'].astype(np.int64)[keep]
+    store_ids = columns['store_id'].astype(np.int64)[keep]
+    order = np.lexsort((store_ids, item_ids))
+    item_ids, store_ids = item_ids[order], store_ids[order]
+    starts = np.flatnonzero(np.concatenate(([True], (np.diff(item_ids) != 0) | (np.diff(store_ids) != 0))))
+
+    def column(values):
+        return np.asarray(values, dtype=np.float64)[keep][order]
+
+    sums = {
+        name: np.add.reduceat(column(values), starts) for name, values in (
+            ('observations', columns['observations']), ('price_sum', price_sum),
+            ('sale_observations', columns['sale_observations']), ('discount_sum', columns['discount_sum']),
+            ('discount_observations', columns['discount_observations']),
+        )
+    }
+    sums['low'] = np.minimum.reduceat(column(low), starts)
+    sums['high'] = np.maximum.reduceat(column(high), starts)
+    sums['max_discount'] = np.maximum.reduceat(column(columns['max_discount']), starts)
+    sums['first_seen'] = np.minimum.reduceat(column(columns['first_recorded_us']), starts) / 1e6
+    names = list(sums)
+    return {
+        pair: dict(zip(names, values))
+        for pair, values in zip(
+            zip(item_ids[starts].tolist(), store_ids[starts].tolist()),
+            zip(*(sums[name].tolist() for name in names)),
+        )
+    }
+
+
+def _aligned_totals(item_ids, store_ids, totals):
+    """rollup_totals() as arrays lined up with the groups (zero / NaN where none)."""
+    names = ('observations', 'price_sum', 'sale_observations', 'discount_sum', 'discount_observations')
+    aligned = {name: np.zeros(len(item_ids)) for name in names}
+    aligned.update({name: np.full(len(item_ids), np.nan) for name in ('low', 'high', 'max_discount', 'first_seen')})
+    for n, pair in enumerate(zip(item_ids.tolist(), store_ids.tolist())):
+        for name, value in totals.get(pair, {}).items():
+            aligned[name][n] = value
+    return aligned
+
+
+def group_stats(series, window=DEFAULT_WINDOW, median_days=MEDIAN_DAYS, now=None, rollups=None):
+    """Summary arrays with one value per (item, store) group of ``series``.
+
+    ``rollups`` (from rollup_totals()) adds archived days to the all-time
+    figures: observations, low, high, mean, sale frequency and discounts.
+    The current price, rolling window and median come from the rows, so
+    groups without any row are left out.
+    """
+    if not len(series):
+        return {}
+    now = now or timezone.now()
+    starts, last = series.starts, series.ends - 1
+    prices, weights = series.prices, series.weights
+
+    recent = series.timestamps >= (now - timedelta(days=median_days)).timestamp()
+    median = _weighted_group_median(
+        series.group_of_row[recent], prices[recent], weights[recent], series.group_count,
+    )
+    current = prices[last]
+
+    discounted = series.on_sale & (series.pre_sale_prices > 0)
+    depth = np.where(discounted, (series.pre_sale_prices - prices) / np.where(discounted, series.pre_sale_prices, 1), 0.0)
+    discount_weights = weights * discounted
+
+    observations = np.add.reduceat(weights, starts)
+    price_sum = np.add.reduceat(prices * weights, starts)
+    sale_observations = np.add.reduceat(weights * series.on_sale, starts)
+    discount_sum = np.add.reduceat(depth * discount_weights, starts)
+    discount_observations = np.add.reduceat(discount_weights, starts)
+    low = np.minimum.reduceat(prices, starts)
+    high = np.maximum.reduceat(prices, starts)
+    max_discount = np.maximum.reduceat(depth, starts)
+    first_seen = series.timestamps[starts]
+    if rollups:
+        older = _aligned_totals(series.item_ids[starts], series.store_ids[starts], rollups)
+        observations = observations + older['observations']
+        price_sum = price_sum + older['price_sum']
+        sale_observations = sale_observations + older['sale_observations']
+        discount_sum = discount_sum + older['discount_sum']
+        discount_observations = discount_observations + older['discount_observations']
+        low = np.fmin(low, older['low'])
+        high = np.fmax(high, older['high'])
+        max_discount = np.fmax(max_discount, older['max_discount'])
+        first_seen = np.fmin(first_seen, older['first_seen'])
+
+    rolling = rolling_stats(series, window)
+    return {
+        'item_id': series.item_ids[starts],
+        'store_id': series.store_ids[starts],
+        'observations': observations,
+        'first_seen': first_seen,
+        'last_seen': series.timestamps[last],
+        'current': current,
+        'all_time_low': low,
+        'all_time_high': high,
+        'mean': price_sum / observations,
+        'rolling_min': rolling['min'][last],
+        'rolling_max': rolling['max'][last],
+        'rolling_mean': rolling['mean'][last],
+        'median': median,
+        'pct_off_median': _safe_divide((median - current) * 100, median),
+        'sale_frequency': sale_observations / observations,
+        'avg_discount': _safe_divide(discount_sum * 100, discount_observations),
+        'max_discount': max_discount * 100,
+    }
+
+
+def _as_rows(stats):
+    """Turns group_stats arrays into one dict per group (NaN becomes None)."""
+    if not stats:
+        return []
+    names = list(stats)
+    rows = []
+    for values in zip(*(stats[name].tolist() for name in names)):
+        rows.append({
+            name: None if isinstance(value, float) and np.isnan(value) else value
+            for name, value in zip(names, values)
+        })
+    return rows
+
+
+def price_stats(entries, window=DEFAULT_WINDOW, median_days=MEDIAN_DAYS, now=None, currency=None, rollups=None):
+    """Per (item, store) statistics for a PriceHistory queryset, as a list of dicts.
+
+    With ``currency`` every price is first converted at its day's exchange
+    rate. ``rollups`` is a PriceRollup queryset of the archived days to
+    include (see group_stats()).
+    """
+    series = PriceSeries.load(entries)
+    rates = None
+    if currency:
+        rates = get_rate_cache()
+        series = series.converted(currency, rates)
+    totals = rollup_totals(rollups, currency, rates) if rollups is not None else None
+    return _as_rows(group_stats(series, window=window, median_days=median_days, now=now, rollups=totals))
+
+
+def item_price_stats(item_id, **kwargs):
+    """Statistics of one item at every store, archived history included."""
+    return price_stats(
+        PriceHistory.objects.filter(item_id=item_id), rollups=PriceRollup.objects.filter(item_id=item_id), **kwargs,
+    )
+
+
+def store_price_stats(store_id, **kwargs):
+    return price_stats(
+        PriceHistory.objects.filter(store_id=store_id), rollups=PriceRollup.objects.filter(store_id=store_id), **kwargs,
+    )
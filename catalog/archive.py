@@ -0,0 +1,307 @@
+# PriceTracker/catalog/archive.py
+"""Archival of old PriceHistory rows into per-month tables.
+
+Rows older than CATALOG_ARCHIVE_AFTER_DAYS are copied, unchanged and with
+their ids, into ``catalog_pricehistory_archive_YYYYMM`` tables on the
+CATALOG_ARCHIVE_DATABASE alias (the main database by default; a separate
+SQLite file keeps the hot file small), folded into daily PriceRollup rows,
+and deleted from the hot table.
+
+Each batch commits on its own. The archive copy commits first and ignores
+rows it already has, so a batch interrupted between the two databases is
+simply redone; readers drop archived rows whose id is still hot.
+"""
+import re
+import time
+from collections import defaultdict
+from datetime import datetime, timedelta
+
+from django.apps.registry import Apps
+from django.conf import settings
+from django.db import connections, models, router, transaction
+from django.utils import timezone
+
+from .cache import bump, get_or_build, invalidate, item_namespace
+from .models import LatestPrice, PriceAlert, PriceHistory, PriceRollup
+
+TABLE_PREFIX = 'catalog_pricehistory_archive_'
+TABLE_NAME = re.compile(rf'^{TABLE_PREFIX}(\d{{6}})$')
+ARCHIVE_FIELDS = (
+    'id', 'item_id', 'store_id', 'price', 'currency', 'date_recorded', 'on_sale', 'pre_sale_price',
+    'product_url', 'last_seen', 'observation_count',
+)
+DEFAULT_AFTER_DAYS = 365
+ARCHIVE_NAMESPACE = 'archive_tables'
+DEFAULT_BATCH_SIZE = 1000
+
+# Archive models live in their own registry, outside the catalog app, so
+# migrations and the admin never see them.
+archive_apps = Apps()
+_models = {}
+
+
+def archive_after_days():
+    return int(getattr(settings, 'CATALOG_ARCHIVE_AFTER_DAYS', DEFAULT_AFTER_DAYS))
+
+
+def archive_database():
+    return getattr(settings, 'CATALOG_ARCHIVE_DATABASE', 'default')
+
+
+def _read_alias():
+    alias = archive_database()
+    if alias == router.db_for_write(PriceHistory):
+        return router.db_for_read(PriceHistory)
+    return alias
+
+
+def month_of(date_recorded):
+    """'YYYYMM' of the local calendar month of a timestamp."""
+    return timezone.localdate(date_recorded).strftime('%Y%m')
+
+
+def month_end(month):
+    """The first instant after the local calendar month ``month``."""
+    year, number = int(month[:4]), int(month[4:])
+    year, number = (year + 1, 1) if number == 12 else (year, number + 1)
+    return timezone.make_aware(datetime(year, number, 1))
+
+
+def archive_model(month):
+    """The model of the archive table for ``month`` ('YYYYMM')."""
+    if month not in _models:
+        table = f'{TABLE_PREFIX}{month}'
+        meta = type('Meta', (), {
+            'apps': archive_apps,
+            'app_label': 'catalog',
+            'db_table': table,
+            'ordering': ['-date_recorded', '-id'],
+            'indexes': [models.Index(fields=['item_id', '-date_recorded', '-id'], name=f'catalog_pha_{month}_item_idx')],
+        })
+        _models[month] = type(f'PriceHistoryArchive{month}', (models.Model,), {
+            '__module__': __name__,
+            'Meta': meta,
+            # Plain columns, not foreign keys: the table may be in another database.
+            'id': models.BigIntegerField(primary_key=True),
+            'item_id': models.BigIntegerField(),
+            'store_id': models.BigIntegerField(),
+            'price': models.DecimalField(max_digits=10, decimal_places=2),
+            'currency': models.CharField(max_length=3),
+            'date_recorded': models.DateTimeField(),
+            'on_sale': models.BooleanField(default=False),
+            'pre_sale_price': models.DecimalField(max_digits=10, decimal_places=2, null=True),
+            'product_url': models.URLField(max_length=500, null=True),
+            'last_seen': models.DateTimeField(null=True),
+            'observation_count': models.PositiveIntegerField(default=1),
+        })
+    return _models[month]
+
+
+def _table_months(using):
+    connection = connections[using]
+    with connection.cursor() as cursor:
+        tables = connection.introspection.table_names(cursor)
+    return sorted((match.group(1) for match in map(TABLE_NAME.match, tables) if match), reverse=True)
+
+
+def archive_months(using=None):
+    """Months that have an archive table, newest first.
+
+    Cached until archival adds a table, so reads don't list the schema
+    on every request.
+    """
+    using = using or _read_alias()
+    return get_or_build('archive_months', (using,), (ARCHIVE_NAMESPACE,), lambda: _table_months(using))
+
+
+def ensure_archive_table(month, using=None):
+    using = using or archive_database()
+    model = archive_model(month)
+    if month not in _table_months(using):
+        with connections[using].schema_editor() as editor:
+            editor.create_model(model)
+        bump(ARCHIVE_NAMESPACE)
+    return model
+
+
+def archived_entries(item_id=None, store_id=None, since=None, until=None):
+    """[(month_end, queryset), ...] over the archive tables, newest month first.
+
+    Months entirely outside [since, until) are skipped; every row of a
+    queryset is older than its month_end.
+    """
+    using = _read_alias()
+    tables = []
+    for month in archive_months(using):
+        end = month_end(month)
+        if since is not None and end <= since:
+            continue
+        if until is not None and timezone.make_aware(datetime(int(month[:4]), int(month[4:]), 1)) >= until:
+            continue
+        entries = archive_model(month).objects.using(using).all()
+        if item_id is not None:
+            entries = entries.filter(item_id=item_id)
+        if store_id is not None:
+            entries = entries.filter(store_id=store_id)
+        tables.append((end, entries))
+    return tables
+
+
+def _rollup_key(row):
+    return row['item_id'], row['store_id'], timezone.localdate(row['date_recorded']), row['currency']
+
+
+def _summarize(rows):
+    """{(item_id, store_id, day, currency): unsaved PriceRollup} for ARCHIVE_FIELDS rows."""
+    rollups = {}
+    for row in sorted(rows, key=lambda row: (row['date_recorded'], row['id'])):
+        key = _rollup_key(row)
+        weight = row['observation_count']
+        price = row['price']
+        rollup = rollups.get(key)
+        if rollup is None:
+            rollup = rollups[key] = PriceRollup(
+                item_id=key[0], store_id=key[1], day=key[2], currency=key[3],
+                min_price=price, max_price=price, price_sum=0, observations=0, last_price=price,
+                first_recorded=row['date_recorded'], last_recorded=row['date_recorded'],
+            )
+        rollup.min_price = min(rollup.min_price, price)
+        rollup.max_price = max(rollup.max_price, price)
+        rollup.price_sum += price * weight
+        rollup.observations += weight
+        # Rows arrive oldest first, so the last one seen is the day's close.
+        rollup.last_price, rollup.last_recorded = price, row['date_recorded']
+        if row['on_sale']:
+            rollup.sale_observations += weight
+            if row['pre_sale_price'] and row['pre_sale_price'] > 0:
+                depth = float((row['pre_sale_price'] - price) / row['pre_sale_price'])
+                rollup.discount_sum += depth * weight
+                rollup.discount_observations += weight
+                rollup.max_discount = max(rollup.max_discount, depth)
+    return rollups
+
+
+def _merge(stored, new):
+    stored.min_price = min(stored.min_price, new.min_price)
+    stored.max_price = max(stored.max_price, new.max_price)
+    stored.price_sum += new.price_sum
+    stored.observations += new.observations
+    if new.last_recorded >= stored.last_recorded:
+        stored.last_price, stored.last_recorded = new.last_price, new.last_recorded
+    stored.first_recorded = min(stored.first_recorded, new.first_recorded)
+    stored.sale_observations += new.sale_observations
+    stored.discount_sum += new.discount_sum
+    stored.discount_observations += new.discount_observations
+    stored.max_discount = max(stored.max_discount, new.max_discount)
+
+
+def record_rollups(rows):
+    """Folds ARCHIVE_FIELDS rows into PriceRollup; call inside the transaction deleting them."""
+    rollups = _summarize(rows)
+    if not rollups:
+        return 0
+    stored = {
+        (rollup.item_id, rollup.store_id, rollup.day, rollup.currency): rollup
+        for rollup in PriceRollup.objects.filter(
+            item_id__in={key[0] for key in rollups},
+            store_id__in={key[1] for key in rollups},
+            day__in={key[2] for key in rollups},
+        )
+    }
+    changed, created = [], []
+    for key, rollup in rollups.items():
+        if key in stored:
+            _merge(stored[key], rollup)
+            changed.append(stored[key])
+        else:
+            created.append(rollup)
+    if changed:
+        PriceRollup.objects.bulk_update(changed, [
+            'min_price', 'max_price', 'price_sum', 'observations', 'last_price', 'first_recorded',
+            'last_recorded', 'sale_observations', 'discount_sum', 'discount_observations', 'max_discount',
+        ])
+    PriceRollup.objects.bulk_create(created)
+    return len(rollups)
+
+
+class ArchiveStats:
+    def __init__(self):
+        self.batches = 0
+        self.rows_archived = 0
+        self.rollups_written = 0
+        self.months = set()
+
+
+def archive_batch(rows, stats):
+    """Moves one batch of ARCHIVE_FIELDS rows out of the hot table."""
+    hot, archive = router.db_for_write(PriceHistory), archive_database()
+    by_month = defaultdict(list)
+    for row in rows:
+        by_month[month_of(row['date_recorded'])].append(row)
+    # Schema changes can't run inside the transactions below on SQLite.
+    models_by_month = {month: ensure_archive_table(month, archive) for month in by_month}
+
+    with transaction.atomic(using=hot):
+        with transaction.atomic(using=archive):
+            for month, month_rows in by_month.items():
+                model = models_by_month[month]
+                model.objects.using(archive).bulk_create(
+                    [model(**row) for row in month_rows], ignore_conflicts=True,
+                )
+        stats.rollups_written += record_rollups(rows)
+        # Nothing references these rows (current prices and alert triggers
+        # are never archived), so no delete signals are needed; the pages
+        # listing them are invalidated once below.
+        PriceHistory.objects.filter(pk__in=[row['id'] for row in rows])._raw_delete(hot)
+        invalidate(*{item_namespace(row['item_id']) for row in rows})
+    stats.batches += 1
+    stats.rows_archived += len(rows)
+    stats.months.update(by_month)
+
+
+def archivable_entries(cutoff):
+    """Hot rows older than ``cutoff`` that may leave the table."""
+    return (
+        PriceHistory.objects.filter(date_recorded__lt=cutoff)
+        .exclude(pk__in=LatestPrice.objects.values('price_entry_id'))
+        .exclude(pk__in=PriceAlert.objects.filter(triggered_entry__isnull=False).values('triggered_entry_id'))
+    )
+
+
+def archive_price_history(after_days=None, batch_size=DEFAULT_BATCH_SIZE, pause=0.0, limit=None, progress=None, now=None):
+    """Archives every row older than ``after_days`` (CATALOG_ARCHIVE_AFTER_DAYS), oldest first.
+
+    One transaction per ``batch_size`` rows, with ``pause`` seconds between
+    batches, so the site keeps running. Stops after ``limit`` rows if given.
+    """
+    after_days = archive_after_days() if after_days is None else after_days
+    cutoff = (now or timezone.now()) - timedelta(days=after_days)
+    hot = router.db_for_write(PriceHistory)
+    stats = ArchiveStats()
+    while limit is None or stats.rows_archived < limit:
+        size = batch_size if limit is None else min(batch_size, limit - stats.rows_archived)
+        rows = list(
+            archivable_entries(cutoff).using(hot).order_by('date_recorded', 'id').values(*ARCHIVE_FIELDS)[:size]
+        )
+        if not rows:
+            break
+        archive_batch(rows, stats)
+        if progress:
+            progress(stats)
+        if pause:
+            time.sleep(pause)
+    return stats
+
+
+def rollup_entries(item_id=None, store_id=None, since=None, until=None):
+    """PriceRollup rows, optionally narrowed like archived_entries() (whole days)."""
+    rollups = PriceRollup.objects.all()
+    if item_id is not None:
+        rollups = rollups.filter(item_id=item_id)
+    if store_id is not None:
+        rollups = rollups.filter(store_id=store_id)
+    if since is not None:
+        rollups = rollups.filter(day__gte=timezone.localdate(since))
+    if until is not None:
+        rollups = rollups.filter(day__lte=timezone.localdate(until - timedelta(microseconds=1)))
+    return rollups
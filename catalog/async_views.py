@@ -0,0 +1,92 @@
+# PriceTracker/catalog/async_views.py
+"""Async versions of the catalog's AJAX and price history read endpoints, for ASGI deployments.
+
+Selected in catalog/urls.py when CATALOG_ASYNC_VIEWS is on. They return the
+same responses as their counterparts in views.py but await the database
+and cache instead of holding a worker thread while they wait.
+"""
+from asgiref.sync import sync_to_async
+from django.http import Http404, HttpResponse, JsonResponse
+from django.views.decorators.http import require_GET
+
+from . import views
+from .cache import aget_or_build, conditional
+from .facets import parse_spec_filters
+from .history import InvalidCursor, apage_price_history
+from .models import Item, LatestPrice, PriceHistory
+from .tagging import parse_tag_names
+from .views import (
+    LISTING_NAMESPACES, _archived_price_history, _filter_price_history, _last_purchase_payload, _listing_builder,
+    _listing_key, _parse_item_ids, _price_history_limit, _search_key,
+)
+
+
+@conditional('item_listing', _search_key, LISTING_NAMESPACES)
+async def ajax_search_items(request):
+    current_search_query = request.GET.get('q', '')
+    selected_tag_names = parse_tag_names(request.GET.get('tags', ''))
+    spec_filters = parse_spec_filters(request.GET)
+
+    # Cache hits never leave the event loop; a miss renders in a thread.
+    listing = await aget_or_build(
+        'item_listing', _listing_key(current_search_query, selected_tag_names, spec_filters), LISTING_NAMESPACES,
+        _listing_builder(request, current_search_query, selected_tag_names, spec_filters),
+    )
+    return HttpResponse(listing['html'])
+
+
+async def ajax_get_last_purchase_details(request, item_id):
+    last_purchase = await LatestPrice.objects.alast_for_item(item_id)
+
+    data_to_return = {'store_id': None, 'product_url': None}
+
+    if last_purchase:
+        data_to_return['store_id'] = last_purchase.store_id
+        if last_purchase.product_url:
+            data_to_return['product_url'] = last_purchase.product_url
+    elif not await Item.objects.filter(pk=item_id).aexists():
+        raise Http404("No Item matches the given query.")
+
+    return JsonResponse(data_to_return)
+
+
+@require_GET
+async def ajax_get_last_purchase_details_batch(request):
+    try:
+        item_ids = _parse_item_ids(request.GET.get('ids', ''))
+    except ValueError:
+        return JsonResponse(
+            {'error': f"ids must be 1 to {views.LAST_PURCHASE_BATCH_MAX} comma-separated item ids."}, status=400,
+        )
+    latest = {row['item_id']: row async for row in LatestPrice.objects.last_for_items_query(item_ids)}
+    return JsonResponse({'results': {item_id: _last_purchase_payload(latest.get(item_id)) for item_id in item_ids}})
+
+
+@require_GET
+async def api_price_history(request, item_id):
+    if not await Item.objects.filter(pk=item_id).aexists():
+        raise Http404("No Item matches the given query.")
+
+    try:
+        entries = _filter_price_history(request, PriceHistory.objects.filter(item_id=item_id))
+    except ValueError:
+        return JsonResponse({'error': "Invalid store, since or until parameter."}, status=400)
+
+    if request.GET.get('resolution'):
+        # Downsampling is one aggregate query plus currency conversion; the
+        # synchronous view already does exactly that.
+        return await sync_to_async(views.api_price_history)(request, item_id)
+
+    try:
+        # Listing the archive tables is a catalog query; the rows stream below.
+        archived = await sync_to_async(_archived_price_history)(request, item_id)
+        rows, next_cursor = await apage_price_history(
+            entries, request.GET.get('cursor'), _price_history_limit(request), archived=archived,
+        )
+    except InvalidCursor:
+        return JsonResponse({'error': "Invalid cursor."}, status=400)
+    return JsonResponse({
+        'item_id': item_id,
+        'results': rows,
+        'next_cursor': next_cursor,
+    })
@@ -0,0 +1,350 @@
+# PriceTracker/catalog/benchmark.py
+import asyncio
+import datetime
+import platform
+import random
+import subprocess
+import threading
+import time
+from contextlib import ExitStack
+from itertools import islice
+
+import django
+import httpx
+import numpy as np
+from django.conf import settings
+from django.core.cache import cache
+from django.db import connection, connections, router, transaction
+from django.db.models import Count
+from django.test import Client
+from django.test.utils import CaptureQueriesContext, override_settings
+from django.urls import reverse
+
+from .analytics import item_price_stats
+from .export import export_rows
+from .facets import spec_facets
+from .history import downsample_price_history
+from .models import Item, LatestPrice, PriceHistory, Store, Tag
+from .search import search_items
+from .tagging import ItemTag, filter_items_by_tags
+from .unitprice import best_value
+
+
+async def _run_load(base_url, paths, concurrency, total, timeout):
+    latencies = []
+    errors = 0
+    queue = asyncio.Queue()
+    for n in range(total):
+        queue.put_nowait(paths[n % len(paths)])
+
+    async def worker(client):
+        nonlocal errors
+        while True:
+            try:
+                path = queue.get_nowait()
+            except asyncio.QueueEmpty:
+                return
+            started = time.perf_counter()
+            try:
+                response = await client.get(path)
+                if response.status_code >= 400:
+                    errors += 1
+            except httpx.HTTPError:
+                errors += 1
+            latencies.append(time.perf_counter() - started)
+
+    limits = httpx.Limits(max_connections=concurrency, max_keepalive_connections=concurrency)
+    async with httpx.AsyncClient(base_url=base_url, limits=limits, timeout=timeout) as client:
+        started = time.perf_counter()
+        await asyncio.gather(*(worker(client) for _ in range(concurrency)))
+        elapsed = time.perf_counter() - started
+    return summarize(latencies, elapsed, errors)
+
+
+def run_load(base_url, paths, concurrency=50, total=2000, timeout=30.0):
+    """Sends ``total`` GETs cycling through ``paths`` with ``concurrency`` in flight.
+
+    Returns requests/s and latency percentiles (milliseconds).
+    """
+    return asyncio.run(_run_load(base_url, list(paths), concurrency, total, timeout))
+
+
+def summarize(latencies, elapsed, errors=0):
+    timings = np.asarray(latencies, dtype=np.float64) * 1000
+    if not len(timings):
+        return {'requests': 0, 'errors': errors, 'seconds': elapsed, 'rps': 0.0}
+    p50, p90, p99 = np.percentile(timings, [50, 90, 99])
+    return {
+        'requests': len(timings),
+        'errors': errors,
+        'seconds': round(elapsed, 3),
+        'rps': round(len(timings) / elapsed, 1) if elapsed else 0.0,
+        'mean_ms': round(float(timings.mean()), 2),
+        'p50_ms': round(float(p50), 2),
+        'p90_ms': round(float(p90), 2),
+        'p99_ms': round(float(p99), 2),
+        'max_ms': round(float(timings.max()), 2),
+    }
+
+
+def wait_until_up(base_url, path='/', timeout=30.0):
+    """Polls a freshly started server until it answers, or raises TimeoutError."""
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            httpx.get(base_url + path, timeout=1.0)
+            return
+        except httpx.HTTPError:
+            time.sleep(0.2)
+    raise TimeoutError(f"{base_url} did not come up within {timeout:.0f}s")
+
+
+# Requests are made in-process; run_suite() allows this host for the run.
+BENCHMARK_HOST = 'benchmark.localhost'
+
+
+class BenchmarkError(Exception):
+    pass
+
+
+def time_call(func, repeat=5, warmup=1, before=None):
+    """Runs ``func`` ``warmup`` times untimed, then ``repeat`` times timed.
+
+    ``before`` runs ahead of every call outside the timing (e.g. clearing
+    the cache for a cold run). Returns milliseconds and queries per call.
+    """
+    for _ in range(warmup):
+        if before:
+            before()
+        func()
+    timings, queries = [], []
+    for _ in range(repeat):
+        if before:
+            before()
+        with ExitStack() as stack:
+            # Reads and writes may go to different aliases.
+            aliases = {router.db_for_read(Item), router.db_for_write(Item)}
+            captured = [stack.enter_context(CaptureQueriesContext(connections[alias])) for alias in aliases]
+            started = time.perf_counter()
+            func()
+            timings.append((time.perf_counter() - started) * 1000)
+        queries.append(sum(len(context) for context in captured))
+    timings = np.asarray(timings)
+    return {
+        'runs': repeat,
+        'min_ms': round(float(timings.min()), 3),
+        'median_ms': round(float(np.median(timings)), 3),
+        'p90_ms': round(float(np.percentile(timings, 90)), 3),
+        'max_ms': round(float(timings.max()), 3),
+        'queries': int(np.median(queries)),
+    }
+
+
+def _targets():
+    """The item, tag, store and search term the cases run against, chosen
+    the same way on every run of the same data."""
+    item_id = LatestPrice.objects.order_by('item_id').values_list('item_id', flat=True).first()
+    if item_id is None:
+        raise BenchmarkError("No priced items; run seed_synthetic first.")
+    item = Item.objects.get(pk=item_id)
+    busiest = ItemTag.objects.values('tag_id').annotate(count=Count('id')).order_by('-count', 'tag_id').first()
+    tag = Tag.objects.get(pk=busiest['tag_id']) if busiest else None
+    store_id = LatestPrice.objects.filter(item_id=item_id).order_by('store_id').values_list('store_id', flat=True)[0]
+    page = list(Item.objects.order_by('id').values_list('id', flat=True)[:100])
+    return {
+        'item': item, 'tag': tag.name if tag else '', 'store': Store.objects.get(pk=store_id),
+        'term': item.name.split()[0], 'page': page,
+    }
+
+
+def _client():
+    return Client(HTTP_HOST=BENCHMARK_HOST)
+
+
+def _get(client, url, params=None):
+    def call():
+        response = client.get(url, params or {})
+        if response.status_code >= 400:
+            raise BenchmarkError(f"GET {url} answered {response.status_code}")
+        if response.streaming:
+            b''.join(response.streaming_content)
+    return call
+
+
+def _add_price(client, item, store):
+    url = reverse('catalog:add_price_entry', kwargs={'item_id': item.pk})
+    data = {'store': store.pk, 'price': '999.00', 'date_recorded': datetime.date.today().isoformat()}
+
+    def call():
+        # The entry and everything it triggers are rolled back, so repeated
+        # runs measure the same database.
+        with transaction.atomic():
+            response = client.post(url, data)
+            transaction.set_rollback(True)
+        if response.status_code != 302:
+            raise BenchmarkError(f"POST {url} answered {response.status_code}")
+    return call
+
+
+def benchmark_cases():
+    """{name: (callable, cold)}; cold cases clear the cache before every run."""
+    targets = _targets()
+    client = _client()
+    item, tag = targets['item'], targets['tag']
+    tagged = lambda: filter_items_by_tags(Item.objects.all(), [tag] if tag else [])
+    detail_url = reverse('catalog:item_detail', kwargs={'item_id': item.pk})
+    cases = {}
+    for view, url, params in (
+        ('item_list', reverse('catalog:item_list'), None),
+        ('item_list_tag', reverse('catalog:item_list'), {'tags': tag}),
+        ('ajax_search_items', reverse('catalog:ajax_search_items'), {'q': targets['term']}),
+        ('item_detail', detail_url, None),
+    ):
+        cases[f'view:{view}:cold'] = (_get(client, url, params), True)
+        cases[f'view:{view}:warm'] = (_get(client, url, params), False)
+    cases['view:add_price_entry'] = (_add_price(client, item, targets['store']), True)
+    cases.update({
+        'orm:latest_prices_for_item': (
+            lambda: list(LatestPrice.objects.filter(item_id=item.pk).select_related('store')), False,
+        ),
+        'orm:search_items': (lambda: list(search_items(Item.objects.all(), targets['term'])), False),
+        'orm:filter_by_tag_first_100': (lambda: list(tagged().order_by('name')[:100]), False),
+        'orm:spec_facets_for_tag': (lambda: spec_facets(tagged()), False),
+        'orm:item_price_stats': (lambda: item_price_stats(item.pk), False),
+        'orm:downsample_by_day': (
+            lambda: downsample_price_history(PriceHistory.objects.filter(item_id=item.pk), 'day'), False,
+        ),
+        'orm:last_for_items_page': (lambda: LatestPrice.objects.last_for_items(targets['page']), False),
+        'orm:best_value_kg': (lambda: best_value(tag, 'kg'), False),
+        'orm:export_10k_rows': (lambda: sum(1 for _ in islice(export_rows(), 10_000)), False),
+    })
+    return cases
+
+
+def _environment():
+    try:
+        commit = subprocess.run(
+            ['git', 'rev-parse', 'HEAD'], cwd=settings.BASE_DIR, capture_output=True, text=True, timeout=10,
+        ).stdout.strip() or None
+    except (OSError, subprocess.SubprocessError):
+        commit = None
+    return {
+        'timestamp': datetime.datetime.now(datetime.timezone.utc).isoformat(timespec='seconds'),
+        'commit': commit,
+        'python': platform.python_version(),
+        'django': django.get_version(),
+        'database': connection.vendor,
+        'rows': {
+            'items': Item.objects.count(),
+            'stores': Store.objects.count(),
+            'tags': Tag.objects.count(),
+            'price_history': PriceHistory.objects.count(),
+        },
+    }
+
+
+def run_suite(repeat=5, warmup=1, only=None):
+    """Times every benchmark case (or those whose name contains one of ``only``)."""
+    results = {}
+    with override_settings(ALLOWED_HOSTS=[*settings.ALLOWED_HOSTS, BENCHMARK_HOST]):
+        for name, (func, cold) in benchmark_cases().items():
+            if only and not any(part in name for part in only):
+                continue
+            results[name] = time_call(func, repeat=repeat, warmup=warmup, before=cache.clear if cold else None)
+    return {'environment': _environment(), 'repeat': repeat, 'results': results}
+
+
+def compare(baseline, current):
+    """Median time of each case shared by two runs, with current/baseline ratio."""
+    rows = {}
+    for name, result in current['results'].items():
+        before = baseline.get('results', {}).get(name)
+        if before:
+            rows[name] = {
+                'baseline_ms': before['median_ms'],
+                'current_ms': result['median_ms'],
+                'ratio': round(result['median_ms'] / before['median_ms'], 3) if before['median_ms'] else None,
+            }
+    return rows
+
+
+def ingestion_stress(write_batch, read, batches=20, readers=4):
+    """Calls ``write_batch(n)`` for each of ``batches`` on this thread while
+    ``readers`` threads call ``read()`` in a loop until the writer is done.
+
+    Returns the write time and a summary() of the reads made meanwhile; a
+    read that raised (e.g. "database is locked") counts as an error.
+    """
+    done = threading.Event()
+    lock = threading.Lock()
+    latencies = []
+    errors = 0
+
+    def reader():
+        nonlocal errors
+        try:
+            while not done.is_set():
+                started = time.perf_counter()
+                try:
+                    read()
+                except Exception:
+                    with lock:
+                        errors += 1
+                    continue
+                elapsed = time.perf_counter() - started
+                with lock:
+                    latencies.append(elapsed)
+        finally:
+            connections.close_all()
+
+    threads = [threading.Thread(target=reader, daemon=True) for _ in range(readers)]
+    for thread in threads:
+        thread.start()
+    started = time.perf_counter()
+    try:
+        for n in range(batches):
+            write_batch(n)
+    finally:
+        elapsed = time.perf_counter() - started
+        done.set()
+        for thread in threads:
+            thread.join()
+    return {'batches': batches, 'write_seconds': round(elapsed, 3), 'reads': summarize(latencies, elapsed, errors)}
+
+
+def run_ingestion_stress(batches=20, batch_size=2000, readers=4):
+    """ingestion_stress() against the configured database, through the ORM.
+
+    Each batch inserts ``batch_size`` price rows and folds them into
+    LatestPrice in one write transaction, the way PriceIngestor.write()
+    does, then rolls back, so the database is left as it was. The readers
+    run the listing and detail queries through the read alias.
+    """
+    pairs = list(LatestPrice.objects.order_by('item_id', 'store_id').values_list('item_id', 'store_id')[:1000])
+    if not pairs:
+        raise BenchmarkError("No priced items; run seed_synthetic first.")
+    item_ids = sorted({item_id for item_id, _ in pairs})
+    now = datetime.datetime.now(datetime.timezone.utc)
+    write_alias = router.db_for_write(PriceHistory)
+
+    def write_batch(n):
+        entries = [
+            PriceHistory(item_id=item_id, store_id=store_id, price=1000 + n, date_recorded=now)
+            for item_id, store_id in random.choices(pairs, k=batch_size)
+        ]
+        with transaction.atomic(using=write_alias):
+            LatestPrice.objects.record_many(PriceHistory.objects.bulk_create(entries))
+            transaction.set_rollback(True, using=write_alias)
+
+    def read():
+        page = random.sample(item_ids, min(50, len(item_ids)))
+        list(Item.objects.order_by('name')[:50])
+        list(LatestPrice.objects.filter(item_id=page[0]).select_related('store'))
+        LatestPrice.objects.last_for_items(page)
+
+    report = ingestion_stress(write_batch, read, batches=batches, readers=readers)
+    report.update({
+        'batch_size': batch_size, 'readers': readers,
+        'write_alias': write_alias, 'read_alias': router.db_for_read(Item),
+    })
+    return report
@@ -0,0 +1,197 @@
+# PriceTracker/catalog/cache.py
+import hashlib
+import threading
+import time
+from collections import Counter
+from functools import wraps
+from inspect import iscoroutinefunction
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+from django.utils.cache import get_conditional_response, patch_cache_control
+from django.utils.http import http_date, quote_etag
+
+from .routers import read_from_writer
+
+VERSION_KEY = 'catalog:version:{}'
+
+_stats_lock = threading.Lock()
+_hits = Counter()
+_misses = Counter()
+
+
+def item_namespace(item_id):
+    return f'item:{item_id}'
+
+
+def get_versions(namespaces):
+    """Current generation stamp of each namespace, creating missing ones.
+
+    Stamps are nanosecond timestamps rather than counters starting at 1, so
+    a stamp lost to eviction or a cache restart is never handed out again
+    and old entries can't come back to life.
+    """
+    keys = [VERSION_KEY.format(namespace) for namespace in namespaces]
+    versions = cache.get_many(keys)
+    for key in keys:
+        if key not in versions:
+            cache.add(key, time.time_ns(), timeout=None)
+            versions[key] = cache.get(key)
+    return [versions[key] for key in keys]
+
+
+def bump(*namespaces):
+    """Invalidates everything cached under the given namespaces."""
+    if not namespaces:
+        return
+    keys = [VERSION_KEY.format(namespace) for namespace in set(namespaces)]
+    current = cache.get_many(keys)
+    now = time.time_ns()
+    cache.set_many({key: max(now, current.get(key, 0) + 1) for key in keys}, timeout=None)
+
+
+def invalidate(*namespaces, using=None):
+    """Bumps ``namespaces`` now and again when the current transaction commits.
+
+    The second bump drops anything another request rebuilt from the old,
+    still committed data while the transaction was open.
+    """
+    bump(*namespaces)
+    transaction.on_commit(lambda: bump(*namespaces), using=using)
+
+
+def make_key(name, key_parts, namespaces):
+    digest = hashlib.md5(repr(key_parts).encode(), usedforsecurity=False).hexdigest()
+    stamps = '.'.join(str(version) for version in get_versions(namespaces))
+    return f'catalog:{name}:{digest}:{stamps}'
+
+
+def get_or_build(name, key_parts, namespaces, builder, timeout=None):
+    """Returns the cached value for ``name``/``key_parts`` or builds and stores it.
+
+    The key embeds the stamps of ``namespaces``; bumping any of them makes
+    every entry built under the old stamp unreachable. ``builder`` reads
+    from the default database, not the replica: a lagging replica would
+    have its pre-write answer cached under the post-write stamp.
+    """
+    key = make_key(name, key_parts, namespaces)
+    value = cache.get(key)
+    if value is not None:
+        _record(_hits, name)
+        return value
+    _record(_misses, name)
+    with read_from_writer():
+        value = builder()
+    if timeout is None:
+        timeout = getattr(settings, 'CATALOG_CACHE_TIMEOUT', 600)
+    cache.set(key, value, timeout)
+    return value
+
+
+async def aget_versions(namespaces):
+    keys = [VERSION_KEY.format(namespace) for namespace in namespaces]
+    versions = await cache.aget_many(keys)
+    for key in keys:
+        if key not in versions:
+            await cache.aadd(key, time.time_ns(), timeout=None)
+            versions[key] = await cache.aget(key)
+    return [versions[key] for key in keys]
+
+
+async def aget_or_build(name, key_parts, namespaces, builder, timeout=None):
+    """Async get_or_build(): the lookup doesn't block the event loop, and on a
+    miss the synchronous ``builder`` runs in a worker thread (reading from
+    the default database, as in get_or_build())."""
+    digest = hashlib.md5(repr(key_parts).encode(), usedforsecurity=False).hexdigest()
+    stamps = '.'.join(str(version) for version in await aget_versions(namespaces))
+    key = f'catalog:{name}:{digest}:{stamps}'
+    value = await cache.aget(key)
+    if value is not None:
+        _record(_hits, name)
+        return value
+    _record(_misses, name)
+    with read_from_writer():
+        # sync_to_async() copies the context, so the routing flag goes along.
+        value = await sync_to_async(builder)()
+    if timeout is None:
+        timeout = getattr(settings, 'CATALOG_CACHE_TIMEOUT', 600)
+    await cache.aset(key, value, timeout)
+    return value
+
+
+def validators(name, key_parts, versions):
+    """(ETag, Last-Modified timestamp) of what get_or_build() caches for these stamps.
+
+    Stamps are bump times in nanoseconds, so the newest one is when the
+    content last changed.
+    """
+    digest = hashlib.md5(repr((name, key_parts, list(versions))).encode(), usedforsecurity=False).hexdigest()
+    return quote_etag(digest), max(versions) // 1_000_000_000
+
+
+def _with_validators(response, etag, last_modified):
+    if response.status_code in (200, 304):
+        response.headers.setdefault('ETag', etag)
+        response.headers.setdefault('Last-Modified', http_date(last_modified))
+        # Revalidate on every use; the check is a single cache read.
+        patch_cache_control(response, no_cache=True)
+    return response
+
+
+def conditional(name, key_func, namespaces):
+    """View decorator answering conditional GETs from the namespace stamps.
+
+    ``key_func(request, *args, **kwargs)`` returns the key parts the view
+    caches its page under with get_or_build(name, ...); ``namespaces`` is a
+    tuple, or a function of the same arguments returning one. When the
+    client's If-None-Match / If-Modified-Since still match, the response is
+    a 304 built without touching the database or rendering anything.
+    """
+    def resolve(request, args, kwargs):
+        return key_func(request, *args, **kwargs), (
+            namespaces(request, *args, **kwargs) if callable(namespaces) else namespaces
+        )
+
+    def decorator(view):
+        if iscoroutinefunction(view):
+            async def wrapper(request, *args, **kwargs):
+                if request.method not in ('GET', 'HEAD'):
+                    return await view(request, *args, **kwargs)
+                key_parts, view_namespaces = resolve(request, args, kwargs)
+                etag, last_modified = validators(name, key_parts, await aget_versions(view_namespaces))
+                response = get_conditional_response(request, etag=etag, last_modified=last_modified)
+                if response is None:
+                    response = await view(request, *args, **kwargs)
+                return _with_validators(response, etag, last_modified)
+        else:
+            def wrapper(request, *args, **kwargs):
+                if request.method not in ('GET', 'HEAD'):
+                    return view(request, *args, **kwargs)
+                key_parts, view_namespaces = resolve(request, args, kwargs)
+                etag, last_modified = validators(name, key_parts, get_versions(view_namespaces))
+                response = get_conditional_response(request, etag=etag, last_modified=last_modified)
+                if response is None:
+                    response = view(request, *args, **kwargs)
+                return _with_validators(response, etag, last_modified)
+        return wraps(view)(wrapper)
+    return decorator
+
+
+def _record(counter, name):
+    with _stats_lock:
+        counter[name] += 1
+
+
+def cache_stats():
+    """Hit/miss counts per cached fragment name for this process."""
+    with _stats_lock:
+        names = set(_hits) | set(_misses)
+        return {name: {'hits': _hits[name], 'misses': _misses[name]} for name in sorted(names)}
+
+
+def reset_cache_stats():
+    with _stats_lock:
+        _hits.clear()
+        _misses.clear()
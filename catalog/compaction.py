@@ -0,0 +1,81 @@
+# PriceTracker/catalog/compaction.py
+import time
+
+from django.db import router, transaction
+from django.db.models import Q
+
+from .cache import invalidate, item_namespace
+from .models import LatestPrice, PriceHistory
+
+DELETE_BATCH_SIZE = 500
+
+
+class CompactionStats:
+    def __init__(self):
+        self.pairs = 0
+        self.rows_scanned = 0
+        self.rows_removed = 0
+
+
+def _pair_chunks(chunk_size):
+    """Yields lists of (item_id, store_id), walking LatestPrice by keyset."""
+    last = None
+    while True:
+        pairs = LatestPrice.objects.order_by('item_id', 'store_id')
+        if last is not None:
+            pairs = pairs.filter(Q(item_id__gt=last[0]) | Q(item_id=last[0], store_id__gt=last[1]))
+        chunk = list(pairs.values_list('item_id', 'store_id')[:chunk_size])
+        if not chunk:
+            return
+        yield chunk
+        last = chunk[-1]
+
+
+def compact_pairs(pairs, stats):
+    """Folds same-day runs of identical rows for the given pairs into one row each."""
+    wanted = set(pairs)
+    rows = PriceHistory.objects.filter(
+        item_id__in={item_id for item_id, _ in wanted},
+        store_id__in={store_id for _, store_id in wanted},
+    ).order_by('item_id', 'store_id', 'date_recorded', 'id')
+
+    heads, doomed = {}, []
+    head = None
+    for row in rows.iterator(chunk_size=2000):
+        if (row.item_id, row.store_id) not in wanted:
+            continue
+        stats.rows_scanned += 1
+        same_pair = head is not None and (head.item_id, head.store_id) == (row.item_id, row.store_id)
+        if same_pair and head.can_absorb(row):
+            head.absorb(row)
+            heads[head.pk] = head
+            doomed.append(row.pk)
+        else:
+            head = row
+
+    if heads:
+        PriceHistory.objects.bulk_update(heads.values(), ['last_seen', 'observation_count'], batch_size=DELETE_BATCH_SIZE)
+    for start in range(0, len(doomed), DELETE_BATCH_SIZE):
+        PriceHistory.objects.filter(pk__in=doomed[start:start + DELETE_BATCH_SIZE]).delete()
+    stats.rows_removed += len(doomed)
+
+
+def compact_price_history(chunk_size=50, pause=0.0, progress=None):
+    """Rewrites the whole history into run-length form, ``chunk_size`` pairs per transaction.
+
+    Each chunk commits on its own, so writers are only blocked for the
+    duration of one chunk; ``pause`` seconds are slept between chunks.
+    """
+    stats = CompactionStats()
+    using = router.db_for_write(PriceHistory)
+    for pairs in _pair_chunks(chunk_size):
+        with transaction.atomic(using=using), LatestPrice.objects.deferred_refresh():
+            compact_pairs(pairs, stats)
+            # Merged rows are rewritten with bulk_update, which sends no signals.
+            invalidate('items', *(item_namespace(item_id) for item_id, _ in pairs))
+        stats.pairs += len(pairs)
+        if progress:
+            progress(stats)
+        if pause:
+            time.sleep(pause)
+    return stats
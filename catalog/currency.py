@@ -0,0 +1,166 @@
+# PriceTracker/catalog/currency.py
+import datetime
+import threading
+from bisect import bisect_right
+from decimal import Decimal, InvalidOperation
+
+import numpy as np
+from django.conf import settings
+from django.db import router, transaction
+from django.utils import timezone
+from django.utils.dateparse import parse_date
+
+from .cache import get_versions, invalidate
+from .models import ExchangeRate
+
+RATES_NAMESPACE = 'exchange_rates'
+MONEY_PLACES = Decimal('0.01')
+
+
+class MissingRate(LookupError):
+    pass
+
+
+def base_currency():
+    return getattr(settings, 'CATALOG_BASE_CURRENCY', 'HUF')
+
+
+def display_currency():
+    return getattr(settings, 'CATALOG_DISPLAY_CURRENCY', None) or base_currency()
+
+
+def _as_day(value):
+    if value is None:
+        return timezone.localdate()
+    if isinstance(value, datetime.datetime):
+        return timezone.localdate(value) if timezone.is_aware(value) else value.date()
+    return value
+
+
+class RateCache:
+    """Every exchange rate in memory, as per-currency lists sorted by date.
+
+    A lookup bisects the currency's dates and uses the newest rate on or
+    before the requested day (the oldest rate for days before it). Array
+    conversions do the same with np.searchsorted, so converting a whole
+    price series costs one pass per currency, not one query per row.
+    """
+    def __init__(self, rows, base):
+        self.base = base
+        self.dates = {}
+        self.rates = {}
+        for currency, rate_date, rate in rows:
+            self.dates.setdefault(currency, []).append(rate_date)
+            self.rates.setdefault(currency, []).append(rate)
+        self._ordinals = {
+            currency: np.array([day.toordinal() for day in dates], dtype=np.int64)
+            for currency, dates in self.dates.items()
+        }
+        self._factors = {
+            currency: np.array(rates, dtype=np.float64) for currency, rates in self.rates.items()
+        }
+
+    @classmethod
+    def load(cls):
+        rows = ExchangeRate.objects.order_by('currency', 'rate_date').values_list('currency', 'rate_date', 'rate')
+        return cls(rows, base_currency())
+
+    @property
+    def currencies(self):
+        return sorted({self.base, *self.dates})
+
+    def rate(self, currency, day=None):
+        """Base-currency units per one unit of ``currency`` on ``day``."""
+        if currency == self.base:
+            return Decimal(1)
+        dates = self.dates.get(currency)
+        if not dates:
+            raise MissingRate(currency)
+        index = max(bisect_right(dates, _as_day(day)) - 1, 0)
+        return self.rates[currency][index]
+
+    def convert(self, amount, from_currency, to_currency, day=None):
+        if amount is None or from_currency == to_currency:
+            return amount
+        converted = Decimal(amount) * self.rate(from_currency, day) / self.rate(to_currency, day)
+        return converted.quantize(MONEY_PLACES)
+
+    def _rates_on(self, currency, ordinals):
+        if currency == self.base:
+            return np.ones(len(ordinals))
+        if currency not in self._ordinals:
+            return np.full(len(ordinals), np.nan)
+        index = np.searchsorted(self._ordinals[currency], ordinals, side='right') - 1
+        return self._factors[currency][np.maximum(index, 0)]
+
+    def convert_array(self, amounts, currencies, ordinals, to_currency):
+        """Converts parallel arrays of amounts, currency codes and day ordinals.
+
+        Amounts whose currency has no rate come back as NaN.
+        """
+        amounts = np.asarray(amounts, dtype=np.float64)
+        currencies = np.asarray(currencies)
+        ordinals = np.asarray(ordinals, dtype=np.int64)
+        factors = np.full(len(amounts), np.nan)
+        for currency in np.unique(currencies):
+            rows = currencies == currency
+            factors[rows] = self._rates_on(str(currency), ordinals[rows])
+        return amounts * factors / self._rates_on(to_currency, ordinals)
+
+
+_loaded = threading.local()
+
+
+def get_rate_cache():
+    """This thread's RateCache, reloaded whenever the exchange rates change."""
+    version = get_versions([RATES_NAMESPACE])[0]
+    if getattr(_loaded, 'version', None) != version:
+        _loaded.rates = RateCache.load()
+        _loaded.version = version
+    return _loaded.rates
+
+
+def parse_rate_row(row):
+    """Returns an unsaved ExchangeRate from a ``date``/``currency``/``rate`` row, or raises ValueError."""
+    try:
+        rate_date = parse_date(str(row.get('date') or row.get('rate_date') or '').strip())
+        currency = str(row.get('currency') or '').strip().upper()
+        rate = Decimal(str(row.get('rate')).strip())
+    except (AttributeError, InvalidOperation) as exc:
+        raise ValueError(f"Invalid exchange rate row: {row!r}") from exc
+    if rate_date is None or len(currency) != 3 or not rate > 0:
+        raise ValueError(f"Invalid exchange rate row: {row!r}")
+    return ExchangeRate(currency=currency, rate_date=rate_date, rate=rate)
+
+
+def load_rates(rows, batch_size=1000):
+    """Upserts exchange rates; returns the number of rows written."""
+    rates = {}
+    for row in rows:
+        rate = parse_rate_row(row)
+        rates[(rate.currency, rate.rate_date)] = rate
+    with transaction.atomic(using=router.db_for_write(ExchangeRate)):
+        ExchangeRate.objects.bulk_create(
+            rates.values(), batch_size=batch_size, update_conflicts=True,
+            unique_fields=['currency', 'rate_date'], update_fields=['rate'],
+        )
+        invalidate(RATES_NAMESPACE, 'items')
+    return len(rates)
+
+
+def best_offer(latest_prices, rates, currency):
+    """The cheapest of an item's LatestPrice rows compared in ``currency`` at today's rates.
+
+    Returns (latest price, amount in ``currency`` or None if no rate is known).
+    Prices in currencies without a rate rank after every converted one.
+    """
+    best = None
+    for latest in latest_prices:
+        try:
+            amount = rates.convert(latest.price, latest.currency, currency)
+        except MissingRate:
+            amount = None
+        rank = (amount is None, amount if amount is not None else latest.price)
+        if best is None or rank < best[0]:
+            best = (rank, latest, amount)
+    return (best[1], best[2]) if best else (None, None)
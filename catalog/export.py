@@ -0,0 +1,146 @@
+# PriceTracker/catalog/export.py
+import csv
+import zlib
+from itertools import chain, islice
+
+from django.core.serializers.json import DjangoJSONEncoder
+
+from .archive import archived_entries
+from .models import Item, PriceHistory, Store
+
+EXPORT_FORMATS = ('csv', 'ndjson')
+EXPORT_COLUMNS = (
+    ('id', 'id'),
+    ('item_id', 'item_id'),
+    ('item', 'item__name'),
+    ('store_id', 'store_id'),
+    ('store', 'store__name'),
+    ('price', 'price'),
+    ('currency', 'currency'),
+    ('date_recorded', 'date_recorded'),
+    ('last_seen', 'last_seen'),
+    ('observation_count', 'observation_count'),
+    ('on_sale', 'on_sale'),
+    ('pre_sale_price', 'pre_sale_price'),
+    ('product_url', 'product_url'),
+)
+DEFAULT_CHUNK_SIZE = 2000
+# Rows are joined into pieces of about this many characters before they are
+# written or compressed, instead of one tiny write per row.
+WRITE_SIZE = 64 * 1024
+
+
+def _archived_rows(item, store, since, until, chunk_size):
+    """Archived rows in EXPORT_COLUMNS order, oldest month first.
+
+    The archive tables have no foreign keys, so item and store names are
+    looked up per chunk. Rows whose id is still hot (an interrupted archive
+    batch) are left to the hot export.
+    """
+    columns = [name for name, _ in EXPORT_COLUMNS]
+    stored = [name for name in columns if name not in ('item', 'store')]
+    for _, entries in reversed(archived_entries(item_id=item, store_id=store, since=since, until=until)):
+        if since is not None:
+            entries = entries.filter(date_recorded__gte=since)
+        if until is not None:
+            entries = entries.filter(date_recorded__lt=until)
+        rows = entries.order_by('id').values_list(*stored).iterator(chunk_size=chunk_size)
+        while batch := [dict(zip(stored, row)) for row in islice(rows, chunk_size)]:
+            hot = set(PriceHistory.objects.filter(pk__in=[row['id'] for row in batch]).values_list('pk', flat=True))
+            item_names = dict(Item.objects.filter(pk__in={row['item_id'] for row in batch}).values_list('pk', 'name'))
+            store_names = dict(Store.objects.filter(pk__in={row['store_id'] for row in batch}).values_list('pk', 'name'))
+            for row in batch:
+                if row['id'] in hot:
+                    continue
+                row['item'], row['store'] = item_names.get(row['item_id']), store_names.get(row['store_id'])
+                yield tuple(row[name] for name in columns)
+
+
+def export_rows(item=None, store=None, since=None, until=None, chunk_size=DEFAULT_CHUNK_SIZE):
+    """Price history as plain tuples in EXPORT_COLUMNS order.
+
+    Archived months (catalog.archive) come first, oldest month first, then
+    the hot table. Within each table rows are in id (insertion) order, which
+    follows date_recorded except for backdated imports; ordering by id keeps
+    the export a plain primary-key scan with no sort.
+    ``values_list(...).iterator()`` fetches ``chunk_size`` rows at a time
+    (a server-side cursor where the database has them) and builds no model
+    instances, so memory stays flat however many rows there are.
+    """
+    entries = PriceHistory.objects.all()
+    if item is not None:
+        entries = entries.filter(item_id=item)
+    if store is not None:
+        entries = entries.filter(store_id=store)
+    if since is not None:
+        entries = entries.filter(date_recorded__gte=since)
+    if until is not None:
+        entries = entries.filter(date_recorded__lt=until)
+    fields = [field for _, field in EXPORT_COLUMNS]
+    return chain(
+        _archived_rows(item, store, since, until, chunk_size),
+        entries.order_by('id').values_list(*fields).iterator(chunk_size=chunk_size),
+    )
+
+
+class _Echo:
+    """File-like object whose write() hands the line back to csv.writer's caller."""
+    def write(self, value):
+        return value
+
+
+def _csv_value(value):
+    if value is None:
+        return ''
+    if hasattr(value, 'isoformat'):
+        return value.isoformat()
+    return value
+
+
+def csv_lines(rows):
+    writer = csv.writer(_Echo())
+    yield writer.writerow([name for name, _ in EXPORT_COLUMNS])
+    for row in rows:
+        yield writer.writerow([_csv_value(value) for value in row])
+
+
+def ndjson_lines(rows):
+    names = [name for name, _ in EXPORT_COLUMNS]
+    encoder = DjangoJSONEncoder(separators=(',', ':'))
+    for row in rows:
+        yield encoder.encode(dict(zip(names, row))) + '\n'
+
+
+def _joined(lines, size=WRITE_SIZE):
+    buffer, length = [], 0
+    for line in lines:
+        buffer.append(line)
+        length += len(line)
+        if length >= size:
+            yield ''.join(buffer)
+            buffer, length = [], 0
+    if buffer:
+        yield ''.join(buffer)
+
+
+def gzip_chunks(chunks, level=6):
+    """Compresses a stream of byte strings into one gzip member, incrementally."""
+    compressor = zlib.compressobj(level, zlib.DEFLATED, zlib.MAX_WBITS | 16)
+    for chunk in chunks:
+        compressed = compressor.compress(chunk)
+        if compressed:
+            yield compressed
+    yield compressor.flush()
+
+
+def export_chunks(rows, fmt='csv', compress=False):
+    """Encoded (and optionally gzipped) pieces of the export, ready to write or stream."""
+    if fmt not in EXPORT_FORMATS:
+        raise ValueError(f"Unknown export format: {fmt}")
+    lines = csv_lines(rows) if fmt == 'csv' else ndjson_lines(rows)
+    chunks = (text.encode('utf-8') for text in _joined(lines))
+    return gzip_chunks(chunks) if compress else chunks
+
+
+def export_filename(fmt, compress=False):
+    return f"price-history.{fmt}{'.gz' if compress else ''}"
@@ -0,0 +1,144 @@
+# PriceTracker/catalog/facets.py
+from collections import namedtuple
+from decimal import Decimal, InvalidOperation
+
+from django.db.models import Case, Count, F, IntegerField, Max, Min, QuerySet, Value, When
+from django.db.models.functions import Cast, Floor, Least
+
+from .models import AttributeDefinition, ItemSpecification
+
+SPEC_PREFIX = 'spec.'
+NUMERIC_LOOKUPS = ('exact', 'lt', 'lte', 'gt', 'gte')
+HISTOGRAM_BINS = 10
+
+SpecFilter = namedtuple('SpecFilter', 'slug lookup value')
+
+
+def parse_spec_filters(params):
+    """Collects ``spec.<slug>[__<lookup>]=<value>`` parameters, in a stable order."""
+    filters = []
+    for key in sorted(params):
+        if not key.startswith(SPEC_PREFIX):
+            continue
+        slug, _, lookup = key[len(SPEC_PREFIX):].partition('__')
+        value = params.get(key, '').strip()
+        if slug and value:
+            filters.append(SpecFilter(slug, lookup or 'exact', value))
+    return filters
+
+
+def _spec_condition(attribute, spec_filter):
+    """ItemSpecification lookups for one filter, or None if the value doesn't parse."""
+    if attribute.value_type == 'number':
+        if spec_filter.lookup not in NUMERIC_LOOKUPS:
+            return None
+        try:
+            value = Decimal(spec_filter.value)
+        except InvalidOperation:
+            return None
+        return {f'value_numeric__{spec_filter.lookup}': value}
+    if spec_filter.lookup != 'exact':
+        return None
+    if attribute.value_type == 'boolean':
+        text = spec_filter.value.lower()
+        if text in ('true', 'yes', '1', 'on'):
+            return {'value_boolean': True}
+        if text in ('false', 'no', '0', 'off'):
+            return {'value_boolean': False}
+        return None
+    return {'value_text__iexact': spec_filter.value}
+
+
+def filter_items_by_specs(queryset, spec_filters):
+    """Narrows an Item queryset to items matching every specification filter.
+
+    Each filter becomes an ``id IN (...)`` subquery over one attribute, which
+    is a range scan on the (attribute, value_numeric) or (attribute,
+    value_boolean) index. Unknown attributes and unusable values match
+    nothing, the same way an unknown tag does.
+    """
+    if not spec_filters:
+        return queryset
+    attributes = AttributeDefinition.objects.order_by().in_bulk(
+        {spec_filter.slug for spec_filter in spec_filters}, field_name='slug'
+    )
+    for spec_filter in spec_filters:
+        attribute = attributes.get(spec_filter.slug)
+        condition = attribute and _spec_condition(attribute, spec_filter)
+        if not condition:
+            return queryset.none()
+        matching = ItemSpecification.objects.filter(attribute_id=attribute.pk, **condition).values('item_id')
+        queryset = queryset.filter(pk__in=matching)
+    return queryset
+
+
+def _specifications_of(items):
+    if isinstance(items, QuerySet):
+        return ItemSpecification.objects.filter(item_id__in=items.values('pk'))
+    return ItemSpecification.objects.filter(item_id__in=[item.pk for item in items])
+
+
+def spec_facets(items, bins=HISTOGRAM_BINS):
+    """Ranges and histograms of the numeric attributes, and value counts of the
+    boolean ones, found among ``items``; keyed by attribute slug.
+
+    Three aggregate queries, however many attributes there are: ranges per
+    numeric attribute, then one GROUP BY (attribute, bucket) whose bucket
+    expression is a CASE over those ranges, then the boolean counts.
+    """
+    specifications = _specifications_of(items)
+    ranges = sorted(
+        specifications.filter(attribute__value_type='number', value_numeric__isnull=False)
+        .values('attribute_id', 'attribute__slug', 'attribute__name', 'attribute__unit')
+        .annotate(low=Min('value_numeric'), high=Max('value_numeric'), count=Count('item_id'))
+        .order_by(),
+        key=lambda row: row['attribute__slug'],
+    )
+    facets = {}
+    buckets = []
+    for row in ranges:
+        low, high = float(row['low']), float(row['high'])
+        width = (high - low) / bins if high > low else 1.0
+        facets[row['attribute__slug']] = {
+            'type': 'number',
+            'name': row['attribute__name'],
+            'unit': row['attribute__unit'] or '',
+            'min': low,
+            'max': high,
+            'count': row['count'],
+            'histogram': [
+                {'lower': low + width * n, 'upper': low + width * (n + 1), 'count': 0}
+                for n in range(bins if high > low else 1)
+            ],
+        }
+        offset = (F('value_numeric') - Value(row['low'])) / Value(Decimal(repr(width)))
+        bucket = Least(
+            Cast(Floor(offset), IntegerField()),
+            Value(len(facets[row['attribute__slug']]['histogram']) - 1),
+        )
+        buckets.append(When(attribute_id=row['attribute_id'], then=bucket))
+
+    if buckets:
+        slugs = {row['attribute_id']: row['attribute__slug'] for row in ranges}
+        counts = (
+            specifications.filter(attribute_id__in=slugs, value_numeric__isnull=False)
+            .annotate(bucket=Case(*buckets, output_field=IntegerField()))
+            .values('attribute_id', 'bucket')
+            .annotate(count=Count('item_id'))
+            .order_by()
+        )
+        for row in counts:
+            facets[slugs[row['attribute_id']]]['histogram'][row['bucket']]['count'] = row['count']
+
+    booleans = (
+        specifications.filter(attribute__value_type='boolean', value_boolean__isnull=False)
+        .values('attribute__slug', 'attribute__name', 'value_boolean')
+        .annotate(count=Count('item_id'))
+        .order_by()
+    )
+    for row in booleans:
+        facet = facets.setdefault(row['attribute__slug'], {
+            'type': 'boolean', 'name': row['attribute__name'], 'true': 0, 'false': 0,
+        })
+        facet['true' if row['value_boolean'] else 'false'] = row['count']
+    return facets
@@ -1,7 +1,26 @@
 # PriceTracker/catalog/forms.py
 from django import forms
-from .models import Store, PriceHistory, Item
+from .models import Store, PriceHistory, Item, LatestPrice
 from django.utils import timezone
+from .cache import get_or_build
+
+def sale_price_error(price, on_sale, pre_sale_price):
+    """Checks the sale/original price pair; returns an error message or None.
+
+    Shared by PriceHistoryForm and the bulk importer so both accept the same rows.
+    """
+    if on_sale:
+        if pre_sale_price is None:
+            return "Original price is required when 'Is this a sale price?' is checked."
+        if price is not None and pre_sale_price <= price:
+            return "Original price must be greater than the sale price."
+    return None
+
+def cached_store_choices():
+    return get_or_build(
+        'store_choices', (), ('stores',),
+        lambda: list(Store.objects.order_by('name').values_list('id', 'name')),
+    )
 
 class PriceHistoryForm(forms.ModelForm):
     date_recorded = forms.DateField(
@@ -46,12 +65,17 @@ class PriceHistoryForm(forms.ModelForm):
         self.item_instance = kwargs.pop('item_instance', None)
         super().__init__(*args, **kwargs)
 
+        # Rendering the dropdown reads the cached choices; the queryset is
+        # still what validates a submitted store.
+        store_field = self.fields['store']
+        store_field.widget.choices = [('', store_field.empty_label)] + cached_store_choices()
+
         if self.item_instance:
-            last_purchase = PriceHistory.objects.filter(item=self.item_instance).order_by('-date_recorded').first()
-            if last_purchase and last_purchase.store:
-                self.fields['store'].initial = last_purchase.store
-            if last_purchase.product_url and self.fields['store'].initial == last_purchase.store:
-                self.fields['product_url'].initial = last_purchase.product_url        
+            last_purchase = LatestPrice.objects.last_for_item(self.item_instance.pk)
+            if last_purchase:
+                self.fields['store'].initial = last_purchase.store_id
+                if last_purchase.product_url:
+                    self.fields['product_url'].initial = last_purchase.product_url
 
     def clean(self):
         cleaned_data = super().clean()
@@ -59,11 +83,9 @@ class PriceHistoryForm(forms.ModelForm):
         pre_sale_price = cleaned_data.get("pre_sale_price")
         price = cleaned_data.get("price")
 
-        if on_sale:
-            if pre_sale_price is None:
-                self.add_error('pre_sale_price', "Original price is required when 'Is this a sale price?' is checked.")
-            elif price is not None and pre_sale_price <= price:
-                self.add_error('pre_sale_price', "Original price must be greater than the sale price.")
+        error = sale_price_error(price, on_sale, pre_sale_price)
+        if error:
+            self.add_error('pre_sale_price', error)
         elif not on_sale and pre_sale_price is not None:
             cleaned_data['pre_sale_price'] = None
 
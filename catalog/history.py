@@ -0,0 +1,234 @@
+# PriceTracker/catalog/history.py
+import base64
+import binascii
+from datetime import datetime, time, timedelta
+from decimal import Decimal
+
+from asgiref.sync import sync_to_async
+from django.db.models import F, Max, Min, Q, Sum, Window
+from django.db.models.functions import RowNumber, Trunc
+from django.utils import timezone
+from django.utils.dateparse import parse_date, parse_datetime
+
+from .currency import get_rate_cache
+from .models import Store
+
+RESOLUTIONS = ('day', 'week', 'month')
+
+ENTRY_FIELDS = (
+    'id', 'store_id', 'store__name', 'price', 'currency', 'date_recorded',
+    'on_sale', 'pre_sale_price', 'product_url', 'last_seen', 'observation_count',
+)
+# Archive tables have no store relation; names are looked up per page.
+ARCHIVED_ENTRY_FIELDS = tuple(field for field in ENTRY_FIELDS if field != 'store__name')
+
+
+def _money(value):
+    # Window aggregates come back from SQLite as floats without the
+    # field's decimal places.
+    return Decimal(str(value)).quantize(Decimal('0.01'))
+
+
+def parse_datetime_param(value):
+    """Accepts an ISO date or datetime; naive values are taken as current timezone."""
+    parsed = parse_datetime(value)
+    if parsed is None:
+        parsed_date = parse_date(value)
+        if parsed_date is None:
+            raise ValueError(value)
+        parsed = datetime.combine(parsed_date, time.min)
+    if timezone.is_naive(parsed):
+        parsed = timezone.make_aware(parsed)
+    return parsed
+
+
+class InvalidCursor(ValueError):
+    pass
+
+
+def encode_cursor(date_recorded, entry_id):
+    raw = f"{date_recorded.isoformat()}|{entry_id}".encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip('=')
+
+
+def decode_cursor(cursor):
+    try:
+        raw = base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4)).decode()
+        date_part, id_part = raw.split('|')
+        return datetime.fromisoformat(date_part), int(id_part)
+    except (binascii.Error, UnicodeDecodeError, ValueError) as exc:
+        raise InvalidCursor(cursor) from exc
+
+
+def page_price_history(entries, cursor=None, limit=100, archived=()):
+    """One page of raw history, newest first, keyed on (date_recorded, id).
+
+    Each page is an index range scan on (item, -date_recorded, -id), so
+    deep pages cost the same as the first one. ``archived`` is
+    catalog.archive.archived_entries() output; its tables are merged in,
+    newest month first, only as far as the page reaches. Returns
+    (rows, next_cursor).
+    """
+    rows = list(_page_query(entries, cursor, limit))
+    if archived:
+        rows = _merge_archived(rows, archived, cursor, limit)
+    return _finish_page(rows, limit)
+
+
+async def apage_price_history(entries, cursor=None, limit=100, archived=()):
+    """page_price_history() for async views."""
+    rows = [row async for row in _page_query(entries, cursor, limit)]
+    if archived:
+        rows = await sync_to_async(_merge_archived)(rows, archived, cursor, limit)
+    return _finish_page(rows, limit)
+
+
+def _page_query(entries, cursor, limit, fields=ENTRY_FIELDS):
+    entries = entries.order_by('-date_recorded', '-id')
+    if cursor:
+        date_recorded, entry_id = decode_cursor(cursor)
+        entries = entries.filter(
+            Q(date_recorded__lt=date_recorded) | Q(date_recorded=date_recorded, id__lt=entry_id)
+        )
+    return entries.values(*fields)[:limit + 1]
+
+
+def _newest_first(rows):
+    rows.sort(key=lambda row: (row['date_recorded'], row['id']), reverse=True)
+    return rows
+
+
+def _merge_archived(rows, archived, cursor, limit):
+    seen = {row['id'] for row in rows}
+    for month_end, entries in archived:
+        if len(rows) > limit and _newest_first(rows)[limit]['date_recorded'] >= month_end:
+            # This table and every older one only hold rows past the page.
+            break
+        for row in _page_query(entries, cursor, limit, fields=ARCHIVED_ENTRY_FIELDS):
+            # A row can briefly be in both tiers while it is being archived.
+            if row['id'] not in seen:
+                seen.add(row['id'])
+                rows.append(row)
+    rows = _newest_first(rows)[:limit + 1]
+    missing = {row['store_id'] for row in rows if 'store__name' not in row}
+    if missing:
+        names = dict(Store.objects.filter(pk__in=missing).values_list('id', 'name'))
+        for row in rows:
+            row.setdefault('store__name', names.get(row['store_id']))
+    return rows
+
+
+def _finish_page(rows, limit):
+    next_cursor = None
+    if len(rows) > limit:
+        rows = rows[:limit]
+        next_cursor = encode_cursor(rows[-1]['date_recorded'], rows[-1]['id'])
+    for row in rows:
+        row['store'] = row.pop('store__name')
+    return rows, next_cursor
+
+
+def _bucket_start(day, resolution):
+    """The start of the Trunc() bucket holding the local date ``day``."""
+    if resolution == 'week':
+        day -= timedelta(days=day.weekday())
+    elif resolution == 'month':
+        day = day.replace(day=1)
+    return timezone.make_aware(datetime.combine(day, time.min))
+
+
+def _add_to_bucket(buckets, key, store, low, high, price_sum, observations, last, last_at):
+    bucket = buckets.get(key)
+    if bucket is None:
+        buckets[key] = {
+            'store': store, 'min': low, 'max': high, 'sum': price_sum, 'count': observations,
+            'last': last, 'last_at': last_at,
+        }
+        return
+    bucket['min'] = min(bucket['min'], low)
+    bucket['max'] = max(bucket['max'], high)
+    bucket['sum'] += price_sum
+    bucket['count'] += observations
+    if last_at >= bucket['last_at']:
+        bucket['last'], bucket['last_at'] = last, last_at
+
+
+def downsample_price_history(entries, resolution, currency=None, rollups=None):
+    """Min/max/avg/last price per (bucket, store, currency), oldest bucket first.
+
+    Computed in a single windowed query, so no raw rows leave the database.
+    ``rollups`` is a PriceRollup queryset of archived days to merge in; they
+    fill day buckets exactly and are summed into weeks and months. With
+    ``currency`` each bucket's prices are converted at the rate of the
+    bucket's first day, and a store's buckets in different currencies are
+    merged into one per (bucket, store); raises MissingRate if a rate is
+    unknown.
+    """
+    if resolution not in RESOLUTIONS:
+        raise ValueError(f"Unknown resolution: {resolution}")
+    bucket = Trunc('date_recorded', resolution)
+    partition = [bucket, F('store_id'), F('currency')]
+    newest_first = [F('date_recorded').desc(), F('id').desc()]
+    rows = (
+        entries.order_by()
+        .annotate(
+            bucket=bucket,
+            row_number=Window(RowNumber(), partition_by=partition, order_by=newest_first),
+            min_price=Window(Min('price'), partition_by=partition),
+            max_price=Window(Max('price'), partition_by=partition),
+            # Run-length rows count once per observation they stand for.
+            price_sum=Window(Sum(F('price') * F('observation_count')), partition_by=partition),
+            observations=Window(Sum('observation_count'), partition_by=partition),
+        )
+        # The first row of each partition is the newest one, so its own
+        # price is the bucket's closing price.
+        .filter(row_number=1)
+        .order_by('bucket', 'store_id', 'currency')
+        .values(
+            'bucket', 'store_id', 'store__name', 'currency', 'min_price', 'max_price',
+            'price_sum', 'observations', 'price', 'date_recorded',
+        )
+    )
+    buckets = {}
+    for row in rows:
+        _add_to_bucket(
+            buckets, (row['bucket'], row['store_id'], row['currency']), row['store__name'],
+            _money(row['min_price']), _money(row['max_price']), Decimal(str(row['price_sum'])),
+            row['observations'], row['price'], row['date_recorded'],
+        )
+    if rollups is not None:
+        for rollup in rollups.order_by().values(
+            'day', 'store_id', 'store__name', 'currency', 'min_price', 'max_price', 'price_sum',
+            'observations', 'last_price', 'last_recorded',
+        ):
+            _add_to_bucket(
+                buckets, (_bucket_start(rollup['day'], resolution), rollup['store_id'], rollup['currency']),
+                rollup['store__name'], rollup['min_price'], rollup['max_price'], rollup['price_sum'],
+                rollup['observations'], rollup['last_price'], rollup['last_recorded'],
+            )
+    if currency:
+        rates = get_rate_cache()
+        converted = {}
+        for (start, store_id, bucket_currency), bucket in sorted(buckets.items(), key=lambda pair: pair[0]):
+            low, high, price_sum, last = (
+                rates.convert(bucket[key], bucket_currency, currency, start) for key in ('min', 'max', 'sum', 'last')
+            )
+            _add_to_bucket(
+                converted, (start, store_id, currency), bucket['store'],
+                low, high, price_sum, bucket['count'], last, bucket['last_at'],
+            )
+        buckets = converted
+    return [
+        {
+            'bucket': start,
+            'store_id': store_id,
+            'store': bucket['store'],
+            'currency': bucket_currency,
+            'min': bucket['min'],
+            'max': bucket['max'],
+            'avg': _money(bucket['sum'] / bucket['count']),
+            'last': bucket['last'],
+            'count': bucket['count'],
+        }
+        for (start, store_id, bucket_currency), bucket in sorted(buckets.items(), key=lambda pair: pair[0])
+    ]
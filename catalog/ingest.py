@@ -0,0 +1,316 @@
+# PriceTracker/catalog/ingest.py
+import csv
+import json
+import time
+from datetime import datetime
+from itertools import islice
+
+from django.core.exceptions import ValidationError
+from django.db import router, transaction
+from django.utils import timezone
+from django.utils.dateparse import parse_date, parse_datetime
+
+from .alerts import evaluate_entries
+from .cache import invalidate, item_namespace
+from .forms import sale_price_error
+from .unitprice import schedule_refresh
+from .models import Item, LatestPrice, PriceHistory, Store
+
+TRUE_VALUES = {'true', 'yes', '1', 'on'}
+FALSE_VALUES = {'false', 'no', '0', 'off', ''}
+
+DEFAULT_BATCH_SIZE = 1000
+
+
+class LookupCache:
+    """Resolves item/store references to ids, remembering every answer.
+
+    A reference is either an id (int or digit string) or the object's name.
+    Unknown references are resolved a whole batch at a time, so each batch
+    costs at most two queries per model no matter how many rows it has.
+    """
+    def __init__(self, model):
+        self.model = model
+        self.by_id = {}
+        self.by_name = {}
+
+    @staticmethod
+    def _as_id(reference):
+        if isinstance(reference, int):
+            return reference
+        if isinstance(reference, str) and reference.strip().isdigit():
+            return int(reference)
+        return None
+
+    def prime(self, references):
+        ids, names = set(), set()
+        for reference in references:
+            if reference in (None, ''):
+                continue
+            ref_id = self._as_id(reference)
+            if ref_id is not None:
+                if ref_id not in self.by_id:
+                    ids.add(ref_id)
+            elif str(reference).strip() not in self.by_name:
+                names.add(str(reference).strip())
+        if ids:
+            found = set(self.model.objects.filter(pk__in=ids).values_list('pk', flat=True))
+            self.by_id.update({ref_id: ref_id if ref_id in found else None for ref_id in ids})
+        if names:
+            matches = {}
+            for pk, name in self.model.objects.filter(name__in=names).values_list('pk', 'name'):
+                matches.setdefault(name, []).append(pk)
+            for name in names:
+                self.by_name[name] = matches.get(name, [])
+
+    def resolve(self, reference):
+        """Returns (id, error message)."""
+        label = self.model._meta.verbose_name
+        if reference in (None, ''):
+            return None, "This field is required."
+        ref_id = self._as_id(reference)
+        if ref_id is not None:
+            if self.by_id.get(ref_id) is None:
+                return None, f"Unknown {label} id {ref_id}."
+            return ref_id, None
+        candidates = self.by_name.get(str(reference).strip(), [])
+        if not candidates:
+            return None, f"Unknown {label} '{reference}'."
+        if len(candidates) > 1:
+            return None, f"{label.capitalize()} name '{reference}' is ambiguous; use its id."
+        return candidates[0], None
+
+
+class IngestReport:
+    def __init__(self):
+        self.received = 0
+        self.created = 0
+        self.merged = 0
+        self.errors = []
+        self.elapsed = 0.0
+
+    @property
+    def rows_per_second(self):
+        return self.received / self.elapsed if self.elapsed else 0.0
+
+    def as_dict(self, max_errors=None):
+        reported = self.errors if max_errors is None else self.errors[:max_errors]
+        return {
+            'received': self.received,
+            'created': self.created,
+            'merged': self.merged,
+            'rejected': len(self.errors),
+            'elapsed_seconds': round(self.elapsed, 3),
+            'rows_per_second': round(self.rows_per_second, 1),
+            'errors': [{'row': row, 'errors': errors} for row, errors in reported],
+        }
+
+
+def _parse_bool(value):
+    if isinstance(value, bool):
+        return value
+    if value is None:
+        return False
+    text = str(value).strip().lower()
+    if text in TRUE_VALUES:
+        return True
+    if text in FALSE_VALUES:
+        return False
+    raise ValidationError(f"'{value}' is not a valid boolean.")
+
+
+def _parse_date_recorded(value):
+    if value in (None, ''):
+        return timezone.now()
+    if isinstance(value, datetime):
+        parsed = value
+    else:
+        try:
+            # Well-formed but impossible dates ('2024-02-30') raise ValueError.
+            parsed = parse_datetime(str(value).strip())
+            day = parse_date(str(value).strip()) if parsed is None else None
+        except ValueError:
+            raise ValidationError(f"'{value}' is not a valid date.")
+        if parsed is None:
+            if day is None:
+                raise ValidationError(f"'{value}' is not a valid date.")
+            parsed = datetime.combine(day, datetime.min.time())
+    if timezone.is_naive(parsed):
+        parsed = timezone.make_aware(parsed)
+    return parsed
+
+
+class PriceIngestor:
+    """Validates price rows and writes them with bulk_create, a batch per transaction.
+
+    Rows are dicts with ``item`` and ``store`` (id or name; ``item_id``,
+    ``item_name``, ``store_id`` and ``store_name`` are accepted too),
+    ``price``, and optionally ``currency``, ``date_recorded``, ``on_sale``,
+    ``pre_sale_price`` and ``product_url``. Invalid rows are reported and
+    skipped; the rest of the batch is still written.
+
+    With ``changes_only`` a row that repeats the newest stored row of its
+    item/store on the same day extends that row's run (``last_seen``,
+    ``observation_count``) instead of adding a new one.
+    """
+    def __init__(self, batch_size=DEFAULT_BATCH_SIZE, changes_only=False):
+        self.batch_size = batch_size
+        self.changes_only = changes_only
+        self.merged = 0
+        self.items = LookupCache(Item)
+        self.stores = LookupCache(Store)
+        self.fields = {name: PriceHistory._meta.get_field(name) for name in (
+            'price', 'currency', 'pre_sale_price', 'product_url',
+        )}
+
+    @staticmethod
+    def _reference(row, name):
+        for key in (name, f'{name}_id', f'{name}_name'):
+            if row.get(key) not in (None, ''):
+                return row[key]
+        return None
+
+    def _clean_field(self, name, value, errors):
+        if value == '':
+            value = None
+        try:
+            return self.fields[name].clean(value, None)
+        except ValidationError as exc:
+            errors[name] = exc.messages
+            return None
+
+    def build_entry(self, row):
+        """Returns (unsaved PriceHistory, None) or (None, {field: [messages]})."""
+        if not isinstance(row, dict):
+            return None, {'__all__': ["Row must be a JSON object with named fields."]}
+        errors = {}
+        item_id, error = self.items.resolve(self._reference(row, 'item'))
+        if error:
+            errors['item'] = [error]
+        store_id, error = self.stores.resolve(self._reference(row, 'store'))
+        if error:
+            errors['store'] = [error]
+
+        price = self._clean_field('price', row.get('price'), errors)
+        currency = self._clean_field('currency', row.get('currency') or 'HUF', errors)
+        pre_sale_price = self._clean_field('pre_sale_price', row.get('pre_sale_price'), errors)
+        product_url = self._clean_field('product_url', row.get('product_url'), errors)
+        try:
+            on_sale = _parse_bool(row.get('on_sale'))
+        except ValidationError as exc:
+            errors['on_sale'] = exc.messages
+            on_sale = False
+        try:
+            date_recorded = _parse_date_recorded(row.get('date_recorded'))
+        except ValidationError as exc:
+            errors['date_recorded'] = exc.messages
+            date_recorded = None
+
+        if 'price' not in errors and 'pre_sale_price' not in errors:
+            error = sale_price_error(price, on_sale, pre_sale_price)
+            if error:
+                errors['pre_sale_price'] = [error]
+        if errors:
+            return None, errors
+        if not on_sale:
+            pre_sale_price = None
+        return PriceHistory(
+            item_id=item_id, store_id=store_id, price=price, currency=currency,
+            date_recorded=date_recorded, on_sale=on_sale, pre_sale_price=pre_sale_price,
+            product_url=product_url or None,
+        ), None
+
+    def write(self, entries):
+        """Inserts already validated entries and folds them into LatestPrice."""
+        with transaction.atomic(using=router.db_for_write(PriceHistory)):
+            extended = []
+            if self.changes_only:
+                entries, extended = self._fold_repeats(entries)
+                if extended:
+                    PriceHistory.objects.bulk_update(extended, ['last_seen', 'observation_count'])
+            created = PriceHistory.objects.bulk_create(entries)
+            LatestPrice.objects.record_many(created)
+            # bulk_create and bulk_update send no signals.
+            item_ids = {entry.item_id for entry in created} | {entry.item_id for entry in extended}
+            invalidate('items', *(item_namespace(item_id) for item_id in item_ids))
+            evaluate_entries(created)
+            schedule_refresh(item_ids)
+        return created
+
+    def _fold_repeats(self, entries):
+        """Splits entries into rows to insert and stored tails they extend."""
+        pairs = {(entry.item_id, entry.store_id) for entry in entries}
+        newest_ids = LatestPrice.objects.filter(
+            item_id__in={item_id for item_id, _ in pairs},
+            store_id__in={store_id for _, store_id in pairs},
+        ).values('price_entry_id')
+        tails = {
+            (row.item_id, row.store_id): row
+            for row in PriceHistory.objects.filter(pk__in=newest_ids)
+            if (row.item_id, row.store_id) in pairs
+        }
+        to_insert, extended = [], {}
+        for entry in sorted(entries, key=lambda entry: entry.date_recorded):
+            pair = (entry.item_id, entry.store_id)
+            tail = tails.get(pair)
+            if tail is not None and tail.can_absorb(entry):
+                tail.absorb(entry)
+                self.merged += 1
+                if tail.pk is not None:
+                    extended[tail.pk] = tail
+                continue
+            to_insert.append(entry)
+            if tail is None or entry.date_recorded >= tail.seen_until:
+                tails[pair] = entry
+        return to_insert, list(extended.values())
+
+    def ingest(self, rows, report=None):
+        report = report or IngestReport()
+        merged_before = self.merged
+        started = time.perf_counter()
+        rows = iter(rows)
+        row_number = 0
+        while True:
+            batch = list(islice(rows, self.batch_size))
+            if not batch:
+                break
+            dict_rows = [row for row in batch if isinstance(row, dict)]
+            self.items.prime(self._reference(row, 'item') for row in dict_rows)
+            self.stores.prime(self._reference(row, 'store') for row in dict_rows)
+
+            entries = []
+            for row in batch:
+                row_number += 1
+                entry, errors = self.build_entry(row)
+                if errors:
+                    report.errors.append((row_number, errors))
+                else:
+                    entries.append(entry)
+            if entries:
+                report.created += len(self.write(entries))
+            report.received += len(batch)
+        report.elapsed += time.perf_counter() - started
+        report.merged += self.merged - merged_before
+        return report
+
+
+def read_ndjson(lines):
+    """Yields one row per non-blank line; undecodable lines come through as None."""
+    for line in lines:
+        if isinstance(line, bytes):
+            try:
+                line = line.decode('utf-8')
+            except UnicodeDecodeError:
+                yield None
+                continue
+        line = line.strip()
+        if not line:
+            continue
+        try:
+            yield json.loads(line)
+        except json.JSONDecodeError:
+            yield None
+
+
+def read_csv(lines):
+    yield from csv.DictReader(lines)
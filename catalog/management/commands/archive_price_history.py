@@ -0,0 +1,32 @@
+from django.core.management.base import BaseCommand
+
+from catalog.archive import DEFAULT_BATCH_SIZE, archive_after_days, archive_price_history
+
+
+class Command(BaseCommand):
+    help = "Moves old price history rows into per-month archive tables, keeping daily rollups."
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--after-days', type=int, default=None,
+            help="Archive rows older than this many days (default: CATALOG_ARCHIVE_AFTER_DAYS).",
+        )
+        parser.add_argument('--batch-size', type=int, default=DEFAULT_BATCH_SIZE, help="Rows per transaction.")
+        parser.add_argument('--pause', type=float, default=0.0, help="Seconds to sleep between batches.")
+        parser.add_argument('--limit', type=int, default=None, help="Stop after this many rows.")
+
+    def handle(self, *args, **options):
+        after_days = options['after_days'] if options['after_days'] is not None else archive_after_days()
+
+        def progress(stats):
+            if options['verbosity'] > 1:
+                self.stdout.write(f"{stats.batches} batches, {stats.rows_archived} rows archived")
+
+        stats = archive_price_history(
+            after_days=after_days, batch_size=options['batch_size'], pause=options['pause'],
+            limit=options['limit'], progress=progress,
+        )
+        self.stdout.write(self.style.SUCCESS(
+            f"Archived {stats.rows_archived} rows older than {after_days} days into "
+            f"{len(stats.months)} monthly tables ({stats.rollups_written} daily rollups updated)."
+        ))
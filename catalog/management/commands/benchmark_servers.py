@@ -0,0 +1,101 @@
+import importlib.util
+import json
+import os
+import subprocess
+import sys
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.urls import reverse
+
+from catalog.benchmark import run_load, wait_until_up
+from catalog.models import Item
+
+
+class Command(BaseCommand):
+    help = (
+        "Compares requests/s and latency of the catalog read endpoints under WSGI "
+        "(threaded runserver, sync views) and ASGI (uvicorn or daphne, async views)."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--concurrency', type=int, default=50, help="Requests in flight.")
+        parser.add_argument('--requests', type=int, default=2000, help="Requests per server.")
+        parser.add_argument('--warmup', type=int, default=100, help="Unmeasured requests sent first.")
+        parser.add_argument('--port', type=int, default=8701, help="First of two local ports to start servers on.")
+        parser.add_argument('--wsgi-url', help="Benchmark an already running WSGI server instead of starting one.")
+        parser.add_argument('--asgi-url', help="Benchmark an already running ASGI server instead of starting one.")
+        parser.add_argument('--path', action='append', dest='paths', help="Path to request (repeatable).")
+        parser.add_argument('--output', help="Also write the results as JSON to this file.")
+
+    def default_paths(self):
+        item_ids = list(Item.objects.order_by('id').values_list('id', flat=True)[:20])
+        if not item_ids:
+            raise CommandError("No items to request; load or seed some data first.")
+        paths = [reverse('catalog:ajax_search_items') + '?q=']
+        for item_id in item_ids:
+            paths.append(reverse('catalog:ajax_get_last_purchase_details', kwargs={'item_id': item_id}))
+            paths.append(reverse('catalog:api_price_history', kwargs={'item_id': item_id}) + '?limit=50')
+        return paths
+
+    def asgi_command(self, port):
+        app = 'PriceTracker.asgi:application'
+        if importlib.util.find_spec('uvicorn'):
+            return [sys.executable, '-m', 'uvicorn', app, '--port', str(port), '--log-level', 'warning']
+        if importlib.util.find_spec('daphne'):
+            return [sys.executable, '-m', 'daphne', '-p', str(port), app]
+        raise CommandError("No ASGI server found; install uvicorn (or daphne) or pass --asgi-url.")
+
+    def start(self, command, async_views):
+        env = dict(os.environ, CATALOG_ASYNC_VIEWS='1' if async_views else '0', PYTHONUNBUFFERED='1')
+        return subprocess.Popen(
+            command, cwd=settings.BASE_DIR, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL,
+        )
+
+    def measure(self, label, base_url, paths, options):
+        wait_until_up(base_url, paths[0])
+        if options['warmup']:
+            run_load(base_url, paths, options['concurrency'], options['warmup'])
+        result = run_load(base_url, paths, options['concurrency'], options['requests'])
+        self.stdout.write(
+            f"{label:5} {result['rps']:>9,.1f} req/s  p50 {result.get('p50_ms', 0):>8.1f} ms  "
+            f"p99 {result.get('p99_ms', 0):>8.1f} ms  errors {result['errors']}"
+        )
+        return result
+
+    def handle(self, *args, **options):
+        paths = options['paths'] or self.default_paths()
+        servers = {
+            'wsgi': (
+                options['wsgi_url'], False,
+                [sys.executable, os.path.join(settings.BASE_DIR, 'manage.py'), 'runserver', '--noreload',
+                 f"127.0.0.1:{options['port']}"],
+                options['port'],
+            ),
+            'asgi': (options['asgi_url'], True, None, options['port'] + 1),
+        }
+
+        results = {}
+        for label, (url, async_views, command, port) in servers.items():
+            process = None
+            if not url:
+                process = self.start(command or self.asgi_command(port), async_views)
+                url = f"http://127.0.0.1:{port}"
+            try:
+                results[label] = self.measure(label, url, paths, options)
+            except TimeoutError as exc:
+                raise CommandError(str(exc))
+            finally:
+                if process is not None:
+                    process.terminate()
+                    process.wait(timeout=10)
+
+        report = {
+            'concurrency': options['concurrency'],
+            'requests': options['requests'],
+            'paths': paths,
+            'results': results,
+        }
+        if options['output']:
+            with open(options['output'], 'w', encoding='utf-8') as handle:
+                json.dump(report, handle, indent=2)
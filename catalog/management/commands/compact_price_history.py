@@ -0,0 +1,24 @@
+from django.core.management.base import BaseCommand
+
+from catalog.compaction import compact_price_history
+
+
+class Command(BaseCommand):
+    help = "Merges repeated same-day prices of each item/store into run-length rows."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--chunk-size', type=int, default=50, help="Item/store pairs per transaction.")
+        parser.add_argument('--pause', type=float, default=0.0, help="Seconds to sleep between chunks.")
+
+    def handle(self, *args, **options):
+        def progress(stats):
+            if options['verbosity'] > 1:
+                self.stdout.write(f"{stats.pairs} pairs, {stats.rows_removed} of {stats.rows_scanned} rows merged")
+
+        stats = compact_price_history(
+            chunk_size=options['chunk_size'], pause=options['pause'], progress=progress,
+        )
+        self.stdout.write(self.style.SUCCESS(
+            f"Compacted {stats.pairs} item/store pairs: merged {stats.rows_removed} "
+            f"of {stats.rows_scanned} rows."
+        ))
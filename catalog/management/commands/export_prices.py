@@ -0,0 +1,47 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from catalog.export import DEFAULT_CHUNK_SIZE, EXPORT_FORMATS, export_chunks, export_rows
+from catalog.history import parse_datetime_param
+
+
+class Command(BaseCommand):
+    help = "Streams price history to a CSV or NDJSON file ('-' writes stdout) in constant memory."
+
+    def add_arguments(self, parser):
+        parser.add_argument('path', nargs='?', default='-', help="Output file, or '-' for stdout.")
+        parser.add_argument('--format', choices=EXPORT_FORMATS, default='csv', help="Output format.")
+        parser.add_argument('--gzip', action='store_true', help="Gzip the output.")
+        parser.add_argument('--item', type=int, help="Only this item's prices.")
+        parser.add_argument('--store', type=int, help="Only this store's prices.")
+        parser.add_argument('--since', help="Entries recorded on or after this ISO date/datetime.")
+        parser.add_argument('--until', help="Entries recorded before this ISO date/datetime.")
+        parser.add_argument('--chunk-size', type=int, default=DEFAULT_CHUNK_SIZE, help="Rows fetched per round trip.")
+
+    def handle(self, *args, **options):
+        try:
+            since = parse_datetime_param(options['since']) if options['since'] else None
+            until = parse_datetime_param(options['until']) if options['until'] else None
+        except ValueError as exc:
+            raise CommandError(f"Invalid date: {exc}")
+
+        rows = export_rows(
+            item=options['item'], store=options['store'], since=since, until=until,
+            chunk_size=options['chunk_size'],
+        )
+        chunks = export_chunks(rows, options['format'], options['gzip'])
+        path = options['path']
+        if path == '-':
+            output = getattr(self.stdout._out, 'buffer', None)
+            if output is None:
+                raise CommandError("stdout does not accept bytes; give an output path.")
+            for chunk in chunks:
+                output.write(chunk)
+            output.flush()
+            return
+        try:
+            with open(path, 'wb') as handle:
+                for chunk in chunks:
+                    handle.write(chunk)
+        except OSError as exc:
+            raise CommandError(f"Cannot write {path}: {exc}")
+        self.stderr.write(self.style.SUCCESS(f"Exported price history to {path}."))
@@ -0,0 +1,24 @@
+from django.core.management.base import BaseCommand
+
+from catalog.models import Item
+from catalog.thumbnails import backfill_thumbnails
+
+
+class Command(BaseCommand):
+    help = "Generates missing thumbnails for existing item images."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--force', action='store_true', help="Regenerate thumbnails that already exist.")
+        parser.add_argument('--workers', type=int, help="Worker processes (defaults to the CPU count).")
+
+    def handle(self, *args, **options):
+        images = (
+            Item.objects.exclude(image='').exclude(image__isnull=True)
+            .order_by('id').values_list('id', 'image').iterator()
+        )
+        processed, written, failures = backfill_thumbnails(images, force=options['force'], workers=options['workers'])
+        for name, exc in failures:
+            self.stderr.write(f"{name}: {exc}")
+        self.stdout.write(self.style.SUCCESS(
+            f"Wrote {written} thumbnails for {processed} images; {len(failures)} failed."
+        ))
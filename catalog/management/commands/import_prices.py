@@ -0,0 +1,54 @@
+import sys
+from pathlib import Path
+
+from django.core.management.base import BaseCommand, CommandError
+
+from catalog.ingest import DEFAULT_BATCH_SIZE, PriceIngestor, read_csv, read_ndjson
+
+
+class Command(BaseCommand):
+    help = "Imports price observations from a CSV or NDJSON file ('-' reads stdin)."
+
+    def add_arguments(self, parser):
+        parser.add_argument('path', help="File to import, or '-' for stdin.")
+        parser.add_argument(
+            '--format', choices=['csv', 'ndjson'],
+            help="Input format. Guessed from the file extension when omitted.",
+        )
+        parser.add_argument('--batch-size', type=int, default=DEFAULT_BATCH_SIZE, help="Rows per transaction.")
+        parser.add_argument(
+            '--changes-only', action='store_true',
+            help="Extend the previous row's run instead of inserting a price that hasn't changed.",
+        )
+        parser.add_argument('--max-errors', type=int, default=50, help="How many row errors to print.")
+
+    def handle(self, *args, **options):
+        path = options['path']
+        fmt = options['format']
+        if fmt is None:
+            if path == '-':
+                raise CommandError("--format is required when reading from stdin.")
+            fmt = 'csv' if Path(path).suffix.lower() == '.csv' else 'ndjson'
+        reader = read_csv if fmt == 'csv' else read_ndjson
+
+        ingestor = PriceIngestor(batch_size=options['batch_size'], changes_only=options['changes_only'])
+        if path == '-':
+            report = ingestor.ingest(reader(sys.stdin))
+        else:
+            try:
+                with open(path, newline='', encoding='utf-8') as handle:
+                    report = ingestor.ingest(reader(handle))
+            except OSError as exc:
+                raise CommandError(f"Cannot read {path}: {exc}")
+
+        for row_number, errors in report.errors[:options['max_errors']]:
+            details = '; '.join(f"{field}: {' '.join(messages)}" for field, messages in errors.items())
+            self.stderr.write(f"Row {row_number}: {details}")
+        if len(report.errors) > options['max_errors']:
+            self.stderr.write(f"... and {len(report.errors) - options['max_errors']} more rejected rows.")
+
+        self.stdout.write(self.style.SUCCESS(
+            f"Imported {report.created} of {report.received} rows in {report.elapsed:.2f}s "
+            f"({report.rows_per_second:,.0f} rows/s); {report.merged} merged into existing runs, "
+            f"{len(report.errors)} rejected."
+        ))
@@ -0,0 +1,44 @@
+import sys
+from pathlib import Path
+
+from django.core.management.base import BaseCommand, CommandError
+
+from catalog.currency import load_rates
+from catalog.ingest import read_csv, read_ndjson
+from catalog.models import ExchangeRate
+from catalog.unitprice import refresh_currency_unit_prices
+
+
+class Command(BaseCommand):
+    help = "Loads exchange rates (date, currency, rate) from a CSV or NDJSON file ('-' reads stdin)."
+
+    def add_arguments(self, parser):
+        parser.add_argument('path', help="File to load, or '-' for stdin.")
+        parser.add_argument(
+            '--format', choices=['csv', 'ndjson'],
+            help="Input format. Guessed from the file extension when omitted.",
+        )
+
+    def handle(self, *args, **options):
+        path = options['path']
+        fmt = options['format']
+        if fmt is None:
+            if path == '-':
+                raise CommandError("--format is required when reading from stdin.")
+            fmt = 'csv' if Path(path).suffix.lower() == '.csv' else 'ndjson'
+        reader = read_csv if fmt == 'csv' else read_ndjson
+
+        try:
+            if path == '-':
+                count = load_rates(row or {} for row in reader(sys.stdin))
+            else:
+                with open(path, newline='', encoding='utf-8') as handle:
+                    count = load_rates(row or {} for row in reader(handle))
+        except OSError as exc:
+            raise CommandError(f"Cannot read {path}: {exc}")
+        except ValueError as exc:
+            raise CommandError(str(exc))
+        # load_rates() writes in bulk, without the signal that refreshes these.
+        refresh_currency_unit_prices(ExchangeRate.objects.values_list('currency', flat=True).distinct())
+
+        self.stdout.write(self.style.SUCCESS(f"Loaded {count} exchange rates."))
@@ -0,0 +1,14 @@
+from django.core.management.base import BaseCommand
+
+from catalog.models import LatestPrice
+
+
+class Command(BaseCommand):
+    help = "Rebuilds the latest price per item/store table from the full price history."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=1000, help="Rows per INSERT batch.")
+
+    def handle(self, *args, **options):
+        count = LatestPrice.objects.rebuild(batch_size=options['batch_size'])
+        self.stdout.write(self.style.SUCCESS(f"Wrote {count} latest prices."))
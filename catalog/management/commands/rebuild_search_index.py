@@ -0,0 +1,16 @@
+from django.core.management.base import BaseCommand
+
+from catalog import search
+
+
+class Command(BaseCommand):
+    help = "Rebuilds the full-text search index over item names, descriptions and tags."
+
+    def handle(self, *args, **options):
+        if not search.is_available():
+            self.stdout.write(self.style.WARNING(
+                "Full-text search is only available on SQLite; nothing to rebuild."
+            ))
+            return
+        count = search.rebuild_index()
+        self.stdout.write(self.style.SUCCESS(f"Indexed {count} items."))
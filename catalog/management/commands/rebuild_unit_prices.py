@@ -0,0 +1,14 @@
+from django.core.management.base import BaseCommand
+
+from catalog.unitprice import REFRESH_BATCH_SIZE, rebuild_unit_prices
+
+
+class Command(BaseCommand):
+    help = "Recomputes the per-kg/per-litre price table from latest prices and item specifications."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=REFRESH_BATCH_SIZE, help="Items per refresh batch.")
+
+    def handle(self, *args, **options):
+        count = rebuild_unit_prices(batch_size=options['batch_size'])
+        self.stdout.write(self.style.SUCCESS(f"Wrote {count} unit prices."))
@@ -0,0 +1,41 @@
+from asgiref.sync import async_to_sync
+from django.core.management.base import BaseCommand
+
+from catalog.scraper import PriceRefresher, load_targets
+
+
+class Command(BaseCommand):
+    help = "Re-fetches the product URLs of the latest prices and records the prices found."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--store', type=int, action='append', dest='stores', help="Only refresh this store id (repeatable).")
+        parser.add_argument('--limit', type=int, help="Refresh at most this many URLs, least recently priced first.")
+        parser.add_argument('--concurrency', type=int, default=50, help="Requests in flight overall.")
+        parser.add_argument('--per-host', type=int, default=4, help="Requests in flight per host.")
+        parser.add_argument('--per-host-rate', type=float, default=5.0, help="Request starts per second per host (0 = unlimited).")
+        parser.add_argument('--timeout', type=float, default=10.0, help="Per-request timeout in seconds.")
+        parser.add_argument('--batch-size', type=int, default=500, help="Rows buffered before each database write.")
+        parser.add_argument(
+            '--changes-only', action='store_true',
+            help="Extend the previous row's run when a price hasn't changed instead of inserting it.",
+        )
+
+    def handle(self, *args, **options):
+        targets = load_targets(store_ids=options['stores'], limit=options['limit'])
+        if not targets:
+            self.stdout.write("No product URLs to refresh.")
+            return
+        refresher = PriceRefresher(
+            concurrency=options['concurrency'],
+            per_host=options['per_host'],
+            per_host_rate=options['per_host_rate'],
+            timeout=options['timeout'],
+            batch_size=options['batch_size'],
+            changes_only=options['changes_only'],
+        )
+        stats = async_to_sync(refresher.run)(targets)
+        self.stdout.write(self.style.SUCCESS(
+            f"Checked {len(targets)} URLs in {stats.elapsed:.1f}s ({stats.urls_per_minute:,.0f}/min): "
+            f"{stats.recorded} prices recorded, {stats.not_modified} not modified, "
+            f"{stats.unparsed} without a price, {stats.failed} failed."
+        ))
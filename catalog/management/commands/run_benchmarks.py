@@ -0,0 +1,40 @@
+import json
+
+from django.core.management.base import BaseCommand, CommandError
+
+from catalog.benchmark import BenchmarkError, compare, run_suite
+
+
+class Command(BaseCommand):
+    help = "Times the key catalog views and queries against the current database and reports JSON."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--repeat', type=int, default=5, help="Timed runs per case.")
+        parser.add_argument('--warmup', type=int, default=1, help="Untimed runs per case first.")
+        parser.add_argument('--only', action='append', help="Run only cases whose name contains this (repeatable).")
+        parser.add_argument('--output', help="Write the results as JSON to this file.")
+        parser.add_argument('--compare', help="Earlier results file to compare median times against.")
+
+    def handle(self, *args, **options):
+        try:
+            report = run_suite(repeat=options['repeat'], warmup=options['warmup'], only=options['only'])
+        except BenchmarkError as exc:
+            raise CommandError(str(exc))
+
+        for name, result in report['results'].items():
+            self.stdout.write(
+                f"{name:40} median {result['median_ms']:>10.2f} ms  p90 {result['p90_ms']:>10.2f} ms  "
+                f"{result['queries']:>4} queries"
+            )
+        if options['compare']:
+            try:
+                with open(options['compare'], encoding='utf-8') as handle:
+                    baseline = json.load(handle)
+            except (OSError, ValueError) as exc:
+                raise CommandError(f"Cannot read {options['compare']}: {exc}")
+            report['comparison'] = compare(baseline, report)
+            for name, row in report['comparison'].items():
+                self.stdout.write(f"{name:40} {row['baseline_ms']:>10.2f} -> {row['current_ms']:>10.2f} ms  x{row['ratio']}")
+        if options['output']:
+            with open(options['output'], 'w', encoding='utf-8') as handle:
+                json.dump(report, handle, indent=2)
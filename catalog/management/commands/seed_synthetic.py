@@ -0,0 +1,45 @@
+import datetime
+import json
+
+from django.core.management.base import BaseCommand, CommandError
+
+from catalog.synthetic import SyntheticCatalog
+
+
+class Command(BaseCommand):
+    help = "Fills the database with a deterministic synthetic catalog for benchmarks."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--items', type=int, default=1000)
+        parser.add_argument('--tags', type=int, default=50)
+        parser.add_argument('--stores', type=int, default=20)
+        parser.add_argument('--prices', type=int, default=100_000, help="PriceHistory rows in total.")
+        parser.add_argument('--attributes', type=int, default=20, help="Attribute definitions in the spec matrix.")
+        parser.add_argument('--specs-per-item', type=int, default=5)
+        parser.add_argument('--days', type=int, default=365, help="How far back the price history goes.")
+        parser.add_argument('--end', default='2025-01-01', help="Date the price history ends on (ISO).")
+        parser.add_argument('--seed', type=int, default=42)
+        parser.add_argument('--batch-size', type=int, default=5000, help="Rows per INSERT transaction.")
+        parser.add_argument(
+            '--skip-derived', action='store_true',
+            help="Don't rebuild latest prices, the search index and unit prices afterwards.",
+        )
+
+    def handle(self, *args, **options):
+        try:
+            end = datetime.date.fromisoformat(options['end'])
+        except ValueError:
+            raise CommandError(f"Invalid --end date: {options['end']}")
+        if options['stores'] < 1 or options['tags'] < 1 or options['items'] < 1:
+            raise CommandError("--items, --tags and --stores must be at least 1.")
+        catalog = SyntheticCatalog(
+            items=options['items'], tags=options['tags'], stores=options['stores'], prices=options['prices'],
+            attributes=options['attributes'], specs_per_item=options['specs_per_item'], days=options['days'],
+            seed=options['seed'], end=end, batch_size=options['batch_size'],
+        )
+        report = catalog.generate(derived=not options['skip_derived'])
+        self.stdout.write(json.dumps(report, indent=2))
+        self.stdout.write(self.style.SUCCESS(
+            f"Seeded {options['items']} items and {report['price_history']['rows']} price rows "
+            f"in {report['price_history']['seconds']}s."
+        ))
@@ -0,0 +1,28 @@
+import json
+
+from django.core.management.base import BaseCommand, CommandError
+
+from catalog.benchmark import BenchmarkError, run_ingestion_stress
+
+
+class Command(BaseCommand):
+    help = (
+        "Runs bulk price ingestion (rolled back) while reader threads query the catalog, "
+        "and reports how the reads fared."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batches', type=int, default=20, help="Write transactions to run.")
+        parser.add_argument('--batch-size', type=int, default=2000, help="Price rows per write transaction.")
+        parser.add_argument('--readers', type=int, default=4, help="Concurrent reader threads.")
+
+    def handle(self, *args, **options):
+        try:
+            report = run_ingestion_stress(
+                batches=options['batches'], batch_size=options['batch_size'], readers=options['readers'],
+            )
+        except BenchmarkError as exc:
+            raise CommandError(str(exc))
+        self.stdout.write(json.dumps(report, indent=2))
+        if report['reads']['errors']:
+            raise CommandError(f"{report['reads']['errors']} reads failed during ingestion.")
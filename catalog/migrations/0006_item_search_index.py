@@ -0,0 +1,40 @@
+from django.db import migrations
+
+
+FTS_TABLE = 'catalog_item_fts'
+
+
+def create_search_index(apps, schema_editor):
+    if schema_editor.connection.vendor != 'sqlite':
+        return
+    schema_editor.execute(
+        f"CREATE VIRTUAL TABLE IF NOT EXISTS {FTS_TABLE} USING fts5("
+        "name, description, tags, "
+        "tokenize = 'unicode61 remove_diacritics 2', prefix = '2 3')"
+    )
+    schema_editor.execute(f"""
+        INSERT INTO {FTS_TABLE} (rowid, name, description, tags)
+        SELECT i.id, i.name, COALESCE(i.description, ''),
+               COALESCE((SELECT group_concat(t.name, ' ')
+                         FROM catalog_item_tags it
+                         JOIN catalog_tag t ON t.id = it.tag_id
+                         WHERE it.item_id = i.id), '')
+        FROM catalog_item i
+    """)
+
+
+def drop_search_index(apps, schema_editor):
+    if schema_editor.connection.vendor != 'sqlite':
+        return
+    schema_editor.execute(f"DROP TABLE IF EXISTS {FTS_TABLE}")
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('catalog', '0005_attributegroup_attributedefinition_itemspecification'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_search_index, drop_search_index),
+    ]
@@ -0,0 +1,58 @@
+# Generated by Django 5.2.1 on 2026-10-18 17:49
+
+import django.db.models.deletion
+from django.db import migrations, models
+from django.db.models import F, Window
+from django.db.models.functions import RowNumber
+
+
+def populate_latest_prices(apps, schema_editor):
+    PriceHistory = apps.get_model('catalog', 'PriceHistory')
+    LatestPrice = apps.get_model('catalog', 'LatestPrice')
+    newest = PriceHistory.objects.using(schema_editor.connection.alias).annotate(
+        row_number=Window(
+            RowNumber(),
+            partition_by=[F('item_id'), F('store_id')],
+            order_by=[F('date_recorded').desc(), F('id').desc()],
+        )
+    ).filter(row_number=1).order_by()
+    LatestPrice.objects.using(schema_editor.connection.alias).bulk_create(
+        (
+            LatestPrice(
+                item_id=entry.item_id, store_id=entry.store_id, price_entry_id=entry.id,
+                price=entry.price, currency=entry.currency, date_recorded=entry.date_recorded,
+                on_sale=entry.on_sale, pre_sale_price=entry.pre_sale_price, product_url=entry.product_url,
+            )
+            for entry in newest.iterator(chunk_size=1000)
+        ),
+        batch_size=1000,
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('catalog', '0006_item_search_index'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='LatestPrice',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('price', models.DecimalField(decimal_places=2, max_digits=10)),
+                ('currency', models.CharField(default='HUF', max_length=3)),
+                ('date_recorded', models.DateTimeField()),
+                ('on_sale', models.BooleanField(default=False)),
+                ('pre_sale_price', models.DecimalField(blank=True, decimal_places=2, max_digits=10, null=True)),
+                ('product_url', models.URLField(blank=True, max_length=500, null=True)),
+                ('item', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='latest_prices', to='catalog.item')),
+                ('price_entry', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to='catalog.pricehistory')),
+                ('store', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='latest_prices', to='catalog.store')),
+            ],
+            options={
+                'constraints': [models.UniqueConstraint(fields=('item', 'store'), name='catalog_latestprice_item_store_uniq')],
+            },
+        ),
+        migrations.RunPython(populate_latest_prices, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,38 @@
+# Generated by Django 5.2.1 on 2026-10-18 17:51
+
+import django.db.models.functions.text
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('catalog', '0007_latestprice'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='item',
+            index=models.Index(fields=['name'], name='catalog_item_name_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='latestprice',
+            index=models.Index(fields=['item', '-date_recorded', '-price_entry'], name='catalog_lp_item_date_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='pricehistory',
+            index=models.Index(fields=['-date_recorded'], name='catalog_ph_date_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='pricehistory',
+            index=models.Index(fields=['item', '-date_recorded', '-id'], name='catalog_ph_item_date_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='pricehistory',
+            index=models.Index(fields=['store', 'item', '-date_recorded', '-id'], name='catalog_ph_store_item_date_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='tag',
+            index=models.Index(django.db.models.functions.text.Lower('name'), name='catalog_tag_name_lower_idx'),
+        ),
+    ]
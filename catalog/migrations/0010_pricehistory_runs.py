@@ -0,0 +1,23 @@
+# Generated by Django 5.2.1 on 2026-10-18 17:55
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('catalog', '0009_productpagestate'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='pricehistory',
+            name='last_seen',
+            field=models.DateTimeField(blank=True, null=True, verbose_name='Last seen at this price'),
+        ),
+        migrations.AddField(
+            model_name='pricehistory',
+            name='observation_count',
+            field=models.PositiveIntegerField(default=1),
+        ),
+    ]
@@ -0,0 +1,33 @@
+# Generated by Django 5.2.1 on 2026-10-18 18:02
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('catalog', '0010_pricehistory_runs'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='PriceAlert',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('kind', models.CharField(choices=[('below', 'Price goes below threshold'), ('drop_pct', 'Price drops by threshold % from its 30-day average')], default='below', max_length=10)),
+                ('threshold', models.DecimalField(decimal_places=2, help_text="A price for 'below' alerts, a percentage for 'drop' alerts.", max_digits=10)),
+                ('email', models.EmailField(help_text='Where the notification is sent.', max_length=254)),
+                ('is_active', models.BooleanField(default=True)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('triggered_at', models.DateTimeField(blank=True, null=True)),
+                ('triggered_price', models.DecimalField(blank=True, decimal_places=2, max_digits=10, null=True)),
+                ('item', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='price_alerts', to='catalog.item')),
+                ('store', models.ForeignKey(blank=True, help_text='Leave empty to watch every store.', null=True, on_delete=django.db.models.deletion.CASCADE, related_name='price_alerts', to='catalog.store')),
+                ('triggered_entry', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='+', to='catalog.pricehistory')),
+            ],
+            options={
+                'indexes': [models.Index(fields=['item', 'is_active'], name='catalog_alert_item_active_idx')],
+            },
+        ),
+    ]
@@ -0,0 +1,21 @@
+# Generated by Django 5.2.1 on 2026-10-18 18:03
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('catalog', '0011_pricealert'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='itemspecification',
+            index=models.Index(fields=['attribute', 'value_numeric'], name='catalog_spec_attr_num_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='itemspecification',
+            index=models.Index(fields=['attribute', 'value_boolean'], name='catalog_spec_attr_bool_idx'),
+        ),
+    ]
@@ -0,0 +1,33 @@
+# Generated by Django 5.2.1 on 2026-10-18 18:05
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('catalog', '0012_specification_value_indexes'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='UnitPrice',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('price', models.DecimalField(decimal_places=2, max_digits=10)),
+                ('currency', models.CharField(default='HUF', max_length=3)),
+                ('quantity', models.DecimalField(decimal_places=6, help_text='Package size in the base unit.', max_digits=15)),
+                ('base_unit', models.CharField(help_text='kg or l.', max_length=5)),
+                ('unit_price', models.DecimalField(decimal_places=4, help_text='Price per base unit.', max_digits=14)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('item', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='unit_prices', to='catalog.item')),
+                ('specification', models.ForeignKey(help_text='The quantity the price was divided by.', on_delete=django.db.models.deletion.CASCADE, related_name='+', to='catalog.itemspecification')),
+                ('store', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='unit_prices', to='catalog.store')),
+            ],
+            options={
+                'indexes': [models.Index(fields=['base_unit', 'unit_price'], name='catalog_unitprice_rank_idx')],
+                'constraints': [models.UniqueConstraint(fields=('item', 'store'), name='catalog_unitprice_item_store_uniq')],
+            },
+        ),
+    ]
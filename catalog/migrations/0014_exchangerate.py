@@ -0,0 +1,25 @@
+# Generated by Django 5.2.1 on 2026-10-18 18:07
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('catalog', '0013_unitprice'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ExchangeRate',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('currency', models.CharField(max_length=3)),
+                ('rate_date', models.DateField()),
+                ('rate', models.DecimalField(decimal_places=8, help_text='Base-currency units per one unit of this currency.', max_digits=18)),
+            ],
+            options={
+                'constraints': [models.UniqueConstraint(fields=('currency', 'rate_date'), name='catalog_exchangerate_currency_date_uniq')],
+            },
+        ),
+    ]
@@ -0,0 +1,39 @@
+# Generated by Django 5.2.1 on 2026-10-18 18:31
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('catalog', '0014_exchangerate'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='PriceRollup',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('day', models.DateField(help_text='Local calendar day of the observations.')),
+                ('currency', models.CharField(default='HUF', max_length=3)),
+                ('min_price', models.DecimalField(decimal_places=2, max_digits=10)),
+                ('max_price', models.DecimalField(decimal_places=2, max_digits=10)),
+                ('price_sum', models.DecimalField(decimal_places=2, help_text='Sum of price × observations.', max_digits=18)),
+                ('observations', models.PositiveIntegerField()),
+                ('last_price', models.DecimalField(decimal_places=2, max_digits=10)),
+                ('first_recorded', models.DateTimeField()),
+                ('last_recorded', models.DateTimeField()),
+                ('sale_observations', models.PositiveIntegerField(default=0)),
+                ('discount_sum', models.FloatField(default=0, help_text='Sum of discount × observations over discounted rows.')),
+                ('discount_observations', models.PositiveIntegerField(default=0)),
+                ('max_discount', models.FloatField(default=0)),
+                ('item', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='price_rollups', to='catalog.item')),
+                ('store', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='price_rollups', to='catalog.store')),
+            ],
+            options={
+                'indexes': [models.Index(fields=['store', 'item', 'day'], name='catalog_pricerollup_store_idx')],
+                'constraints': [models.UniqueConstraint(fields=('item', 'store', 'day', 'currency'), name='catalog_pricerollup_uniq')],
+            },
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 5.2.1 on 2026-10-18 18:44
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('catalog', '0015_pricerollup'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='attributedefinition',
+            name='is_package_size',
+            field=models.BooleanField(default=False, help_text='Values are the package size (net weight or volume) that unit prices are computed from.'),
+        ),
+    ]
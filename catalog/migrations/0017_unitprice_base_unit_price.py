@@ -0,0 +1,37 @@
+# Generated by Django 5.2.1 on 2026-10-18 18:46
+
+from django.conf import settings
+from django.db import migrations, models
+from django.db.models import F
+
+
+def copy_base_currency_prices(apps, schema_editor):
+    # Rows in other currencies need their rates: run rebuild_unit_prices.
+    UnitPrice = apps.get_model('catalog', 'UnitPrice')
+    UnitPrice.objects.using(schema_editor.connection.alias).filter(
+        currency=getattr(settings, 'CATALOG_BASE_CURRENCY', 'HUF'),
+    ).update(base_unit_price=F('unit_price'))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('catalog', '0016_attributedefinition_is_package_size'),
+    ]
+
+    operations = [
+        migrations.RemoveIndex(
+            model_name='unitprice',
+            name='catalog_unitprice_rank_idx',
+        ),
+        migrations.AddField(
+            model_name='unitprice',
+            name='base_unit_price',
+            field=models.DecimalField(blank=True, decimal_places=4, help_text="Price per base unit in CATALOG_BASE_CURRENCY at today's rate; empty when the currency has no rate.", max_digits=14, null=True),
+        ),
+        migrations.AddIndex(
+            model_name='unitprice',
+            index=models.Index(fields=['base_unit', 'base_unit_price'], name='catalog_up_base_rank_idx'),
+        ),
+        migrations.RunPython(copy_base_currency_prices, migrations.RunPython.noop),
+    ]
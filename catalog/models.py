@@ -1,5 +1,10 @@
 # PriceTracker/catalog/models.py
-from django.db import models
+import threading
+from contextlib import contextmanager
+
+from django.db import models, router, transaction
+from django.db.models import F, Window
+from django.db.models.functions import Lower, RowNumber
 from django.utils import timezone
 from django.utils.text import slugify
 from decimal import Decimal, ROUND_HALF_UP
@@ -7,6 +12,11 @@ from decimal import Decimal, ROUND_HALF_UP
 class Tag(models.Model):
     name = models.CharField(max_length=100, unique=True)
 
+    class Meta:
+        indexes = [
+            models.Index(Lower('name'), name='catalog_tag_name_lower_idx'),
+        ]
+
     def __str__(self):
         return self.name
 
@@ -26,6 +36,11 @@ class Item(models.Model):
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
 
+    class Meta:
+        indexes = [
+            models.Index(fields=['name'], name='catalog_item_name_idx'),
+        ]
+
     def __str__(self):
         return self.name
 
@@ -38,15 +53,378 @@ class PriceHistory(models.Model):
     on_sale = models.BooleanField(default=False, verbose_name="Is this a sale price?")
     pre_sale_price = models.DecimalField(max_digits=10, decimal_places=2, null=True, blank=True, verbose_name="Original Price (before sale)")
     product_url = models.URLField(max_length=500, blank=True, null=True, verbose_name="Product URL (Optional)")
+    # A row can stand for a run of identical observations within one day:
+    # date_recorded is the first, last_seen the last one.
+    last_seen = models.DateTimeField(null=True, blank=True, verbose_name="Last seen at this price")
+    observation_count = models.PositiveIntegerField(default=1)
 
     class Meta:
         ordering = ['-date_recorded']
         verbose_name_plural = "Price Histories"
+        indexes = [
+            models.Index(fields=['-date_recorded'], name='catalog_ph_date_idx'),
+            # The trailing -id matches the (date, id) tie-break used for
+            # "newest entry" lookups, so they never need a sort step.
+            models.Index(fields=['item', '-date_recorded', '-id'], name='catalog_ph_item_date_idx'),
+            models.Index(fields=['store', 'item', '-date_recorded', '-id'], name='catalog_ph_store_item_date_idx'),
+        ]
+
+    # Observations that agree on all of these can share one run-length row.
+    RUN_FIELDS = ('price', 'currency', 'on_sale', 'pre_sale_price', 'product_url')
 
     def __str__(self):
         sale_info = " (Sale)" if self.on_sale else ""
         return f"{self.item.name} at {self.store.name} - {self.price} {self.currency}{sale_info} on {self.date_recorded.strftime('%Y-%m-%d')}"
 
+    @property
+    def seen_until(self):
+        return self.last_seen or self.date_recorded
+
+    def run_key(self):
+        return tuple(getattr(self, field) for field in self.RUN_FIELDS)
+
+    def can_absorb(self, other):
+        """True if ``other`` repeats this row later on the same day, so it can
+        be folded in without changing any daily (or coarser) aggregate."""
+        return (
+            other.run_key() == self.run_key()
+            and other.date_recorded >= self.seen_until
+            and timezone.localdate(other.date_recorded) == timezone.localdate(self.date_recorded)
+        )
+
+    def absorb(self, other):
+        self.last_seen = other.seen_until
+        self.observation_count += other.observation_count
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        instance._loaded_pair = (instance.__dict__.get('item_id'), instance.__dict__.get('store_id'))
+        return instance
+
+    def save(self, *args, **kwargs):
+        is_new = self._state.adding
+        using = kwargs.get('using') or router.db_for_write(PriceHistory, instance=self)
+        with transaction.atomic(using=using):
+            super().save(*args, **kwargs)
+            if is_new:
+                LatestPrice.objects.record(self)
+            else:
+                # An edit can move the entry backwards in time or to another
+                # item/store, so recompute instead of comparing.
+                pairs = {(self.item_id, self.store_id), getattr(self, '_loaded_pair', (None, None))}
+                LatestPrice.objects.refresh_pairs(pair for pair in pairs if None not in pair)
+        self._loaded_pair = (self.item_id, self.store_id)
+
+
+_deferred_refresh = threading.local()
+
+
+class LatestPriceManager(models.Manager):
+    SNAPSHOT_FIELDS = ['price_entry', 'price', 'currency', 'date_recorded', 'on_sale', 'pre_sale_price', 'product_url']
+
+    def _values_from(self, entry):
+        return {
+            'price_entry_id': entry.pk,
+            'price': entry.price,
+            'currency': entry.currency,
+            'date_recorded': entry.date_recorded,
+            'on_sale': entry.on_sale,
+            'pre_sale_price': entry.pre_sale_price,
+            'product_url': entry.product_url,
+        }
+
+    def last_for_item(self, item_id):
+        """The most recently recorded price of an item across all stores."""
+        return self.filter(item_id=item_id).order_by('-date_recorded', '-price_entry_id').first()
+
+    async def alast_for_item(self, item_id):
+        return await self.filter(item_id=item_id).order_by('-date_recorded', '-price_entry_id').afirst()
+
+    def last_for_items(self, item_ids):
+        """last_for_item() for many items in one query, as {item_id: row dict}.
+
+        Each item's rows are ranked newest first with ROW_NUMBER() and only
+        the first is kept. Items without any price are left out.
+        """
+        return {
+            row['item_id']: row
+            for row in self.last_for_items_query(item_ids)
+        }
+
+    def last_for_items_query(self, item_ids):
+        newest_first = [F('date_recorded').desc(), F('price_entry_id').desc()]
+        return (
+            self.filter(item_id__in=item_ids)
+            .annotate(rank=Window(RowNumber(), partition_by=[F('item_id')], order_by=newest_first))
+            .filter(rank=1)
+            .order_by()
+            .values('item_id', 'store_id', 'product_url')
+        )
+
+    def record(self, entry):
+        """Folds a newly saved PriceHistory row into the table."""
+        current = self.filter(item_id=entry.item_id, store_id=entry.store_id).first()
+        if current is None:
+            self.create(item_id=entry.item_id, store_id=entry.store_id, **self._values_from(entry))
+        elif (entry.date_recorded, entry.pk) >= (current.date_recorded, current.price_entry_id):
+            for field, value in self._values_from(entry).items():
+                setattr(current, field, value)
+            current.save()
+
+    def record_many(self, entries):
+        """Bulk counterpart of record() for rows written with bulk_create.
+
+        Reads the current rows for all touched pairs in one query and
+        writes the changes back with one bulk_update and one bulk_create.
+        """
+        newest = {}
+        for entry in entries:
+            pair = (entry.item_id, entry.store_id)
+            if pair not in newest or (entry.date_recorded, entry.pk) > (newest[pair].date_recorded, newest[pair].pk):
+                newest[pair] = entry
+        if not newest:
+            return
+        item_ids = {item_id for item_id, _ in newest}
+        store_ids = {store_id for _, store_id in newest}
+        current = {
+            (latest.item_id, latest.store_id): latest
+            for latest in self.filter(item_id__in=item_ids, store_id__in=store_ids)
+            if (latest.item_id, latest.store_id) in newest
+        }
+        to_create, to_update = [], []
+        for pair, entry in newest.items():
+            latest = current.get(pair)
+            if latest is None:
+                to_create.append(LatestPrice(item_id=entry.item_id, store_id=entry.store_id, **self._values_from(entry)))
+            elif (entry.date_recorded, entry.pk) >= (latest.date_recorded, latest.price_entry_id):
+                for field, value in self._values_from(entry).items():
+                    setattr(latest, field, value)
+                to_update.append(latest)
+        if to_update:
+            self.bulk_update(to_update, self.SNAPSHOT_FIELDS)
+        if to_create:
+            self.bulk_create(to_create)
+
+    @contextmanager
+    def deferred_refresh(self):
+        """Collects pairs touched by deletes and recomputes each once on exit."""
+        if getattr(_deferred_refresh, 'pairs', None) is not None:
+            yield
+            return
+        _deferred_refresh.pairs = set()
+        try:
+            yield
+            pairs = _deferred_refresh.pairs
+        finally:
+            _deferred_refresh.pairs = None
+        self.refresh_pairs(pairs)
+
+    def pair_changed(self, item_id, store_id):
+        pending = getattr(_deferred_refresh, 'pairs', None)
+        if pending is None:
+            self.refresh_pairs([(item_id, store_id)])
+        else:
+            pending.add((item_id, store_id))
+
+    def refresh_pairs(self, pairs):
+        """Recomputes the given (item_id, store_id) pairs from the history."""
+        for item_id, store_id in set(pairs):
+            newest = (
+                PriceHistory.objects.filter(item_id=item_id, store_id=store_id)
+                .order_by('-date_recorded', '-id')
+                .first()
+            )
+            if newest is None:
+                self.filter(item_id=item_id, store_id=store_id).delete()
+            else:
+                self.update_or_create(
+                    item_id=item_id, store_id=store_id, defaults=self._values_from(newest),
+                )
+
+    def rebuild(self, batch_size=1000):
+        """Replaces the whole table with the newest row of every item/store pair.
+
+        Returns the number of rows written.
+        """
+        newest = (
+            PriceHistory.objects.annotate(
+                row_number=Window(
+                    RowNumber(),
+                    partition_by=[F('item_id'), F('store_id')],
+                    order_by=[F('date_recorded').desc(), F('id').desc()],
+                )
+            )
+            .filter(row_number=1)
+            .order_by()
+        )
+        written = 0
+        with transaction.atomic(using=router.db_for_write(LatestPrice)):
+            self.all().delete()
+            batch = []
+            for entry in newest.iterator(chunk_size=batch_size):
+                batch.append(LatestPrice(item_id=entry.item_id, store_id=entry.store_id, **self._values_from(entry)))
+                if len(batch) >= batch_size:
+                    self.bulk_create(batch)
+                    written += len(batch)
+                    batch = []
+            if batch:
+                self.bulk_create(batch)
+                written += len(batch)
+        return written
+
+
+class LatestPrice(models.Model):
+    """The most recent PriceHistory row for each item/store pair.
+
+    Maintained by PriceHistory.save() in the same transaction as the history
+    row, so reads of current prices never have to sort the history.
+    """
+    item = models.ForeignKey(Item, on_delete=models.CASCADE, related_name='latest_prices')
+    store = models.ForeignKey(Store, on_delete=models.CASCADE, related_name='latest_prices')
+    price_entry = models.ForeignKey(PriceHistory, on_delete=models.CASCADE, related_name='+')
+    price = models.DecimalField(max_digits=10, decimal_places=2)
+    currency = models.CharField(max_length=3, default='HUF')
+    date_recorded = models.DateTimeField()
+    on_sale = models.BooleanField(default=False)
+    pre_sale_price = models.DecimalField(max_digits=10, decimal_places=2, null=True, blank=True)
+    product_url = models.URLField(max_length=500, blank=True, null=True)
+
+    objects = LatestPriceManager()
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['item', 'store'], name='catalog_latestprice_item_store_uniq'),
+        ]
+        indexes = [
+            models.Index(fields=['item', '-date_recorded', '-price_entry'], name='catalog_lp_item_date_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.item_id}@{self.store_id}: {self.price} {self.currency}"
+
+class UnitPrice(models.Model):
+    """A LatestPrice converted to a price per kg or litre, for value comparisons.
+
+    Rebuilt by catalog.unitprice whenever the item's prices or quantity
+    specification change; only items with a usable quantity have rows.
+    """
+    item = models.ForeignKey(Item, on_delete=models.CASCADE, related_name='unit_prices')
+    store = models.ForeignKey(Store, on_delete=models.CASCADE, related_name='unit_prices')
+    specification = models.ForeignKey('ItemSpecification', on_delete=models.CASCADE, related_name='+', help_text="The quantity the price was divided by.")
+    price = models.DecimalField(max_digits=10, decimal_places=2)
+    currency = models.CharField(max_length=3, default='HUF')
+    quantity = models.DecimalField(max_digits=15, decimal_places=6, help_text="Package size in the base unit.")
+    base_unit = models.CharField(max_length=5, help_text="kg or l.")
+    unit_price = models.DecimalField(max_digits=14, decimal_places=4, help_text="Price per base unit.")
+    base_unit_price = models.DecimalField(max_digits=14, decimal_places=4, null=True, blank=True, help_text="Price per base unit in CATALOG_BASE_CURRENCY at today's rate; empty when the currency has no rate.")
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['item', 'store'], name='catalog_unitprice_item_store_uniq'),
+        ]
+        indexes = [
+            models.Index(fields=['base_unit', 'base_unit_price'], name='catalog_up_base_rank_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.item_id}@{self.store_id}: {self.unit_price} {self.currency}/{self.base_unit}"
+
+class ExchangeRate(models.Model):
+    """The value of one unit of ``currency`` in CATALOG_BASE_CURRENCY, from ``rate_date`` on."""
+    currency = models.CharField(max_length=3)
+    rate_date = models.DateField()
+    rate = models.DecimalField(max_digits=18, decimal_places=8, help_text="Base-currency units per one unit of this currency.")
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['currency', 'rate_date'], name='catalog_exchangerate_currency_date_uniq'),
+        ]
+
+    def __str__(self):
+        return f"{self.currency} {self.rate_date}: {self.rate}"
+
+class PriceRollup(models.Model):
+    """Daily summary of the archived PriceHistory rows of one item/store/currency.
+
+    Written by catalog.archive when rows leave the hot table, so statistics
+    and downsampled history never have to read the archive. Prices are
+    weighted by observation_count, like the rows they summarize; discounts
+    are fractions of the pre-sale price.
+    """
+    item = models.ForeignKey(Item, on_delete=models.CASCADE, related_name='price_rollups')
+    store = models.ForeignKey(Store, on_delete=models.CASCADE, related_name='price_rollups')
+    day = models.DateField(help_text="Local calendar day of the observations.")
+    currency = models.CharField(max_length=3, default='HUF')
+    min_price = models.DecimalField(max_digits=10, decimal_places=2)
+    max_price = models.DecimalField(max_digits=10, decimal_places=2)
+    price_sum = models.DecimalField(max_digits=18, decimal_places=2, help_text="Sum of price × observations.")
+    observations = models.PositiveIntegerField()
+    last_price = models.DecimalField(max_digits=10, decimal_places=2)
+    first_recorded = models.DateTimeField()
+    last_recorded = models.DateTimeField()
+    sale_observations = models.PositiveIntegerField(default=0)
+    discount_sum = models.FloatField(default=0, help_text="Sum of discount × observations over discounted rows.")
+    discount_observations = models.PositiveIntegerField(default=0)
+    max_discount = models.FloatField(default=0)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['item', 'store', 'day', 'currency'], name='catalog_pricerollup_uniq'),
+        ]
+        indexes = [
+            models.Index(fields=['store', 'item', 'day'], name='catalog_pricerollup_store_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.item_id}@{self.store_id} {self.day}: {self.min_price}-{self.max_price} {self.currency}"
+
+class ProductPageState(models.Model):
+    """HTTP validators from the last fetch of a product page, for conditional requests."""
+    url = models.URLField(max_length=500, unique=True)
+    etag = models.CharField(max_length=255, blank=True, default='')
+    last_modified = models.CharField(max_length=64, blank=True, default='')
+    last_status = models.PositiveSmallIntegerField(null=True, blank=True)
+    last_checked_at = models.DateTimeField(null=True, blank=True)
+
+    def __str__(self):
+        return self.url
+
+class PriceAlert(models.Model):
+    """A one-shot subscription to a price condition on an item.
+
+    Alerts are checked by catalog.alerts for every new price of their item;
+    once triggered they are deactivated.
+    """
+    KIND_BELOW = 'below'
+    KIND_DROP_PCT = 'drop_pct'
+    KIND_CHOICES = [
+        (KIND_BELOW, 'Price goes below threshold'),
+        (KIND_DROP_PCT, 'Price drops by threshold % from its 30-day average'),
+    ]
+
+    item = models.ForeignKey(Item, on_delete=models.CASCADE, related_name='price_alerts')
+    store = models.ForeignKey(Store, on_delete=models.CASCADE, null=True, blank=True, related_name='price_alerts', help_text="Leave empty to watch every store.")
+    kind = models.CharField(max_length=10, choices=KIND_CHOICES, default=KIND_BELOW)
+    threshold = models.DecimalField(max_digits=10, decimal_places=2, help_text="A price for 'below' alerts, a percentage for 'drop' alerts.")
+    email = models.EmailField(help_text="Where the notification is sent.")
+    is_active = models.BooleanField(default=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    triggered_at = models.DateTimeField(null=True, blank=True)
+    triggered_price = models.DecimalField(max_digits=10, decimal_places=2, null=True, blank=True)
+    triggered_entry = models.ForeignKey(PriceHistory, on_delete=models.SET_NULL, null=True, blank=True, related_name='+')
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['item', 'is_active'], name='catalog_alert_item_active_idx'),
+        ]
+
+    def __str__(self):
+        if self.kind == self.KIND_DROP_PCT:
+            return f"{self.email}: item {self.item_id} drops {self.threshold}%"
+        return f"{self.email}: item {self.item_id} below {self.threshold}"
+
 class AttributeGroup(models.Model):
     name = models.CharField(max_length=100, unique=True, help_text="Name of the attribute group (e.g., Nutritional Information, Physical Dimensions)")
     description = models.TextField(blank=True, null=True, help_text="Optional description for the group.")
@@ -72,6 +450,7 @@ class AttributeDefinition(models.Model):
     value_type = models.CharField(max_length=20, choices=VALUE_TYPE_CHOICES, default='text', help_text="The type of value this attribute holds.")
     description = models.TextField(blank=True, null=True, help_text="Optional description or help text for this attribute.")
     display_order = models.PositiveIntegerField(default=0, help_text="Order in which to display attributes within a group.")
+    is_package_size = models.BooleanField(default=False, help_text="Values are the package size (net weight or volume) that unit prices are computed from.")
 
     class Meta:
         ordering = ['group', 'display_order', 'name']
@@ -106,6 +485,11 @@ class ItemSpecification(models.Model):
     class Meta:
         ordering = ['attribute__group__display_order', 'attribute__display_order', 'attribute__name']
         unique_together = [['item', 'attribute']]
+        indexes = [
+            # Specification filters and facets look values up per attribute.
+            models.Index(fields=['attribute', 'value_numeric'], name='catalog_spec_attr_num_idx'),
+            models.Index(fields=['attribute', 'value_boolean'], name='catalog_spec_attr_bool_idx'),
+        ]
         verbose_name = "Item Specification"
         verbose_name_plural = "Item Specifications"
 
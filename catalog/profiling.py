@@ -0,0 +1,233 @@
+# PriceTracker/catalog/profiling.py
+import random
+import re
+import threading
+import time
+from collections import Counter, defaultdict, deque
+from contextvars import ContextVar
+
+import numpy as np
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction, sync_to_async
+from django.conf import settings
+from django.core.exceptions import MiddlewareNotUsed
+from django.db import connections
+from django.template import base as template_base
+
+# Samples kept per view; older ones fall off.
+MAX_SAMPLES = 1000
+PERCENTILES = (50, 90, 99)
+METRICS = ('total_ms', 'db_ms', 'queries', 'render_ms')
+
+_NUMBER = re.compile(r'\b\d+(\.\d+)?\b')
+_STRING = re.compile(r"'(?:[^']|'')*'")
+_IN_LIST = re.compile(r'\bIN \([^()]*\)', re.IGNORECASE)
+
+# A context variable rather than a thread local: async requests share the
+# event loop's thread, and sync_to_async() carries the context into threads.
+_profile = ContextVar('catalog_request_profile', default=None)
+
+
+def query_signature(sql):
+    """The SQL with literals and IN lists blanked out, so repeats of one query match."""
+    sql = _IN_LIST.sub('IN (...)', sql)
+    sql = _STRING.sub('?', sql).replace('%s', '?')
+    return _NUMBER.sub('?', sql)
+
+
+class RequestProfile:
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.queries = []
+        self.render_seconds = 0.0
+        self.render_depth = 0
+
+    def __call__(self, execute, sql, params, many, context):
+        if _profile.get() is not self:
+            # A connection shared with another request's context.
+            return execute(sql, params, many, context)
+        started = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.queries.append((sql, time.perf_counter() - started))
+
+    def duplicates(self, threshold):
+        """Query signatures run at least ``threshold`` times: likely N+1 loops."""
+        counts = Counter(query_signature(sql) for sql, _ in self.queries)
+        return {signature: count for signature, count in counts.items() if count >= threshold}
+
+    def summary(self):
+        return {
+            'total_ms': (time.perf_counter() - self.started) * 1000,
+            'db_ms': sum(duration for _, duration in self.queries) * 1000,
+            'queries': len(self.queries),
+            'render_ms': self.render_seconds * 1000,
+        }
+
+
+def _timed_render(render):
+    def wrapper(self, context):
+        profile = _profile.get()
+        if profile is None:
+            return render(self, context)
+        # Included templates render inside their parent; only the outermost
+        # render is timed so nothing is counted twice.
+        profile.render_depth += 1
+        started = time.perf_counter()
+        try:
+            return render(self, context)
+        finally:
+            profile.render_depth -= 1
+            if not profile.render_depth:
+                profile.render_seconds += time.perf_counter() - started
+    wrapper.profiling = True
+    wrapper.original = render
+    return wrapper
+
+
+def install_template_timer():
+    """Wraps Template.render process-wide; done only when profiling is enabled."""
+    if not getattr(template_base.Template.render, 'profiling', False):
+        template_base.Template.render = _timed_render(template_base.Template.render)
+
+
+def uninstall_template_timer():
+    render = template_base.Template.render
+    if getattr(render, 'profiling', False):
+        template_base.Template.render = render.original
+
+
+class PerfStats:
+    """Recent samples per URL name, in memory, for this process only."""
+    def __init__(self, max_samples=MAX_SAMPLES):
+        self.max_samples = max_samples
+        self.lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        with self.lock:
+            self.samples = defaultdict(lambda: deque(maxlen=self.max_samples))
+            self.requests = Counter()
+            self.duplicates = defaultdict(Counter)
+
+    def add(self, view_name, summary, duplicates):
+        with self.lock:
+            self.samples[view_name].append(tuple(summary[metric] for metric in METRICS))
+            self.requests[view_name] += 1
+            self.duplicates[view_name].update(duplicates.keys())
+
+    def report(self):
+        with self.lock:
+            snapshot = {name: list(samples) for name, samples in self.samples.items()}
+            requests = dict(self.requests)
+            duplicates = {name: counter.most_common(5) for name, counter in self.duplicates.items()}
+        views = {}
+        for name, samples in sorted(snapshot.items()):
+            values = np.asarray(samples, dtype=np.float64)
+            views[name] = {
+                'sampled_requests': requests[name],
+                **{
+                    metric: {
+                        f'p{percentile}': round(float(value), 2)
+                        for percentile, value in zip(PERCENTILES, np.percentile(values[:, column], PERCENTILES))
+                    }
+                    for column, metric in enumerate(METRICS)
+                },
+                'repeated_queries': [
+                    {'signature': signature, 'requests': count} for signature, count in duplicates.get(name, [])
+                ],
+            }
+        return views
+
+
+stats = PerfStats()
+
+
+def server_timing(summary, duplicates):
+    parts = [
+        f"total;dur={summary['total_ms']:.1f}",
+        f"db;dur={summary['db_ms']:.1f};desc=\"{summary['queries']} queries\"",
+        f"render;dur={summary['render_ms']:.1f}",
+    ]
+    if duplicates:
+        parts.append(f"dup;desc=\"{len(duplicates)} repeated queries\"")
+    return ', '.join(parts)
+
+
+class ProfilingMiddleware:
+    """Times a sample of requests: total, database (count and time), template rendering.
+
+    Enabled with CATALOG_PROFILING; CATALOG_PROFILING_SAMPLE_RATE is the
+    share of requests measured, so unsampled requests pay only a random()
+    call. Sampled responses carry a Server-Timing header and feed the
+    per-view percentiles served at /catalog/_perf/. A query signature
+    repeated CATALOG_PROFILING_REPEAT_THRESHOLD times in one request is
+    reported as a likely N+1.
+
+    Sync and async capable, so under ASGI the async views are measured
+    without an extra thread hop.
+    """
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        if not getattr(settings, 'CATALOG_PROFILING', False):
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+        self.sample_rate = float(getattr(settings, 'CATALOG_PROFILING_SAMPLE_RATE', 0.1))
+        self.repeat_threshold = int(getattr(settings, 'CATALOG_PROFILING_REPEAT_THRESHOLD', 5))
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+        install_template_timer()
+
+    @staticmethod
+    def _attach(profile):
+        # remove() rather than connection.execute_wrapper()'s pop(): under
+        # ASGI another request may attach to the same connection meanwhile.
+        for connection in connections.all():
+            connection.execute_wrappers.append(profile)
+
+    @staticmethod
+    def _detach(profile):
+        for connection in connections.all():
+            connection.execute_wrappers.remove(profile)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        if random.random() >= self.sample_rate:
+            return self.get_response(request)
+        profile = RequestProfile()
+        token = _profile.set(profile)
+        self._attach(profile)
+        try:
+            response = self.get_response(request)
+        finally:
+            self._detach(profile)
+            _profile.reset(token)
+        return self._record(request, response, profile)
+
+    async def __acall__(self, request):
+        if random.random() >= self.sample_rate:
+            return await self.get_response(request)
+        profile = RequestProfile()
+        token = _profile.set(profile)
+        # The async ORM queries run in the request's thread-sensitive sync
+        # thread, so the wrappers go on that thread's connections.
+        await sync_to_async(self._attach)(profile)
+        try:
+            response = await self.get_response(request)
+        finally:
+            await sync_to_async(self._detach)(profile)
+            _profile.reset(token)
+        return self._record(request, response, profile)
+
+    def _record(self, request, response, profile):
+        match = getattr(request, 'resolver_match', None)
+        view_name = match.view_name if match else 'unresolved'
+        summary = profile.summary()
+        duplicates = profile.duplicates(self.repeat_threshold)
+        if view_name != 'catalog:perf_stats':
+            stats.add(view_name, summary, duplicates)
+        response['Server-Timing'] = server_timing(summary, duplicates)
+        return response
@@ -0,0 +1,48 @@
+# PriceTracker/catalog/routers.py
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from django.db import DEFAULT_DB_ALIAS, connections
+
+READ_ALIAS = 'replica'
+
+_read_from_writer = ContextVar('catalog_read_from_writer', default=False)
+
+
+@contextmanager
+def read_from_writer():
+    """Routes the reads made inside the block to the default database.
+
+    For code whose result outlives the request, such as cache builders: a
+    replica lagging behind a write would otherwise get its stale answer
+    cached under the version stamp that write just bumped.
+    """
+    token = _read_from_writer.set(True)
+    try:
+        yield
+    finally:
+        _read_from_writer.reset(token)
+
+
+class ReadWriteRouter:
+    """Writes and migrations go to the default database, reads to READ_ALIAS.
+
+    A read made while the writer has a transaction open stays on the
+    writer, so it sees that transaction's own changes (ingestion looks up
+    the rows it is about to extend, views re-read what they just saved).
+    So does one made inside read_from_writer().
+    """
+    def db_for_read(self, model, **hints):
+        if _read_from_writer.get() or connections[DEFAULT_DB_ALIAS].in_atomic_block:
+            return DEFAULT_DB_ALIAS
+        return READ_ALIAS
+
+    def db_for_write(self, model, **hints):
+        return DEFAULT_DB_ALIAS
+
+    def allow_relation(self, obj1, obj2, **hints):
+        # Both aliases are the same data.
+        return True
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        return db == DEFAULT_DB_ALIAS
@@ -0,0 +1,317 @@
+# PriceTracker/catalog/scraper.py
+import asyncio
+import html
+import json
+import logging
+import re
+import time
+from collections import namedtuple
+from decimal import Decimal, InvalidOperation
+from urllib.parse import urlsplit
+
+import httpx
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.utils import timezone
+from django.utils.module_loading import import_string
+
+from .ingest import PriceIngestor
+from .models import LatestPrice, PriceHistory, ProductPageState
+
+logger = logging.getLogger(__name__)
+
+RefreshTarget = namedtuple('RefreshTarget', 'item_id store_id url host currency')
+ExtractedPrice = namedtuple('ExtractedPrice', 'price on_sale pre_sale_price currency', defaults=(False, None, None))
+
+USER_AGENT = 'PriceTracker/1.0 (+price refresh)'
+
+_EXTRACTORS = {}
+
+
+def register_extractor(*hosts):
+    """Registers ``func(page_text, target) -> ExtractedPrice | None`` for the given hosts.
+
+    Hosts can also be mapped to dotted paths with the
+    ``CATALOG_PRICE_EXTRACTORS`` setting.
+    """
+    def decorator(func):
+        for host in hosts:
+            _EXTRACTORS[host.lower()] = func
+        return func
+    return decorator
+
+
+def get_extractor(host):
+    configured = getattr(settings, 'CATALOG_PRICE_EXTRACTORS', {})
+    if host in configured:
+        return import_string(configured[host])
+    return _EXTRACTORS.get(host, extract_structured_price)
+
+
+def _to_decimal(value):
+    if value is None:
+        return None
+    text = str(value).strip().replace(' ', '').replace('\xa0', '')
+    if ',' in text and '.' in text:
+        # "1.299,90" vs "1,299.90": the last separator is the decimal one.
+        if text.rfind(',') > text.rfind('.'):
+            text = text.replace('.', '').replace(',', '.')
+        else:
+            text = text.replace(',', '')
+    elif ',' in text:
+        text = text.replace(',', '.')
+    try:
+        return Decimal(text).quantize(Decimal('0.01'))
+    except InvalidOperation:
+        return None
+
+
+_JSON_LD_RE = re.compile(r'<script[^>]+application/ld\+json[^>]*>(.*?)</script>', re.S | re.I)
+_META_PRICE_RE = re.compile(
+    r'<meta[^>]+(?:property|itemprop)=["\'](?:product:price:amount|price)["\'][^>]+content=["\']([^"\']+)', re.I
+)
+_META_CURRENCY_RE = re.compile(
+    r'<meta[^>]+(?:property|itemprop)=["\'](?:product:price:currency|priceCurrency)["\'][^>]+content=["\']([^"\']+)', re.I
+)
+
+
+def _offers(node):
+    if isinstance(node, list):
+        for child in node:
+            yield from _offers(child)
+    elif isinstance(node, dict):
+        if 'price' in node:
+            yield node
+        for key in ('offers', '@graph'):
+            if key in node:
+                yield from _offers(node[key])
+
+
+def extract_structured_price(text, target):
+    """Default extractor: schema.org JSON-LD offers, then price meta tags."""
+    for block in _JSON_LD_RE.findall(text):
+        try:
+            data = json.loads(html.unescape(block))
+        except json.JSONDecodeError:
+            continue
+        for offer in _offers(data):
+            price = _to_decimal(offer.get('price'))
+            if price is not None:
+                return ExtractedPrice(price, currency=offer.get('priceCurrency'))
+    match = _META_PRICE_RE.search(text)
+    if match:
+        price = _to_decimal(match.group(1))
+        if price is not None:
+            currency = _META_CURRENCY_RE.search(text)
+            return ExtractedPrice(price, currency=currency.group(1) if currency else None)
+    return None
+
+
+class HostLimiter:
+    """Caps concurrent requests to one host and spaces out their start times."""
+    def __init__(self, concurrency, requests_per_second):
+        self.semaphore = asyncio.Semaphore(concurrency)
+        self.interval = 1.0 / requests_per_second if requests_per_second else 0.0
+        self._lock = asyncio.Lock()
+        self._next_start = 0.0
+
+    async def __aenter__(self):
+        await self.semaphore.acquire()
+        if self.interval:
+            async with self._lock:
+                now = time.monotonic()
+                wait = self._next_start - now
+                self._next_start = max(now, self._next_start) + self.interval
+            if wait > 0:
+                await asyncio.sleep(wait)
+        return self
+
+    async def __aexit__(self, *exc_info):
+        self.semaphore.release()
+
+
+class RefreshStats:
+    def __init__(self):
+        self.fetched = 0
+        self.not_modified = 0
+        self.recorded = 0
+        self.unparsed = 0
+        self.failed = 0
+        self.elapsed = 0.0
+
+    @property
+    def urls_per_minute(self):
+        total = self.fetched + self.not_modified + self.failed
+        return total * 60 / self.elapsed if self.elapsed else 0.0
+
+
+def _host(url):
+    try:
+        return (urlsplit(url).hostname or '').lower()
+    except ValueError:
+        # Malformed (e.g. an unclosed IPv6 bracket); the fetch will fail too.
+        return ''
+
+
+def load_targets(store_ids=None, limit=None):
+    """Every (item, store) whose latest price has a product URL, with the URL's host.
+
+    The host is the one actually fetched, which is not always the store's
+    website (CDNs, marketplaces), so rate limits apply where requests go.
+    """
+    latest = LatestPrice.objects.exclude(product_url__isnull=True).exclude(product_url='')
+    if store_ids:
+        latest = latest.filter(store_id__in=store_ids)
+    latest = latest.order_by('date_recorded').values_list('item_id', 'store_id', 'product_url', 'currency')
+    if limit:
+        latest = latest[:limit]
+    return [
+        RefreshTarget(item_id, store_id, url, _host(url), currency)
+        for item_id, store_id, url, currency in latest
+    ]
+
+
+class PriceRefresher:
+    """Re-fetches product pages concurrently and records the prices found.
+
+    One pooled httpx client is shared by ``concurrency`` workers. Each
+    product URL host gets its own HostLimiter, requests carry the ETag and
+    Last-Modified validators from the previous fetch, and new PriceHistory
+    rows are written in batches through PriceIngestor.
+    """
+    def __init__(self, concurrency=50, per_host=4, per_host_rate=5.0, timeout=10.0, batch_size=500, changes_only=False):
+        self.concurrency = concurrency
+        self.per_host = per_host
+        self.per_host_rate = per_host_rate
+        self.timeout = timeout
+        self.batch_size = batch_size
+        self.ingestor = PriceIngestor(changes_only=changes_only)
+        self.limiters = {}
+        self.pending_entries = []
+        self.pending_states = []
+        self.stats = RefreshStats()
+        self._flush_lock = None
+
+    def limiter_for(self, host):
+        if host not in self.limiters:
+            self.limiters[host] = HostLimiter(self.per_host, self.per_host_rate)
+        return self.limiters[host]
+
+    def make_client(self):
+        return httpx.AsyncClient(
+            timeout=self.timeout,
+            follow_redirects=True,
+            headers={'User-Agent': USER_AGENT},
+            limits=httpx.Limits(max_connections=self.concurrency, max_keepalive_connections=self.concurrency),
+        )
+
+    async def run(self, targets):
+        started = time.monotonic()
+        self._flush_lock = asyncio.Lock()
+        states = await sync_to_async(self._load_states)([target.url for target in targets])
+        queue = asyncio.Queue()
+        for target in targets:
+            queue.put_nowait(target)
+
+        async with self.make_client() as client:
+            async def worker():
+                while True:
+                    try:
+                        target = queue.get_nowait()
+                    except asyncio.QueueEmpty:
+                        return
+                    await self.refresh_one(client, target, states.get(target.url))
+                    if len(self.pending_entries) + len(self.pending_states) >= self.batch_size:
+                        await self.flush()
+
+            workers = min(self.concurrency, len(targets)) or 1
+            await asyncio.gather(*(worker() for _ in range(workers)))
+        await self.flush()
+        self.stats.elapsed = time.monotonic() - started
+        return self.stats
+
+    @staticmethod
+    def _load_states(urls):
+        return {
+            state.url: state
+            for state in ProductPageState.objects.filter(url__in=set(urls))
+        }
+
+    async def refresh_one(self, client, target, state):
+        headers = {}
+        if state is not None:
+            if state.etag:
+                headers['If-None-Match'] = state.etag
+            if state.last_modified:
+                headers['If-Modified-Since'] = state.last_modified
+        try:
+            async with self.limiter_for(target.host):
+                response = await client.get(target.url, headers=headers)
+        except (httpx.HTTPError, httpx.InvalidURL):
+            # InvalidURL (a malformed stored product_url) isn't an HTTPError.
+            self.stats.failed += 1
+            self.pending_states.append(ProductPageState(
+                url=target.url, etag=getattr(state, 'etag', ''),
+                last_modified=getattr(state, 'last_modified', ''),
+                last_status=None, last_checked_at=timezone.now(),
+            ))
+            return
+
+        checked_at = timezone.now()
+        etag = response.headers.get('ETag', '')
+        last_modified = response.headers.get('Last-Modified', '')
+        if response.status_code == 304:
+            # A 304 may omit the validators; the old ones are still current.
+            # getattr: a misbehaving server may answer 304 to a request sent
+            # without validators.
+            etag = etag or getattr(state, 'etag', '')
+            last_modified = last_modified or getattr(state, 'last_modified', '')
+        self.pending_states.append(ProductPageState(
+            url=target.url, etag=etag, last_modified=last_modified,
+            last_status=response.status_code, last_checked_at=checked_at,
+        ))
+        if response.status_code == 304:
+            self.stats.not_modified += 1
+            return
+        if response.status_code != 200:
+            self.stats.failed += 1
+            return
+        self.stats.fetched += 1
+
+        try:
+            extracted = get_extractor(target.host)(response.text, target)
+        except Exception:
+            # One broken page (or extractor) must not abort the whole run.
+            logger.exception("Price extraction failed for %s", target.url)
+            extracted = None
+        if extracted is None:
+            self.stats.unparsed += 1
+            return
+        on_sale = bool(extracted.on_sale and extracted.pre_sale_price and extracted.pre_sale_price > extracted.price)
+        self.pending_entries.append(PriceHistory(
+            item_id=target.item_id, store_id=target.store_id, price=extracted.price,
+            currency=(extracted.currency or target.currency or 'HUF')[:3].upper(),
+            date_recorded=checked_at, on_sale=on_sale,
+            pre_sale_price=extracted.pre_sale_price if on_sale else None,
+            product_url=target.url,
+        ))
+
+    async def flush(self):
+        async with self._flush_lock:
+            entries, self.pending_entries = self.pending_entries, []
+            states, self.pending_states = self.pending_states, []
+            if entries or states:
+                await sync_to_async(self._write)(entries, states)
+                self.stats.recorded += len(entries)
+
+    def _write(self, entries, states):
+        if entries:
+            self.ingestor.write(entries)
+        if states:
+            latest_states = {state.url: state for state in states}
+            ProductPageState.objects.bulk_create(
+                latest_states.values(),
+                update_conflicts=True,
+                unique_fields=['url'],
+                update_fields=['etag', 'last_modified', 'last_status', 'last_checked_at'],
+            )
@@ -0,0 +1,167 @@
+# PriceTracker/catalog/search.py
+import re
+
+from django.conf import settings
+from django.db import connections, router
+
+from .models import Item
+
+FTS_TABLE = 'catalog_item_fts'
+
+CREATE_FTS_SQL = (
+    f"CREATE VIRTUAL TABLE IF NOT EXISTS {FTS_TABLE} USING fts5("
+    "name, description, tags, "
+    "tokenize = 'unicode61 remove_diacritics 2', prefix = '2 3')"
+)
+DROP_FTS_SQL = f"DROP TABLE IF EXISTS {FTS_TABLE}"
+
+# Rebuilds every row from the source tables; rowid mirrors catalog_item.id.
+POPULATE_FTS_SQL = f"""
+    INSERT INTO {FTS_TABLE} (rowid, name, description, tags)
+    SELECT i.id, i.name, COALESCE(i.description, ''),
+           COALESCE((SELECT group_concat(t.name, ' ')
+                     FROM catalog_item_tags it
+                     JOIN catalog_tag t ON t.id = it.tag_id
+                     WHERE it.item_id = i.id), '')
+    FROM catalog_item i
+"""
+
+# bm25 column weights for (name, description, tags): a hit in the name
+# outranks one in the tags, which outranks one in the description.
+RANK_WEIGHTS = (10.0, 1.0, 5.0)
+# Ids per statement when (re)indexing, well under SQLite's variable limit.
+ID_CHUNK_SIZE = 500
+
+_TOKEN_RE = re.compile(r'\w+', re.UNICODE)
+
+
+class SearchResults(list):
+    """Ranked matches; ``truncated`` when more than CATALOG_SEARCH_MAX_RESULTS matched."""
+    truncated = False
+
+
+def _connection():
+    return connections[router.db_for_write(Item)]
+
+
+def is_available(connection=None):
+    """The FTS index only exists on SQLite; other backends fall back to LIKE."""
+    connection = connection or _connection()
+    return connection.vendor == 'sqlite'
+
+
+def build_match_expression(query):
+    """Turns free text into an FTS5 query where every word is a quoted prefix term.
+
+    Quoting each token keeps user input from being parsed as FTS5 syntax
+    (AND/OR/NEAR, column filters, stray quotes).
+    """
+    tokens = _TOKEN_RE.findall(query)
+    return ' '.join(f'"{token}"*' for token in tokens)
+
+
+def create_index(connection):
+    with connection.cursor() as cursor:
+        cursor.execute(CREATE_FTS_SQL)
+
+
+def rebuild_index(connection=None):
+    """Drops every indexed row and re-reads all items. Returns the row count."""
+    connection = connection or _connection()
+    if not is_available(connection):
+        return 0
+    with connection.cursor() as cursor:
+        cursor.execute(CREATE_FTS_SQL)
+        cursor.execute(f"DELETE FROM {FTS_TABLE}")
+        cursor.execute(POPULATE_FTS_SQL)
+        cursor.execute(f"SELECT COUNT(*) FROM {FTS_TABLE}")
+        return cursor.fetchone()[0]
+
+
+def _chunks(item_ids):
+    item_ids = list(item_ids)
+    for start in range(0, len(item_ids), ID_CHUNK_SIZE):
+        chunk = item_ids[start:start + ID_CHUNK_SIZE]
+        yield chunk, ', '.join(['%s'] * len(chunk))
+
+
+def index_items(item_ids, connection=None):
+    """Re-indexes the given items from the database (deleted ones are dropped)."""
+    connection = connection or _connection()
+    if not is_available(connection):
+        return
+    with connection.cursor() as cursor:
+        for chunk, placeholders in _chunks(item_ids):
+            cursor.execute(f"DELETE FROM {FTS_TABLE} WHERE rowid IN ({placeholders})", chunk)
+            cursor.execute(f"{POPULATE_FTS_SQL} WHERE i.id IN ({placeholders})", chunk)
+
+
+def remove_items(item_ids, connection=None):
+    connection = connection or _connection()
+    if not is_available(connection):
+        return
+    with connection.cursor() as cursor:
+        for chunk, placeholders in _chunks(item_ids):
+            cursor.execute(f"DELETE FROM {FTS_TABLE} WHERE rowid IN ({placeholders})", chunk)
+
+
+def ranked_item_ids(query, limit=None, connection=None, within=None):
+    """Returns matching item ids, best match first.
+
+    ``within`` (an Item queryset) restricts the matches before the limit
+    applies, so filtered searches aren't cut down to the unfiltered top hits.
+    """
+    match = build_match_expression(query)
+    if not match:
+        return []
+    if limit is None:
+        limit = getattr(settings, 'CATALOG_SEARCH_MAX_RESULTS', 500)
+    connection = connection or _connection()
+    weights = ', '.join(str(w) for w in RANK_WEIGHTS)
+    restriction, params = '', [match]
+    if within is not None:
+        subquery, subquery_params = within.order_by().values('pk').query.sql_with_params()
+        # The unary + keeps FTS5 from turning this into a rowid lookup,
+        # which would lose the presorted rank order.
+        restriction = f"AND +rowid IN ({subquery}) "
+        params.extend(subquery_params)
+    with connection.cursor() as cursor:
+        # Overriding rank inside the MATCH (rather than ORDER BY bm25(...))
+        # lets FTS5 return rows already sorted, without a temp B-tree.
+        cursor.execute(
+            f"SELECT rowid FROM {FTS_TABLE} "
+            f"WHERE {FTS_TABLE} MATCH %s AND rank MATCH 'bm25({weights})' "
+            f"{restriction}ORDER BY rank LIMIT %s",
+            [*params, limit],
+        )
+        return [row[0] for row in cursor.fetchall()]
+
+
+def search_items(queryset, query):
+    """Applies a free-text search to an Item queryset.
+
+    On SQLite the result is a SearchResults list ordered by relevance,
+    holding at most CATALOG_SEARCH_MAX_RESULTS items; its ``truncated`` flag
+    tells the listing to say so. Elsewhere, and for queries without a single
+    word to match (only punctuation), it is the queryset filtered with
+    ``icontains`` and ordered by name.
+    """
+    query = query.strip()
+    if not query:
+        return queryset.order_by('name')
+
+    connection = connections[queryset.db]
+    if not is_available(connection) or not build_match_expression(query):
+        return queryset.filter(name__icontains=query).order_by('name')
+
+    # Tag and specification filters apply inside the ranked query. One id
+    # past the cap tells whether anything was left out.
+    limit = getattr(settings, 'CATALOG_SEARCH_MAX_RESULTS', 500)
+    ids = ranked_item_ids(query, limit=limit + 1, connection=connection, within=queryset if queryset.query.where else None)
+    results = SearchResults()
+    results.truncated = len(ids) > limit
+    ids = ids[:limit]
+    if ids:
+        position = {item_id: index for index, item_id in enumerate(ids)}
+        results.extend(sorted(queryset.filter(pk__in=ids), key=lambda item: position[item.pk]))
+    return results
@@ -0,0 +1,185 @@
+# PriceTracker/catalog/signals.py
+from django.db.models import QuerySet
+from django.db.models.signals import m2m_changed, post_delete, post_save, pre_delete
+from django.db import transaction
+from django.dispatch import receiver
+
+from . import search
+from .alerts import alert_namespace, evaluate_entries
+from .cache import invalidate, item_namespace
+from .currency import RATES_NAMESPACE
+from .thumbnails import generate_thumbnails
+from .unitprice import refresh_currency_unit_prices, schedule_refresh
+from .models import (
+    AttributeDefinition, AttributeGroup, ExchangeRate, Item, ItemSpecification, LatestPrice, PriceAlert,
+    PriceHistory, Store, Tag,
+)
+
+
+@receiver(post_save, sender=Item)
+def index_saved_item(sender, instance, raw=False, **kwargs):
+    if raw:
+        return
+    search.index_items([instance.pk])
+
+
+@receiver(post_delete, sender=Item)
+def unindex_deleted_item(sender, instance, **kwargs):
+    search.remove_items([instance.pk])
+
+
+@receiver(m2m_changed, sender=Item.tags.through)
+def reindex_item_tags(sender, instance, action, reverse, pk_set, **kwargs):
+    if action not in ('post_add', 'post_remove', 'post_clear', 'pre_clear'):
+        return
+    if not reverse:
+        if action != 'pre_clear':
+            search.index_items([instance.pk])
+        return
+    # tag.item_set.add/remove/clear(): instance is the Tag.
+    if action == 'pre_clear':
+        # The affected items are gone from the through table by post_clear.
+        instance._search_cleared_item_ids = list(instance.item_set.values_list('pk', flat=True))
+    elif action == 'post_clear':
+        search.index_items(getattr(instance, '_search_cleared_item_ids', []))
+    else:
+        search.index_items(pk_set or [])
+
+
+@receiver(post_save, sender=Tag)
+def reindex_renamed_tag(sender, instance, created, raw=False, **kwargs):
+    if created or raw:
+        return
+    search.index_items(instance.item_set.values_list('pk', flat=True))
+
+
+@receiver(pre_delete, sender=Tag)
+def remember_tagged_items(sender, instance, **kwargs):
+    # The through rows are cascaded away before post_delete fires.
+    instance._search_item_ids = list(instance.item_set.values_list('pk', flat=True))
+
+
+@receiver(post_delete, sender=Tag)
+def reindex_deleted_tag(sender, instance, **kwargs):
+    item_ids = getattr(instance, '_search_item_ids', None)
+    if item_ids:
+        search.index_items(item_ids)
+
+
+@receiver(post_delete, sender=PriceHistory)
+def refresh_latest_price(sender, instance, origin=None, **kwargs):
+    # Deleting an item or store cascades to its LatestPrice rows as well;
+    # recomputing each pair row by row would only waste queries.
+    origin_model = origin.model if isinstance(origin, QuerySet) else type(origin)
+    if origin_model in (Item, Store):
+        return
+    LatestPrice.objects.pair_changed(instance.item_id, instance.store_id)
+
+
+# Cache invalidation: each handler bumps the namespaces whose cached pages
+# can show the changed row (see catalog/cache.py).
+
+@receiver(post_save, sender=Item)
+@receiver(post_delete, sender=Item)
+def invalidate_item(sender, instance, **kwargs):
+    invalidate('items', item_namespace(instance.pk))
+
+
+@receiver(m2m_changed, sender=Item.tags.through)
+def invalidate_item_tags(sender, instance, action, reverse, pk_set, **kwargs):
+    if action not in ('post_add', 'post_remove', 'post_clear'):
+        return
+    if not reverse:
+        item_ids = [instance.pk]
+    elif action == 'post_clear':
+        item_ids = getattr(instance, '_search_cleared_item_ids', [])
+    else:
+        item_ids = pk_set or []
+    invalidate('items', 'tags', *(item_namespace(item_id) for item_id in item_ids))
+
+
+@receiver(post_save, sender=Tag)
+@receiver(post_delete, sender=Tag)
+def invalidate_tag(sender, instance, **kwargs):
+    # Item pages list their tags; 'tags' is part of every item page key.
+    invalidate('items', 'tags')
+
+
+@receiver(post_save, sender=Store)
+@receiver(post_delete, sender=Store)
+def invalidate_store(sender, instance, **kwargs):
+    invalidate('items', 'stores')
+
+
+@receiver(post_save, sender=PriceHistory)
+@receiver(post_delete, sender=PriceHistory)
+def invalidate_price_entry(sender, instance, **kwargs):
+    invalidate('items', item_namespace(instance.item_id))
+
+
+@receiver(post_save, sender=ItemSpecification)
+@receiver(post_delete, sender=ItemSpecification)
+def invalidate_item_specification(sender, instance, **kwargs):
+    # Listings filter and facet on specifications too.
+    invalidate('items', item_namespace(instance.item_id))
+
+
+@receiver(post_save, sender=AttributeGroup)
+@receiver(post_delete, sender=AttributeGroup)
+@receiver(post_save, sender=AttributeDefinition)
+@receiver(post_delete, sender=AttributeDefinition)
+def invalidate_attributes(sender, instance, **kwargs):
+    invalidate('attributes')
+
+
+@receiver(post_save, sender=PriceHistory)
+def evaluate_price_alerts(sender, instance, created, raw=False, **kwargs):
+    if created and not raw:
+        evaluate_entries([instance])
+
+
+@receiver(post_save, sender=PriceAlert)
+@receiver(post_delete, sender=PriceAlert)
+def invalidate_alert_thresholds(sender, instance, **kwargs):
+    invalidate(alert_namespace(instance.item_id))
+
+
+# Unit prices are recomputed after commit, once LatestPrice is up to date.
+
+@receiver(post_save, sender=PriceHistory)
+@receiver(post_delete, sender=PriceHistory)
+def refresh_entry_unit_prices(sender, instance, raw=False, **kwargs):
+    if not raw:
+        schedule_refresh([instance.item_id])
+
+
+@receiver(post_save, sender=ItemSpecification)
+@receiver(post_delete, sender=ItemSpecification)
+def refresh_specification_unit_prices(sender, instance, raw=False, **kwargs):
+    if not raw:
+        schedule_refresh([instance.item_id])
+
+
+@receiver(post_save, sender=AttributeDefinition)
+def refresh_attribute_unit_prices(sender, instance, created, raw=False, **kwargs):
+    # A changed unit or value type affects every item using the attribute.
+    if not created and not raw:
+        schedule_refresh(instance.item_values.values_list('item_id', flat=True))
+
+
+@receiver(post_save, sender=ExchangeRate)
+@receiver(post_delete, sender=ExchangeRate)
+def invalidate_exchange_rates(sender, instance, raw=False, **kwargs):
+    # Listings show converted prices, so they go stale with the rates.
+    invalidate(RATES_NAMESPACE, 'items')
+    if not raw:
+        # Unit prices are ranked in the base currency.
+        transaction.on_commit(lambda: refresh_currency_unit_prices([instance.currency]))
+
+
+@receiver(post_save, sender=Item)
+def make_item_thumbnails(sender, instance, raw=False, **kwargs):
+    # After commit, so a rolled back upload doesn't get thumbnails.
+    if instance.image and not raw:
+        item_id, name = instance.pk, instance.image.name
+        transaction.on_commit(lambda: generate_thumbnails(item_id, name))
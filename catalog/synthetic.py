@@ -0,0 +1,248 @@
+# PriceTracker/catalog/synthetic.py
+"""Deterministic synthetic catalogs for benchmarking.
+
+The same seed and sizes always produce the same names, tags, specifications
+and prices (database ids aside). Unique names carry the seed, so catalogs
+with different seeds can share a database. Bulk tables are written with
+executemany() on pre-adapted rows, in batches of one transaction each;
+models, signals and save() are bypassed, so the derived tables are rebuilt
+at the end.
+"""
+import datetime
+import time
+from dataclasses import dataclass, field
+
+import numpy as np
+from django.db import connections, router, transaction
+from django.utils import timezone
+
+from . import search
+from .cache import bump
+from .models import (
+    AttributeDefinition, AttributeGroup, Item, ItemSpecification, LatestPrice, PriceHistory, Store, Tag,
+)
+from .tagging import ItemTag
+from .unitprice import rebuild_unit_prices
+
+SYLLABLES = (
+    'ka', 'ro', 'mi', 'ta', 'ne', 'lo', 'pa', 'su', 'vi', 'de', 'gu', 'ba', 'le', 'fo', 'ri', 'zo',
+    'an', 'el', 'is', 'or', 'um', 'ex', 'mo',
+)
+NUMBER_UNITS = ('g', 'ml', 'kg', 'l', 'cm', 'W', 'pcs', 'mAh')
+TEXT_VALUES = ('red', 'blue', 'green', 'black', 'white', 'steel', 'glass', 'wood', 'cotton', 'plastic')
+SALE_SHARE = 0.1
+
+
+@dataclass
+class SyntheticCatalog:
+    items: int = 1000
+    tags: int = 50
+    stores: int = 20
+    prices: int = 100_000
+    attributes: int = 20
+    specs_per_item: int = 5
+    days: int = 365
+    seed: int = 42
+    end: datetime.date = datetime.date(2025, 1, 1)
+    batch_size: int = 5000
+    report: dict = field(default_factory=dict)
+
+    def __post_init__(self):
+        self.rng = np.random.default_rng(self.seed)
+        self.vocabulary = self._words(max(200, self.tags * 2, self.attributes))
+        self.connection = connections[router.db_for_write(PriceHistory)]
+        self.start = timezone.make_aware(datetime.datetime.combine(self.end, datetime.time.min)) - datetime.timedelta(days=self.days)
+
+    def _words(self, count):
+        """``count`` distinct words of two or three syllables.
+
+        There are only a few thousand such words, so a repeat gets its
+        position appended instead of being redrawn, which would never end
+        for large vocabularies.
+        """
+        words = []
+        seen = set()
+        while len(words) < count:
+            word = ''.join(self.rng.choice(SYLLABLES, size=int(self.rng.integers(2, 4))))
+            if word in seen:
+                word = f"{word}{len(words)}"
+            seen.add(word)
+            words.append(word)
+        return words
+
+    def _timed(self, name, step):
+        started = time.perf_counter()
+        result = step()
+        self.report[name] = {'rows': result, 'seconds': round(time.perf_counter() - started, 2)}
+        return result
+
+    def _insert(self, model, field_names, rows):
+        """executemany() INSERT of plain tuples, adapting values as Django would.
+
+        Adapted values are memoized per column; the generators below draw
+        prices and timestamps from small sets, so that stays cheap.
+        """
+        fields = [model._meta.get_field(name) for name in field_names]
+        quote = self.connection.ops.quote_name
+        sql = 'INSERT INTO {} ({}) VALUES ({})'.format(
+            quote(model._meta.db_table),
+            ', '.join(quote(f.column) for f in fields),
+            ', '.join(['%s'] * len(fields)),
+        )
+        memos = [{} for _ in fields]
+
+        def adapt(index, value):
+            memo = memos[index]
+            if value not in memo:
+                memo[value] = fields[index].get_db_prep_save(value, self.connection)
+            return memo[value]
+
+        written = 0
+        batch = []
+        with self.connection.cursor() as cursor:
+            for row in rows:
+                batch.append(tuple(adapt(index, value) for index, value in enumerate(row)))
+                if len(batch) >= self.batch_size:
+                    with transaction.atomic(using=self.connection.alias):
+                        cursor.executemany(sql, batch)
+                    written += len(batch)
+                    batch = []
+            if batch:
+                with transaction.atomic(using=self.connection.alias):
+                    cursor.executemany(sql, batch)
+                written += len(batch)
+        return written
+
+    def create_stores(self):
+        self.store_ids = [
+            store.pk for store in Store.objects.bulk_create(
+                [Store(name=f"Synthetic Store {self.seed}-{n:04d}", website_url=f"https://store{n}.example.com") for n in range(self.stores)],
+                batch_size=self.batch_size,
+            )
+        ]
+        return len(self.store_ids)
+
+    def create_tags(self):
+        self.tag_ids = [
+            tag.pk for tag in Tag.objects.bulk_create(
+                [Tag(name=f"{self.vocabulary[n].title()} {self.seed}-{n:03d}") for n in range(self.tags)],
+                batch_size=self.batch_size,
+            )
+        ]
+        return len(self.tag_ids)
+
+    def create_attributes(self):
+        groups = AttributeGroup.objects.bulk_create(
+            [AttributeGroup(name=f"Synthetic Group {self.seed}-{n}", display_order=n) for n in range(max(1, self.attributes // 5))]
+        )
+        attributes = []
+        for n in range(self.attributes):
+            # Half numeric, a quarter boolean, the rest text.
+            value_type = 'number' if n % 4 < 2 else ('boolean' if n % 4 == 2 else 'text')
+            attributes.append(AttributeDefinition(
+                group=groups[n % len(groups)], name=f"Synthetic {self.vocabulary[n]} {n}",
+                slug=f"synthetic-{self.seed}-{n}", value_type=value_type, display_order=n,
+                unit=NUMBER_UNITS[n % len(NUMBER_UNITS)] if value_type == 'number' else None,
+                # The first attribute (grams) is the package size, so unit prices get computed.
+                is_package_size=n == 0,
+            ))
+        self.attributes_created = AttributeDefinition.objects.bulk_create(attributes)
+        return len(self.attributes_created)
+
+    def create_items(self):
+        self.item_ids = []
+        words = np.asarray(self.vocabulary)
+        for start in range(0, self.items, self.batch_size):
+            count = min(self.batch_size, self.items - start)
+            name_words = self.rng.choice(words, size=(count, 3))
+            batch = [
+                Item(
+                    name=f"{' '.join(name_words[n]).title()} #{start + n}",
+                    description=f"Synthetic product {start + n} made of {name_words[n][2]}.",
+                )
+                for n in range(count)
+            ]
+            with transaction.atomic(using=self.connection.alias):
+                self.item_ids.extend(item.pk for item in Item.objects.bulk_create(batch))
+        return len(self.item_ids)
+
+    def item_tag_rows(self):
+        tag_ids = np.asarray(self.tag_ids)
+        for item_id in self.item_ids:
+            for tag_id in self.rng.choice(tag_ids, size=min(len(tag_ids), int(self.rng.integers(1, 4))), replace=False):
+                yield item_id, int(tag_id)
+
+    def specification_rows(self):
+        stamp = self.start
+        per_item = min(self.specs_per_item, len(self.attributes_created))
+        for item_id in self.item_ids:
+            for index in self.rng.choice(len(self.attributes_created), size=per_item, replace=False):
+                attribute = self.attributes_created[index]
+                numeric = boolean = None
+                if attribute.value_type == 'number':
+                    numeric = int(self.rng.integers(1, 100)) * 10
+                    text = str(numeric)
+                elif attribute.value_type == 'boolean':
+                    boolean = bool(self.rng.integers(0, 2))
+                    text = 'Yes' if boolean else 'No'
+                else:
+                    text = TEXT_VALUES[int(self.rng.integers(0, len(TEXT_VALUES)))]
+                yield item_id, attribute.pk, text, numeric, boolean, stamp, stamp
+
+    def price_rows(self):
+        """Price observations spread over ``days``, each item at 1-5 stores.
+
+        Each item has a log-normal base price. Every observation varies
+        around it by a few percent, and about 10% are sales marked down
+        from a higher pre-sale price. Timestamps fall on whole hours.
+        """
+        store_ids = np.asarray(self.store_ids)
+        per_item, extra = divmod(self.prices, max(1, len(self.item_ids)))
+        hours = self.days * 24
+        stamps = {}
+        for position, item_id in enumerate(self.item_ids):
+            count = per_item + (1 if position < extra else 0)
+            if not count:
+                continue
+            stores = self.rng.choice(store_ids, size=min(len(store_ids), int(self.rng.integers(1, 6))), replace=False)
+            base = float(np.exp(self.rng.normal(7.0, 1.0)))
+            row_stores = stores[self.rng.integers(0, len(stores), count)]
+            row_hours = np.sort(self.rng.integers(0, hours, count))
+            prices = np.maximum(1, np.rint(base * np.exp(self.rng.normal(0, 0.08, count)))).astype(np.int64)
+            on_sale = self.rng.random(count) < SALE_SHARE
+            for store_id, hour, price, sale in zip(row_stores.tolist(), row_hours.tolist(), prices.tolist(), on_sale.tolist()):
+                if hour not in stamps:
+                    stamps[hour] = self.start + datetime.timedelta(hours=hour)
+                yield item_id, store_id, price, 'HUF', stamps[hour], sale, (price * 6 // 5) if sale else None, 1
+
+    def rebuild_derived(self):
+        counts = {'latest_prices': LatestPrice.objects.rebuild(batch_size=self.batch_size)}
+        if search.is_available():
+            counts['search_index'] = search.rebuild_index()
+        counts['unit_prices'] = rebuild_unit_prices()
+        bump('items', 'tags', 'stores', 'attributes', 'unit_prices')
+        return counts
+
+    def generate(self, derived=True):
+        """Writes the catalog; returns {step: {'rows': ..., 'seconds': ...}}."""
+        self._timed('stores', self.create_stores)
+        self._timed('tags', self.create_tags)
+        self._timed('attributes', self.create_attributes)
+        self._timed('items', self.create_items)
+        self._timed('item_tags', lambda: self._insert(ItemTag, ['item', 'tag'], self.item_tag_rows()))
+        self._timed('specifications', lambda: self._insert(
+            ItemSpecification,
+            ['item', 'attribute', 'value_text', 'value_numeric', 'value_boolean', 'created_at', 'updated_at'],
+            self.specification_rows(),
+        ))
+        self._timed('price_history', lambda: self._insert(
+            PriceHistory,
+            ['item', 'store', 'price', 'currency', 'date_recorded', 'on_sale', 'pre_sale_price', 'observation_count'],
+            self.price_rows(),
+        ))
+        if derived:
+            started = time.perf_counter()
+            for name, rows in self.rebuild_derived().items():
+                self.report[name] = {'rows': rows}
+            self.report['derived_seconds'] = round(time.perf_counter() - started, 2)
+        return self.report
@@ -0,0 +1,83 @@
+# PriceTracker/catalog/tagging.py
+from django.db.models import Count, QuerySet
+from django.db.models.functions import Lower
+
+from .models import Item, Tag
+
+ItemTag = Item.tags.through
+
+
+def parse_tag_names(raw):
+    """Splits the comma-separated ``tags`` query parameter."""
+    return [tag.strip() for tag in raw.split(',') if tag.strip()]
+
+
+def resolve_tag_ids(tag_names):
+    """Maps tag names (case-insensitively) to ids in a single query.
+
+    Returns None if any of the names doesn't exist, since no item can carry
+    a tag that isn't there.
+    """
+    wanted = {name.lower() for name in tag_names}
+    if not wanted:
+        return []
+    # Matches the LOWER(name) expression index on Tag.
+    found = dict(
+        Tag.objects.annotate(lower_name=Lower('name'))
+        .filter(lower_name__in=wanted)
+        .values_list('id', 'lower_name')
+    )
+    if set(found.values()) != wanted:
+        return None
+    return list(found)
+
+
+def filter_items_by_tags(queryset, tag_names):
+    """Narrows an Item queryset to items carrying *all* of the given tags.
+
+    The intersection is a single GROUP BY / HAVING subquery over the
+    item-tag table, so the query shape doesn't change with the number of
+    selected tags and no DISTINCT is needed.
+    """
+    if not tag_names:
+        return queryset
+    tag_ids = resolve_tag_ids(tag_names)
+    if not tag_ids:
+        return queryset.none()
+    matching = (
+        ItemTag.objects.filter(tag_id__in=tag_ids)
+        .values('item_id')
+        .annotate(matched=Count('tag_id'))
+        .filter(matched=len(tag_ids))
+        .values('item_id')
+    )
+    return queryset.filter(pk__in=matching)
+
+
+def tag_facet_counts(items):
+    """Returns {tag_id: number of items in ``items`` carrying that tag}.
+
+    ``items`` may be an Item queryset (counted with a subquery) or an
+    already evaluated list of items.
+    """
+    if isinstance(items, QuerySet):
+        item_filter = {'item_id__in': items.values('pk')}
+    else:
+        item_filter = {'item_id__in': [item.pk for item in items]}
+    counts = (
+        ItemTag.objects.filter(**item_filter)
+        .values('tag_id')
+        .annotate(item_count=Count('item_id'))
+        .order_by()
+        .values_list('tag_id', 'item_count')
+    )
+    return dict(counts)
+
+
+def tag_cloud(items):
+    """All tags by name, each annotated with ``item_count`` for ``items``."""
+    counts = tag_facet_counts(items)
+    tags = list(Tag.objects.order_by('name'))
+    for tag in tags:
+        tag.item_count = counts.get(tag.pk, 0)
+    return tags
@@ -0,0 +1,37 @@
+# PriceTracker/catalog/templatetags/catalog_images.py
+from django import template
+from django.utils.html import format_html
+
+from catalog.thumbnails import WEBP, available_variants, generate_thumbnails
+
+register = template.Library()
+
+
+def _srcset(variants):
+    return ', '.join(f"{url} {width}w" for width, url in variants)
+
+
+@register.simple_tag
+def responsive_image(item, sizes, alt='', css_class=''):
+    """A lazily loaded <picture> with WebP and fallback thumbnails of ``item.image``.
+
+    Until the thumbnails exist the original image is used and their
+    generation is started in the background.
+    """
+    if not item.image:
+        return ''
+    alt = alt or item.name
+    variants = available_variants(item.image.name)
+    fallback = [variant for fmt, variant in variants.items() if fmt != WEBP]
+    if not fallback:
+        generate_thumbnails(item.pk, item.image.name)
+        return format_html(
+            '<img src="{}" alt="{}" class="{}" loading="lazy" decoding="async">', item.image.url, alt, css_class,
+        )
+    fallback = fallback[0]
+    webp = variants.get(WEBP)
+    source = format_html('<source type="image/webp" srcset="{}" sizes="{}">', _srcset(webp), sizes) if webp else ''
+    return format_html(
+        '<picture>{}<img src="{}" srcset="{}" sizes="{}" alt="{}" class="{}" loading="lazy" decoding="async"></picture>',
+        source, fallback[0][1], _srcset(fallback), sizes, alt, css_class,
+    )
@@ -1,10 +1,62 @@
 # catalog/tests.py
-from django.test import TestCase, Client
+from django.http import Http404, HttpResponse
+from django.test import SimpleTestCase, TestCase, TransactionTestCase, Client
 from django.urls import reverse
 from django.utils import timezone
+from django.conf import settings
+from django.core import mail
+from django.core.cache import cache
+from django.core.exceptions import MiddlewareNotUsed
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import call_command
+from django.db import connection, connections, transaction
+from django.db.models import Max, Sum
+from django.template import Template
+from django.test import AsyncRequestFactory, RequestFactory, override_settings
+from django.test.utils import CaptureQueriesContext
+from asgiref.sync import async_to_sync, iscoroutinefunction
 from decimal import Decimal
-from .models import Item, Store, PriceHistory, Tag
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from io import BytesIO, StringIO
+import asyncio
+import csv
+import datetime
+import gzip
+import json
+import os
+import re
+import shutil
+import tempfile
+import threading
+import time
+from unittest import skipUnless
+from unittest.mock import patch
+from PIL import Image
+from .models import (
+    AttributeDefinition, AttributeGroup, ExchangeRate, Item, ItemSpecification, LatestPrice, PriceAlert,
+    PriceHistory, PriceRollup, ProductPageState, Store, Tag, UnitPrice,
+)
 from .forms import PriceHistoryForm
+from . import async_views, search, tagging
+from .benchmark import compare, ingestion_stress, run_load
+from .alerts import ThresholdIndex, evaluate_entries
+from .analytics import PriceSeries, item_price_stats, local_day_ordinals, price_stats, rolling_stats
+from .cache import aget_or_build, cache_stats, get_or_build, reset_cache_stats
+from .currency import MissingRate, RateCache, best_offer, get_rate_cache, load_rates
+from .unitprice import best_value, rebuild_unit_prices, to_base_unit
+from .facets import filter_items_by_specs, parse_spec_filters, spec_facets
+from .export import export_chunks, export_rows
+from .history import downsample_price_history
+from .thumbnails import available_variants, thumbnail_name
+from . import profiling
+from .routers import READ_ALIAS, ReadWriteRouter
+from .archive import _table_months, archive_model, archive_price_history, ensure_archive_table, month_of
+from .synthetic import SyntheticCatalog
+from .ingest import PriceIngestor
+from . import scraper
+from .scraper import (
+    ExtractedPrice, HostLimiter, PriceRefresher, _to_decimal, get_extractor, load_targets, register_extractor,
+)
 
 
 class ItemModelTest(TestCase):
@@ -123,6 +175,34 @@ class ItemDetailViewTest(TestCase):
         self.assertContains(response, "149.99")
         self.assertContains(response, "Amazon")
 
+    def add_specs_and_prices(self, group_name, count):
+        group = AttributeGroup.objects.create(name=group_name, display_order=1)
+        store = Store.objects.create(name=f"{group_name} store")
+        for n in range(count):
+            attribute = AttributeDefinition.objects.create(
+                group=group, name=f"{group_name} {n}", value_type='number', unit='g',
+            )
+            ItemSpecification.objects.create(item=self.item, attribute=attribute, value_text=str(100 + n))
+            PriceHistory.objects.create(item=self.item, store=store, price=Decimal(100 + n))
+
+    def test_item_detail_query_count_is_constant(self):
+        url = reverse('catalog:item_detail', kwargs={'item_id': self.item.id})
+        self.add_specs_and_prices("Nutrition", 1)
+        cache.clear()
+        with CaptureQueriesContext(connection) as small:
+            self.client.get(url)
+
+        self.add_specs_and_prices("Packaging", 6)
+        self.add_specs_and_prices("Origin", 6)
+        cache.clear()
+        with self.assertNumQueries(len(small.captured_queries)):
+            response = self.client.get(url)
+        # Groups sharing a display_order are still listed once each.
+        self.assertContains(response, "<h3>Packaging</h3>", count=1)
+        self.assertContains(response, "<h3>Nutrition</h3>", count=1)
+        self.assertContains(response, "105 g")
+        self.assertContains(response, "Origin store")
+
 
 class PriceHistoryFormTest(TestCase):
     def setUp(self):
@@ -210,4 +290,1815 @@ class AddPriceEntryViewTest(TestCase):
         self.assertEqual(response.status_code, 200)
         data = response.json()
         self.assertEqual(data['store_id'], self.store.id)
-        self.assertEqual(data['product_url'], 'https://example.com/product')
\ No newline at end of file
+        self.assertEqual(data['product_url'], 'https://example.com/product')
+
+class SearchIndexTest(TestCase):
+    def setUp(self):
+        self.client = Client()
+        self.dairy = Tag.objects.create(name="Tejtermék")
+        self.rudi = Item.objects.create(name="Túró Rudi", description="Pöttyös classic")
+        self.milk = Item.objects.create(name="Milk 2.8%", description="Fresh milk for rudi lovers")
+        self.milk.tags.add(self.dairy)
+
+    def test_build_match_expression_quotes_tokens(self):
+        self.assertEqual(search.build_match_expression('foo "bar" OR'), '"foo"* "bar"* "OR"*')
+        self.assertEqual(search.build_match_expression('  ""  '), '')
+
+    def test_prefix_and_diacritic_insensitive_match(self):
+        self.assertEqual(search.ranked_item_ids('tur'), [self.rudi.id])
+
+    def test_name_match_ranks_above_description_match(self):
+        self.assertEqual(search.ranked_item_ids('rudi'), [self.rudi.id, self.milk.id])
+
+    def test_index_follows_tag_changes(self):
+        self.assertEqual(search.ranked_item_ids('tejtermek'), [self.milk.id])
+        self.rudi.tags.add(self.dairy)
+        self.assertCountEqual(search.ranked_item_ids('tejtermek'), [self.milk.id, self.rudi.id])
+        self.dairy.name = "Dairy"
+        self.dairy.save()
+        self.assertEqual(search.ranked_item_ids('tejtermek'), [])
+        self.dairy.delete()
+        self.assertEqual(search.ranked_item_ids('dairy'), [])
+
+    def test_index_follows_item_changes(self):
+        self.rudi.name = "Mini Rudi"
+        self.rudi.save()
+        self.assertEqual(search.ranked_item_ids('mini'), [self.rudi.id])
+        self.rudi.delete()
+        self.assertEqual(search.ranked_item_ids('mini'), [])
+
+    def test_rebuild_command(self):
+        with connection.cursor() as cursor:
+            cursor.execute(f"DELETE FROM {search.FTS_TABLE}")
+        self.assertEqual(search.ranked_item_ids('rudi'), [])
+        call_command('rebuild_search_index', stdout=StringIO())
+        self.assertEqual(search.ranked_item_ids('rudi'), [self.rudi.id, self.milk.id])
+
+    def test_ajax_search_combines_text_and_tags(self):
+        response = self.client.get(reverse('catalog:ajax_search_items'), {'q': 'rudi', 'tags': 'Tejtermék'})
+        self.assertContains(response, "Milk 2.8%")
+        self.assertNotContains(response, "Túró Rudi")
+
+    @override_settings(CATALOG_SEARCH_MAX_RESULTS=1)
+    def test_filters_apply_before_the_result_cap(self):
+        cache.clear()
+        # Unfiltered, the cap keeps only Túró Rudi.
+        self.assertEqual(search.ranked_item_ids('rudi'), [self.rudi.id])
+        response = self.client.get(reverse('catalog:ajax_search_items'), {'q': 'rudi', 'tags': 'Tejtermék'})
+        self.assertContains(response, "Milk 2.8%")
+        self.assertNotContains(response, "best matches")
+
+    @override_settings(CATALOG_SEARCH_MAX_RESULTS=1)
+    def test_capped_results_say_so(self):
+        results = search.search_items(Item.objects.all(), 'rudi')
+        self.assertEqual((results, results.truncated), ([self.rudi], True))
+        self.assertFalse(search.search_items(Item.objects.all(), 'tur').truncated)
+        cache.clear()
+        response = self.client.get(reverse('catalog:ajax_search_items'), {'q': 'rudi'})
+        self.assertContains(response, "Showing the 1 best matches")
+
+    def test_punctuation_only_query_falls_back_to_icontains(self):
+        self.assertEqual(list(search.search_items(Item.objects.all(), '%')), [self.milk])
+        self.assertEqual(list(search.search_items(Item.objects.all(), '!!!')), [])
+
+    def test_reindexing_is_chunked(self):
+        with connection.cursor() as cursor:
+            cursor.execute(f"DELETE FROM {search.FTS_TABLE}")
+        with patch.object(search, 'ID_CHUNK_SIZE', 1), CaptureQueriesContext(connection) as ctx:
+            search.index_items([self.rudi.id, self.milk.id])
+        self.assertEqual(len(ctx.captured_queries), 4)
+        self.assertEqual(search.ranked_item_ids('rudi'), [self.rudi.id, self.milk.id])
+
+
+class TagFilteringTest(TestCase):
+    def setUp(self):
+        self.client = Client()
+        self.tags = [Tag.objects.create(name=f"Tag {n}") for n in range(5)]
+        self.all_five = Item.objects.create(name="All five")
+        self.all_five.tags.set(self.tags)
+        self.first_two = Item.objects.create(name="First two")
+        self.first_two.tags.set(self.tags[:2])
+        self.untagged = Item.objects.create(name="Untagged")
+
+    def test_items_must_carry_every_selected_tag(self):
+        items = tagging.filter_items_by_tags(Item.objects.all(), ["tag 0", "TAG 1"])
+        self.assertCountEqual(items, [self.all_five, self.first_two])
+        items = tagging.filter_items_by_tags(Item.objects.all(), ["Tag 0", "Tag 4"])
+        self.assertCountEqual(items, [self.all_five])
+
+    def test_unknown_tag_matches_nothing(self):
+        items = tagging.filter_items_by_tags(Item.objects.all(), ["Tag 0", "Nope"])
+        self.assertEqual(list(items), [])
+
+    def test_query_count_does_not_grow_with_selected_tags(self):
+        names = [tag.name for tag in self.tags]
+        with self.assertNumQueries(2):
+            list(tagging.filter_items_by_tags(Item.objects.all(), names[:1]))
+        with self.assertNumQueries(2):
+            list(tagging.filter_items_by_tags(Item.objects.all(), names))
+
+    def test_facet_counts(self):
+        items = tagging.filter_items_by_tags(Item.objects.all(), ["Tag 0"])
+        counts = tagging.tag_facet_counts(items)
+        self.assertEqual(counts[self.tags[0].pk], 2)
+        self.assertEqual(counts[self.tags[4].pk], 1)
+        self.assertEqual(tagging.tag_facet_counts([self.untagged]), {})
+
+    def test_ajax_search_returns_facets(self):
+        response = self.client.get(reverse('catalog:ajax_search_items'), {'tags': 'Tag 2'})
+        self.assertContains(response, "All five")
+        self.assertNotContains(response, "First two")
+        self.assertContains(response, 'id="tagFacetsData"')
+        self.assertEqual(response.context['tag_facets']["Tag 1"], 1)
+
+
+class LatestPriceTest(TestCase):
+    def setUp(self):
+        self.client = Client()
+        self.item = Item.objects.create(name="Coffee")
+        self.aldi = Store.objects.create(name="Aldi")
+        self.lidl = Store.objects.create(name="Lidl")
+        self.now = timezone.now()
+
+    def record(self, store, price, days_ago=0, **kwargs):
+        return PriceHistory.objects.create(
+            item=self.item, store=store, price=Decimal(price),
+            date_recorded=self.now - timezone.timedelta(days=days_ago), **kwargs
+        )
+
+    def latest(self, store):
+        return LatestPrice.objects.get(item=self.item, store=store)
+
+    def test_newer_entry_replaces_older(self):
+        self.record(self.aldi, '100.00', days_ago=2)
+        newest = self.record(self.aldi, '90.00', days_ago=1)
+        self.record(self.aldi, '120.00', days_ago=5)
+        self.assertEqual(self.latest(self.aldi).price_entry, newest)
+        self.assertEqual(LatestPrice.objects.count(), 1)
+
+    def test_edit_and_delete_recompute(self):
+        old = self.record(self.aldi, '100.00', days_ago=2)
+        new = self.record(self.aldi, '90.00', days_ago=1)
+        new.date_recorded = self.now - timezone.timedelta(days=3)
+        new.save()
+        self.assertEqual(self.latest(self.aldi).price_entry, old)
+        new.store = self.lidl
+        new.save()
+        self.assertEqual(self.latest(self.lidl).price, Decimal('90.00'))
+        old.delete()
+        self.assertFalse(LatestPrice.objects.filter(store=self.aldi).exists())
+        self.item.delete()
+        self.assertFalse(LatestPrice.objects.exists())
+
+    def test_rebuild_command_matches_incremental_table(self):
+        self.record(self.aldi, '100.00', days_ago=2)
+        self.record(self.aldi, '95.00', days_ago=1)
+        self.record(self.lidl, '99.00', days_ago=3, product_url='https://lidl.example/coffee')
+        expected = set(LatestPrice.objects.values_list('item', 'store', 'price', 'product_url'))
+        LatestPrice.objects.all().delete()
+        call_command('rebuild_latest_prices', stdout=StringIO())
+        self.assertEqual(set(LatestPrice.objects.values_list('item', 'store', 'price', 'product_url')), expected)
+
+    def test_last_purchase_details_and_form_initial(self):
+        self.record(self.lidl, '99.00', days_ago=3)
+        self.record(self.aldi, '95.00', days_ago=1, product_url='https://aldi.example/coffee')
+        data = self.client.get(reverse('catalog:ajax_get_last_purchase_details', kwargs={'item_id': self.item.id})).json()
+        self.assertEqual(data, {'store_id': self.aldi.id, 'product_url': 'https://aldi.example/coffee'})
+        form = PriceHistoryForm(item_instance=self.item)
+        self.assertEqual(form.fields['store'].initial, self.aldi.id)
+        missing = self.client.get(reverse('catalog:ajax_get_last_purchase_details', kwargs={'item_id': 999}))
+        self.assertEqual(missing.status_code, 404)
+
+    def test_item_list_shows_lowest_current_price(self):
+        self.record(self.aldi, '150.00', days_ago=2)
+        self.record(self.aldi, '95.00', days_ago=1)
+        self.record(self.lidl, '99.00', days_ago=1)
+        Item.objects.create(name="Tea")
+        response = self.client.get(reverse('catalog:item_list'))
+        self.assertContains(response, "From <span class=\"price\">95.00 HUF</span> at Aldi", html=False)
+
+
+class QueryPlanTest(TestCase):
+    """Runs EXPLAIN QUERY PLAN over every SELECT a view issues.
+
+    A plan step that scans a table without an index, or sorts through a
+    temporary B-tree, fails the test. No ANALYZE is run, so SQLite plans
+    as if every table were large.
+    """
+    # Sorting a single item's specifications or an already filtered result
+    # set touches only those rows, never the whole table.
+    ALLOWED_SORTS = (
+        r'FROM "catalog_itemspecification" .* WHERE "catalog_itemspecification"\."item_id" = \d+ ORDER BY',
+        r'FROM "catalog_item" WHERE \(?"catalog_item"\."id" IN \(SELECT .* ORDER BY "catalog_item"\."name"',
+        # Listing the archive tables reads SQLite's small schema table.
+        r'FROM sqlite_master',
+    )
+    # Scans of a materialized subquery (e.g. the one Django wraps around a
+    # filtered window function) only read rows the inner query selected.
+    FULL_SCAN = re.compile(r'^SCAN (?!\(subquery-\d+\)|qualify\b)(?!.*\b(USING|VIRTUAL TABLE)\b)')
+    TEMP_SORT = re.compile(r'USE TEMP B-TREE FOR (ORDER BY|DISTINCT|RIGHT PART OF ORDER BY)')
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.tag = Tag.objects.create(name="Coffee")
+        cls.stores = [Store.objects.create(name=f"Store {n}") for n in range(3)]
+        cls.items = []
+        for n in range(5):
+            item = Item.objects.create(name=f"Arabica {n}", description="Whole beans")
+            item.tags.add(cls.tag)
+            for day in range(4):
+                for store in cls.stores:
+                    PriceHistory.objects.create(
+                        item=item, store=store, price=Decimal(1000 + day),
+                        date_recorded=timezone.now() - timezone.timedelta(days=day),
+                    )
+            cls.items.append(item)
+        group = AttributeGroup.objects.create(name="Details")
+        weight = AttributeDefinition.objects.create(group=group, name="Weight", slug='weight', value_type='number')
+        organic = AttributeDefinition.objects.create(group=group, name="Organic", slug='organic', value_type='boolean')
+        for n, item in enumerate(cls.items):
+            ItemSpecification.objects.create(item=item, attribute=weight, value_text=str(250 * (n + 1)))
+            ItemSpecification.objects.create(item=item, attribute=organic, value_text='yes' if n % 2 else 'no')
+
+    def setUp(self):
+        # Cached pages would hide the queries under test.
+        cache.clear()
+
+    def plan_violations(self, queries):
+        violations = []
+        with connection.cursor() as cursor:
+            for query in queries:
+                sql = query['sql']
+                if not sql.lstrip().upper().startswith('SELECT'):
+                    continue
+                cursor.execute(f"EXPLAIN QUERY PLAN {sql}")
+                for row in cursor.fetchall():
+                    detail = row[-1]
+                    if self.FULL_SCAN.search(detail) or self.TEMP_SORT.search(detail):
+                        if not any(re.search(pattern, sql) for pattern in self.ALLOWED_SORTS):
+                            violations.append(f"{detail}\n    {sql}")
+        return violations
+
+    def assertIndexedPlans(self, url, **params):
+        with CaptureQueriesContext(connection) as ctx:
+            response = self.client.get(url, params)
+        self.assertEqual(response.status_code, 200)
+        violations = self.plan_violations(ctx.captured_queries)
+        self.assertFalse(violations, "Queries fell back to a scan or temp sort:\n" + "\n".join(violations))
+
+    def test_item_list(self):
+        self.assertIndexedPlans(reverse('catalog:item_list'))
+        self.assertIndexedPlans(reverse('catalog:item_list'), q='arabica', tags='Coffee')
+
+    def test_ajax_search_items(self):
+        self.assertIndexedPlans(reverse('catalog:ajax_search_items'), q='arab')
+        self.assertIndexedPlans(reverse('catalog:ajax_search_items'), tags='coffee')
+
+    def test_spec_filters(self):
+        self.assertIndexedPlans(
+            reverse('catalog:ajax_search_items'), **{'spec.weight__lte': '750', 'spec.organic': 'yes'}
+        )
+
+    def test_best_value(self):
+        self.assertIndexedPlans(reverse('catalog:tag_best_value', kwargs={'tag_name': 'coffee'}))
+
+    def test_item_detail(self):
+        self.assertIndexedPlans(reverse('catalog:item_detail', kwargs={'item_id': self.items[0].id}))
+
+    def test_last_purchase_details(self):
+        self.assertIndexedPlans(
+            reverse('catalog:ajax_get_last_purchase_details', kwargs={'item_id': self.items[0].id})
+        )
+
+    def test_last_purchase_details_batch(self):
+        ids = ','.join(str(item.id) for item in self.items[:20])
+        self.assertIndexedPlans(reverse('catalog:ajax_get_last_purchase_details_batch'), ids=ids)
+
+    def test_price_history_api(self):
+        url = reverse('catalog:api_price_history', kwargs={'item_id': self.items[0].id})
+        first_page = self.client.get(url, {'limit': 2}).json()
+        self.assertIndexedPlans(url, limit=2, cursor=first_page['next_cursor'])
+
+    def test_latest_price_refresh(self):
+        with CaptureQueriesContext(connection) as ctx:
+            LatestPrice.objects.refresh_pairs([(self.items[0].id, self.stores[0].id)])
+        self.assertEqual(self.plan_violations(ctx.captured_queries), [])
+
+
+class PriceHistoryApiTest(TestCase):
+    def setUp(self):
+        self.client = Client()
+        self.item = Item.objects.create(name="Butter")
+        self.spar = Store.objects.create(name="Spar")
+        self.tesco = Store.objects.create(name="Tesco")
+        start = timezone.make_aware(timezone.datetime(2024, 1, 1))
+        for hour in range(0, 72, 6):
+            for store, base in ((self.spar, 500), (self.tesco, 520)):
+                PriceHistory.objects.create(
+                    item=self.item, store=store, price=Decimal(base + hour),
+                    date_recorded=start + timezone.timedelta(hours=hour),
+                )
+        self.url = reverse('catalog:api_price_history', kwargs={'item_id': self.item.id})
+
+    def test_cursor_pages_cover_history_once(self):
+        seen, cursor = [], None
+        while True:
+            params = {'limit': 5, **({'cursor': cursor} if cursor else {})}
+            data = self.client.get(self.url, params).json()
+            seen.extend(row['id'] for row in data['results'])
+            cursor = data['next_cursor']
+            if not cursor:
+                break
+        expected = list(PriceHistory.objects.filter(item=self.item).order_by('-date_recorded', '-id').values_list('id', flat=True))
+        self.assertEqual(seen, expected)
+
+    def test_filters_and_bad_input(self):
+        data = self.client.get(self.url, {'store': self.tesco.id, 'since': '2024-01-03'}).json()
+        self.assertEqual({row['store'] for row in data['results']}, {"Tesco"})
+        self.assertEqual(len(data['results']), 4)
+        self.assertEqual(self.client.get(self.url, {'cursor': 'not-a-cursor'}).status_code, 400)
+        self.assertEqual(self.client.get(self.url, {'resolution': 'hour'}).status_code, 400)
+        self.assertEqual(self.client.get(self.url, {'since': 'yesterday'}).status_code, 400)
+        missing = reverse('catalog:api_price_history', kwargs={'item_id': 999})
+        self.assertEqual(self.client.get(missing).status_code, 404)
+
+    def test_daily_downsampling_per_store(self):
+        data = self.client.get(self.url, {'resolution': 'day'}).json()
+        self.assertEqual(len(data['results']), 6)
+        first = data['results'][0]
+        self.assertEqual(first['store'], "Spar")
+        self.assertEqual(first['count'], 4)
+        self.assertEqual((first['min'], first['max'], first['avg'], first['last']), ('500.00', '518.00', '509.00', '518.00'))
+
+    def test_monthly_downsampling(self):
+        data = self.client.get(self.url, {'resolution': 'month'}).json()
+        self.assertEqual([row['count'] for row in data['results']], [12, 12])
+
+
+@override_settings(CATALOG_INGEST_TOKEN='secret')
+class PriceIngestionTest(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.client = Client()
+        self.item = Item.objects.create(name="Flour")
+        self.store = Store.objects.create(name="Penny")
+        self.url = reverse('catalog:api_ingest_prices')
+
+    def post(self, body, content_type='application/json', token='secret'):
+        return self.client.post(self.url, body, content_type=content_type, HTTP_AUTHORIZATION=f"Bearer {token}")
+
+    def test_rows_resolve_by_id_or_name(self):
+        rows = [
+            {'item': self.item.id, 'store': "Penny", 'price': '300', 'date_recorded': '2024-05-01'},
+            {'item_name': "Flour", 'store_id': str(self.store.id), 'price': '280.50', 'date_recorded': '2024-05-02T10:00:00'},
+        ]
+        response = self.post(json.dumps({'rows': rows}))
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(response.json()['created'], 2)
+        latest = LatestPrice.objects.get(item=self.item, store=self.store)
+        self.assertEqual(latest.price, Decimal('280.50'))
+
+    def test_invalid_rows_use_form_rules(self):
+        body = "\n".join([
+            json.dumps({'item': "Flour", 'store': "Penny", 'price': '250', 'on_sale': 'yes'}),
+            json.dumps({'item': "Flour", 'store': "Penny", 'price': '250', 'on_sale': True, 'pre_sale_price': '200'}),
+            json.dumps({'item': "Bread", 'store': 999, 'price': 'abc'}),
+            "{not json",
+            json.dumps({'item': "Flour", 'store': "Penny", 'price': '260', 'on_sale': True, 'pre_sale_price': '300'}),
+            json.dumps({'item': "Flour", 'store': "Penny", 'price': '270', 'date_recorded': '2024-02-30'}),
+            json.dumps({'item': "Flour", 'store': "Penny", 'price': '280', 'date_recorded': '2024-02-30T10:00'}),
+        ])
+        data = self.post(body, content_type='application/x-ndjson').json()
+        self.assertEqual((data['received'], data['created'], data['rejected']), (7, 1, 6))
+        errors = {entry['row']: entry['errors'] for entry in data['errors']}
+        self.assertIn("Original price is required", errors[1]['pre_sale_price'][0])
+        self.assertIn("must be greater", errors[2]['pre_sale_price'][0])
+        self.assertEqual(set(errors[3]), {'item', 'store', 'price'})
+        self.assertIn('__all__', errors[4])
+        self.assertEqual(set(errors[6]), {'date_recorded'})
+        self.assertEqual(set(errors[7]), {'date_recorded'})
+
+    def test_undecodable_ndjson_line_is_rejected(self):
+        body = b"\n".join([
+            json.dumps({'item': "Flour", 'store': "Penny", 'price': '250'}).encode(),
+            b'{"item": "Flour", "store": "Penny", "price": "\xff"}',
+        ])
+        data = self.post(body, content_type='application/x-ndjson').json()
+        self.assertEqual((data['received'], data['created'], data['rejected']), (2, 1, 1))
+        self.assertIn('__all__', data['errors'][0]['errors'])
+
+    @override_settings(DATA_UPLOAD_MAX_MEMORY_SIZE=1000, CATALOG_INGEST_MAX_JSON_SIZE=1000)
+    def test_large_uploads(self):
+        rows = [{'item': "Flour", 'store': "Penny", 'price': str(100 + n)} for n in range(50)]
+        body = "\n".join(json.dumps(row) for row in rows)
+        self.assertGreater(len(body), 1000)
+        # NDJSON is streamed, so the upload memory limit doesn't apply.
+        response = self.post(body, content_type='application/x-ndjson')
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(response.json()['created'], 50)
+
+        response = self.post(json.dumps(rows))
+        self.assertEqual(response.status_code, 413)
+        self.assertIn("NDJSON", response.json()['error'])
+
+    def test_requires_token(self):
+        self.assertEqual(self.post("[]", token='wrong').status_code, 403)
+        with override_settings(CATALOG_INGEST_TOKEN=''):
+            self.assertEqual(self.post("[]", token='').status_code, 403)
+
+    def test_batches_keep_query_count_flat(self):
+        rows = [{'item': "Flour", 'store': "Penny", 'price': str(100 + n)} for n in range(50)]
+        # Two name lookups, the item's alert thresholds (cached after the
+        # first batch), then per batch: savepoint, INSERT, LatestPrice read,
+        # LatestPrice write, release.
+        with self.assertNumQueries(3 + 5 * 5):
+            report = PriceIngestor(batch_size=10).ingest(rows)
+        self.assertEqual(report.created, 50)
+
+    def test_import_command_reads_csv(self):
+        with tempfile.NamedTemporaryFile('w', suffix='.csv', delete=False) as handle:
+            handle.write("item,store,price,date_recorded,on_sale,pre_sale_price\n")
+            handle.write("Flour,Penny,310,2024-06-01,false,\n")
+            handle.write("Flour,Penny,290,2024-06-02,true,310\n")
+        self.addCleanup(os.remove, handle.name)
+        out = StringIO()
+        call_command('import_prices', handle.name, '--batch-size', '1', stdout=out, stderr=StringIO())
+        self.assertIn("Imported 2 of 2 rows", out.getvalue())
+        self.assertEqual(LatestPrice.objects.get(item=self.item).pre_sale_price, Decimal('310'))
+
+
+class _StubShopHandler(BaseHTTPRequestHandler):
+    """Serves /product/<price> pages with an ETag; /broken returns 500, /stale always 304."""
+    requests = []
+
+    def do_GET(self):
+        type(self).requests.append((self.path, self.headers.get('If-None-Match')))
+        if self.path == '/broken':
+            self.send_response(500)
+            self.end_headers()
+            return
+        if self.path == '/stale':
+            self.send_response(304)
+            self.end_headers()
+            return
+        price = self.path.rsplit('/', 1)[-1]
+        etag = f'"{price}"'
+        if self.headers.get('If-None-Match') == etag:
+            self.send_response(304)
+            self.end_headers()
+            return
+        body = (
+            '<html><head><script type="application/ld+json">'
+            f'{{"@type": "Product", "offers": {{"price": "{price}", "priceCurrency": "HUF"}}}}'
+            '</script></head></html>'
+        ).encode()
+        self.send_response(200)
+        self.send_header('ETag', etag)
+        self.send_header('Content-Type', 'text/html')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+class PriceRefresherTest(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.server = ThreadingHTTPServer(('127.0.0.1', 0), _StubShopHandler)
+        threading.Thread(target=cls.server.serve_forever, daemon=True).start()
+        cls.base_url = f"http://127.0.0.1:{cls.server.server_port}"
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.server.shutdown()
+        cls.server.server_close()
+        super().tearDownClass()
+
+    def setUp(self):
+        _StubShopHandler.requests = []
+        self.store = Store.objects.create(name="Stub Shop", website_url=self.base_url)
+        self.items = []
+        for n, path in enumerate(['/product/1299.00', '/product/450.50', '/broken']):
+            item = Item.objects.create(name=f"Product {n}")
+            PriceHistory.objects.create(
+                item=item, store=self.store, price=Decimal('1.00'),
+                date_recorded=timezone.now() - timezone.timedelta(days=1),
+                product_url=self.base_url + path,
+            )
+            self.items.append(item)
+
+    def refresh(self):
+        refresher = PriceRefresher(concurrency=4, per_host=2, per_host_rate=0, batch_size=2)
+        return async_to_sync(refresher.run)(load_targets())
+
+    def test_refresh_records_prices_and_uses_etags(self):
+        stats = self.refresh()
+        self.assertEqual((stats.fetched, stats.recorded, stats.failed), (2, 2, 1))
+        self.assertEqual(LatestPrice.objects.get(item=self.items[0]).price, Decimal('1299.00'))
+        self.assertEqual(ProductPageState.objects.get(url=self.base_url + '/product/450.50').etag, '"450.50"')
+
+        stats = self.refresh()
+        self.assertEqual((stats.not_modified, stats.recorded), (2, 0))
+        self.assertIn(('/product/1299.00', '"1299.00"'), _StubShopHandler.requests)
+
+    def test_bad_pages_do_not_abort_the_run(self):
+        def extract(text, target):
+            if target.url.endswith('/450.50'):
+                raise ValueError("malformed page")
+            return scraper.extract_structured_price(text, target)
+        register_extractor('127.0.0.1')(extract)
+        self.addCleanup(scraper._EXTRACTORS.pop, '127.0.0.1')
+        stale = Item.objects.create(name="Stale product")
+        PriceHistory.objects.create(item=stale, store=self.store, price=Decimal('1.00'), product_url=self.base_url + '/stale')
+
+        with self.assertLogs('catalog.scraper', 'ERROR'):
+            stats = self.refresh()
+        self.assertEqual((stats.fetched, stats.unparsed, stats.not_modified, stats.recorded), (2, 1, 1, 1))
+        self.assertEqual(LatestPrice.objects.get(item=self.items[0]).price, Decimal('1299.00'))
+        self.assertEqual(ProductPageState.objects.get(url=self.base_url + '/stale').last_status, 304)
+
+    def test_malformed_urls_fail_alone(self):
+        broken = Item.objects.create(name="Broken link")
+        PriceHistory.objects.create(item=broken, store=self.store, price=Decimal('1.00'), product_url='http://127.0.0.1:abc/x')
+        stats = self.refresh()
+        self.assertEqual((stats.fetched, stats.recorded, stats.failed), (2, 2, 2))
+        self.assertIsNone(ProductPageState.objects.get(url='http://127.0.0.1:abc/x').last_status)
+
+    def test_targets_are_keyed_on_the_fetched_host(self):
+        self.store.website_url = "https://www.stub-shop.example"
+        self.store.save()
+        self.assertEqual({target.host for target in load_targets()}, {'127.0.0.1'})
+
+    def test_host_limiter_caps_concurrency(self):
+        limiter = HostLimiter(concurrency=2, requests_per_second=0)
+        active = peak = 0
+
+        async def request():
+            nonlocal active, peak
+            async with limiter:
+                active += 1
+                peak = max(peak, active)
+                await asyncio.sleep(0.01)
+                active -= 1
+
+        async def run():
+            await asyncio.gather(*(request() for _ in range(6)))
+
+        async_to_sync(run)()
+        self.assertEqual(peak, 2)
+
+    def test_custom_extractor_and_price_parsing(self):
+        self.assertEqual(_to_decimal("1.299,90"), Decimal('1299.90'))
+        self.assertEqual(_to_decimal("1,299.90"), Decimal('1299.90'))
+        self.assertEqual(_to_decimal("n/a"), None)
+        register_extractor('shop.example')(lambda text, target: ExtractedPrice(Decimal('5.00')))
+        self.addCleanup(scraper._EXTRACTORS.pop, 'shop.example')
+        self.assertEqual(get_extractor('shop.example')('', None).price, Decimal('5.00'))
+
+
+class RunLengthHistoryTest(TestCase):
+    def setUp(self):
+        self.item = Item.objects.create(name="Eggs")
+        self.store = Store.objects.create(name="Auchan")
+        self.start = timezone.make_aware(timezone.datetime(2024, 3, 1, 6))
+
+    def observation(self, hours, price):
+        return {
+            'item': self.item.id, 'store': self.store.id, 'price': price,
+            'date_recorded': (self.start + timezone.timedelta(hours=hours)).isoformat(),
+        }
+
+    def observations(self):
+        # Two days of 4-hourly scrapes with one price change on each day.
+        prices = ['80', '80', '80', '85', '85', '85', '85', '85', '85', '80', '80', '80']
+        return [self.observation(4 * n, price) for n, price in enumerate(prices)]
+
+    def summaries(self):
+        entries = PriceHistory.objects.filter(item=self.item)
+        return [downsample_price_history(entries, resolution) for resolution in ('day', 'month')]
+
+    def test_changes_only_ingest_extends_runs(self):
+        report = PriceIngestor(batch_size=5, changes_only=True).ingest(self.observations())
+        self.assertEqual((report.created, report.merged), (5, 7))
+        runs = list(PriceHistory.objects.order_by('date_recorded').values_list('price', 'observation_count'))
+        self.assertEqual(runs, [
+            (Decimal('80'), 3), (Decimal('85'), 2),  # March 1st
+            (Decimal('85'), 4), (Decimal('80'), 2),  # March 2nd
+            (Decimal('80'), 1),                      # March 3rd
+        ])
+        self.assertEqual(LatestPrice.objects.get(item=self.item).price, Decimal('80'))
+
+    def test_runs_never_span_days(self):
+        PriceIngestor(changes_only=True).ingest(self.observations())
+        for entry in PriceHistory.objects.all():
+            self.assertEqual(timezone.localdate(entry.date_recorded), timezone.localdate(entry.seen_until))
+
+    def test_compaction_preserves_aggregates(self):
+        PriceIngestor().ingest(self.observations())
+        PriceIngestor().ingest([self.observation(1, '80')])  # out of order, same price
+        before = self.summaries()
+        latest_before = LatestPrice.objects.values_list('price', 'date_recorded').get()
+
+        out = StringIO()
+        call_command('compact_price_history', '--chunk-size', '1', stdout=out)
+        self.assertIn("merged 8 of 13 rows", out.getvalue())
+
+        self.assertEqual(PriceHistory.objects.count(), 5)
+        self.assertEqual(self.summaries(), before)
+        self.assertEqual(LatestPrice.objects.values_list('price', 'date_recorded').get(), latest_before)
+        call_command('compact_price_history', stdout=out)
+        self.assertEqual(PriceHistory.objects.count(), 5)
+
+    def test_compaction_preserves_rolling_statistics(self):
+        PriceIngestor().ingest(
+            [self.observation(0, '100'), self.observation(24, '50')]
+            + [self.observation(48 + n, '80') for n in range(8)]
+        )
+
+        def rolling():
+            stats, = item_price_stats(self.item.id)
+            return [stats[name] for name in ('rolling_min', 'rolling_max', 'rolling_mean')]
+
+        self.assertEqual(rolling(), [80, 80, 80])
+        call_command('compact_price_history', stdout=StringIO())
+        self.assertEqual(PriceHistory.objects.count(), 3)
+        self.assertEqual(rolling(), [80, 80, 80])
+
+
+class PageCacheTest(TestCase):
+    def setUp(self):
+        cache.clear()
+        reset_cache_stats()
+        self.client = Client()
+        self.tag = Tag.objects.create(name="Dairy")
+        self.store = Store.objects.create(name="Spar")
+        self.item = Item.objects.create(name="Milk")
+        self.item.tags.add(self.tag)
+        self.list_url = reverse('catalog:item_list')
+        self.detail_url = reverse('catalog:item_detail', kwargs={'item_id': self.item.id})
+
+    def test_repeat_requests_are_served_from_cache(self):
+        self.client.get(self.list_url, {'q': 'milk'})
+        with CaptureQueriesContext(connection) as ctx:
+            response = self.client.get(reverse('catalog:ajax_search_items'), {'q': 'milk'})
+        self.assertContains(response, "Milk")
+        self.assertEqual(ctx.captured_queries, [])
+        self.client.get(self.detail_url)
+        with self.assertNumQueries(0):
+            self.client.get(self.detail_url)
+        stats = cache_stats()
+        self.assertEqual(stats['item_listing'], {'hits': 1, 'misses': 1})
+        self.assertEqual(stats['item_detail'], {'hits': 1, 'misses': 1})
+
+    def test_new_price_invalidates_list_and_detail(self):
+        self.client.get(self.list_url)
+        self.client.get(self.detail_url)
+        PriceHistory.objects.create(item=self.item, store=self.store, price=Decimal('399.00'))
+        self.assertContains(self.client.get(self.list_url), "399.00 HUF")
+        self.assertContains(self.client.get(self.detail_url), "399.00")
+
+    def test_bulk_ingest_invalidates_detail(self):
+        self.client.get(self.detail_url)
+        PriceIngestor().ingest([{'item': self.item.id, 'store': 'Spar', 'price': '412.00'}])
+        self.assertContains(self.client.get(self.detail_url), "412.00")
+
+    def test_other_items_keep_their_detail_page(self):
+        other = Item.objects.create(name="Bread")
+        other_url = reverse('catalog:item_detail', kwargs={'item_id': other.id})
+        self.client.get(other_url)
+        PriceHistory.objects.create(item=self.item, store=self.store, price=Decimal('399.00'))
+        with self.assertNumQueries(0):
+            self.client.get(other_url)
+
+    def test_tag_and_store_changes_invalidate(self):
+        self.client.get(self.list_url)
+        self.tag.name = "Milk products"
+        self.tag.save()
+        self.assertContains(self.client.get(self.list_url), "Milk products")
+        self.assertContains(self.client.get(self.detail_url), "Milk products")
+
+        self.assertContains(self.client.get(self.list_url), "Spar")
+        Store.objects.create(name="Aldi")
+        self.assertContains(self.client.get(self.list_url), "Aldi")
+
+    def test_untagging_invalidates_facets(self):
+        self.client.get(self.list_url, {'tags': 'Dairy'})
+        self.item.tags.remove(self.tag)
+        response = self.client.get(self.list_url, {'tags': 'Dairy'})
+        self.assertNotContains(response, 'href="%s"' % self.detail_url)
+
+
+class ConditionalGetTest(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.store = Store.objects.create(name="Spar")
+        self.item = Item.objects.create(name="Milk")
+        self.detail_url = reverse('catalog:item_detail', kwargs={'item_id': self.item.id})
+        self.search_url = reverse('catalog:ajax_search_items')
+
+    def test_unchanged_pages_answer_304_without_queries(self):
+        response = self.client.get(self.detail_url)
+        self.assertEqual(response.status_code, 200)
+        self.assertIn('no-cache', response['Cache-Control'])
+        etag, last_modified = response['ETag'], response['Last-Modified']
+        with self.assertNumQueries(0):
+            response = self.client.get(self.detail_url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+        self.assertEqual(response['ETag'], etag)
+        self.assertEqual(response.content, b'')
+        with self.assertNumQueries(0):
+            response = self.client.get(self.detail_url, HTTP_IF_MODIFIED_SINCE=last_modified)
+        self.assertEqual(response.status_code, 304)
+
+        searched = self.client.get(self.search_url, {'q': 'milk'})
+        with self.assertNumQueries(0):
+            response = self.client.get(self.search_url, {'q': 'milk'}, HTTP_IF_NONE_MATCH=searched['ETag'])
+        self.assertEqual(response.status_code, 304)
+        other = self.client.get(self.search_url, {'q': 'bread'}, HTTP_IF_NONE_MATCH=searched['ETag'])
+        self.assertEqual(other.status_code, 200)
+        self.assertNotEqual(other['ETag'], searched['ETag'])
+
+    def test_changes_invalidate_validators(self):
+        etag = self.client.get(self.detail_url)['ETag']
+        search_etag = self.client.get(self.search_url, {'q': 'milk'})['ETag']
+        with self.captureOnCommitCallbacks(execute=True):
+            PriceHistory.objects.create(item=self.item, store=self.store, price=Decimal('399.00'))
+        response = self.client.get(self.detail_url, HTTP_IF_NONE_MATCH=etag)
+        self.assertContains(response, "399.00")
+        self.assertNotEqual(response['ETag'], etag)
+        response = self.client.get(self.search_url, {'q': 'milk'}, HTTP_IF_NONE_MATCH=search_etag)
+        self.assertContains(response, "399.00 HUF")
+
+        etag = self.client.get(self.detail_url)['ETag']
+        group = AttributeGroup.objects.create(name="Physical")
+        attribute = AttributeDefinition.objects.create(group=group, name="Volume", slug='volume', value_type='number', unit='ml')
+        with self.captureOnCommitCallbacks(execute=True):
+            ItemSpecification.objects.create(item=self.item, attribute=attribute, value_text='1000', value_numeric=1000)
+        self.assertEqual(self.client.get(self.detail_url, HTTP_IF_NONE_MATCH=etag).status_code, 200)
+
+    def test_missing_item_is_not_cached_as_304(self):
+        url = reverse('catalog:item_detail', kwargs={'item_id': self.item.id + 100})
+        response = self.client.get(url)
+        self.assertEqual(response.status_code, 404)
+        self.assertFalse(response.has_header('ETag'))
+
+    def test_async_search(self):
+        factory = AsyncRequestFactory()
+        first = async_to_sync(async_views.ajax_search_items)(factory.get(self.search_url, {'q': 'milk'}))
+        self.assertEqual(first['ETag'], self.client.get(self.search_url, {'q': 'milk'})['ETag'])
+        request = factory.get(self.search_url, {'q': 'milk'}, headers={'If-None-Match': first['ETag']})
+        with self.assertNumQueries(0):
+            response = async_to_sync(async_views.ajax_search_items)(request)
+        self.assertEqual(response.status_code, 304)
+
+
+class AdminChangelistTest(TestCase):
+    def setUp(self):
+        from django.contrib.auth.models import User
+        self.user = User.objects.create_superuser('admin', 'admin@example.com', 'password')
+        self.client.force_login(self.user)
+        self.tag = Tag.objects.create(name="Dairy")
+
+    def add_rows(self, count):
+        for n in range(count):
+            item = Item.objects.create(name=f"Product {Item.objects.count()}")
+            item.tags.add(self.tag)
+            store = Store.objects.create(name=f"Store {Store.objects.count()}")
+            PriceHistory.objects.create(item=item, store=store, price=Decimal(100 + n))
+
+    def changelist_queries(self, model_name):
+        url = reverse(f'admin:catalog_{model_name}_changelist')
+        with CaptureQueriesContext(connection) as ctx:
+            response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        return len(ctx.captured_queries)
+
+    def test_changelist_query_counts_do_not_grow_with_rows(self):
+        self.add_rows(2)
+        small = {name: self.changelist_queries(name) for name in ('item', 'pricehistory')}
+        self.add_rows(8)
+        for name, count in small.items():
+            with self.subTest(changelist=name):
+                self.assertEqual(self.changelist_queries(name), count)
+
+    def test_item_filter_lists_only_items_with_history(self):
+        self.add_rows(1)
+        Item.objects.create(name="Never priced")
+        response = self.client.get(reverse('admin:catalog_pricehistory_changelist'))
+        self.assertContains(response, "Product 0")
+        self.assertNotContains(response, "Never priced")
+
+    def test_item_filter_is_capped(self):
+        from .admin import ItemWithHistoryFilter
+        self.add_rows(3)
+        url = reverse('admin:catalog_pricehistory_changelist')
+        last = Item.objects.get(name="Product 2")
+        with patch.object(ItemWithHistoryFilter, 'LIMIT', 2):
+            response = self.client.get(url)
+            self.assertContains(response, "?item=")
+            self.assertNotContains(response, f'href="?item={last.pk}">Product 2<')
+            # The selected item stays listed even past the cap.
+            response = self.client.get(url, {'item': last.pk})
+            self.assertContains(response, f'href="?item={last.pk}">Product 2<')
+
+    def test_estimated_count_skips_count_for_large_tables(self):
+        from .admin import EstimatedCountPaginator
+        self.add_rows(1)
+        entries = PriceHistory.objects.all()
+        with patch.object(EstimatedCountPaginator, 'EXACT_COUNT_BELOW', 0):
+            paginator = EstimatedCountPaginator(entries, 100)
+            with CaptureQueriesContext(connection) as ctx:
+                self.assertEqual(paginator.count, PriceHistory.objects.latest('id').id)
+            self.assertNotIn('COUNT', ctx.captured_queries[0]['sql'].upper())
+            # Filtered changelists are still counted exactly.
+            self.assertEqual(EstimatedCountPaginator(entries.filter(price__gt=1000), 100).count, 0)
+
+
+class PriceAnalyticsTest(TestCase):
+    def setUp(self):
+        self.item = Item.objects.create(name="Coffee")
+        self.spar = Store.objects.create(name="Spar")
+        self.tesco = Store.objects.create(name="Tesco")
+        self.now = timezone.now()
+        # Spar, oldest first: 1000, 900 (sale from 1200), 1100 x3 (one run row), 800 (sale from 1000).
+        for days_ago, price, pre_sale, count in (
+            (200, 1000, None, 1), (60, 900, 1200, 1), (30, 1100, None, 3), (1, 800, 1000, 1),
+        ):
+            PriceHistory.objects.create(
+                item=self.item, store=self.spar, price=Decimal(price), on_sale=pre_sale is not None,
+                pre_sale_price=Decimal(pre_sale) if pre_sale else None, observation_count=count,
+                date_recorded=self.now - timezone.timedelta(days=days_ago),
+            )
+        PriceHistory.objects.create(item=self.item, store=self.tesco, price=Decimal('950.00'))
+
+    def test_group_statistics(self):
+        # The hot rows and the archived days' rollups.
+        with self.assertNumQueries(2):
+            stats = item_price_stats(self.item.id, window=2, now=self.now)
+        spar, tesco = stats
+        self.assertEqual((spar['store_id'], tesco['store_id']), (self.spar.id, self.tesco.id))
+        self.assertEqual(spar['observations'], 6)
+        self.assertEqual(spar['current'], 800)
+        self.assertEqual(spar['all_time_low'], 800)
+        self.assertEqual(spar['all_time_high'], 1100)
+        self.assertAlmostEqual(spar['mean'], (1000 + 900 + 3 * 1100 + 800) / 6)
+        # Last two observations: one of the 1100 run's three, and 800.
+        self.assertEqual((spar['rolling_min'], spar['rolling_max']), (800, 1100))
+        self.assertAlmostEqual(spar['rolling_mean'], (1100 + 800) / 2)
+        # Within 90 days: 900, 1100 x3, 800; the weighted median is 1100.
+        self.assertEqual(spar['median'], 1100)
+        self.assertAlmostEqual(spar['pct_off_median'], 300 / 1100 * 100)
+        self.assertAlmostEqual(spar['sale_frequency'], 2 / 6)
+        self.assertAlmostEqual(spar['avg_discount'], (300 / 1200 + 200 / 1000) * 100 / 2)
+        self.assertAlmostEqual(spar['max_discount'], 25)
+        self.assertEqual(tesco['observations'], 1)
+        self.assertIsNone(tesco['avg_discount'])
+        self.assertEqual(tesco['pct_off_median'], 0)
+
+    def test_rolling_windows_stay_within_their_group(self):
+        series = PriceSeries.load(PriceHistory.objects.filter(item=self.item))
+        rolling = rolling_stats(series, window=3)
+        # Tesco's only row must not see Spar's prices.
+        self.assertEqual(rolling['min'][-1], 950)
+        self.assertEqual(list(rolling['max'][:4]), [1000, 1000, 1100, 1100])
+
+    def test_empty_series(self):
+        self.assertEqual(price_stats(PriceHistory.objects.none()), [])
+
+    def test_series_timestamps_and_local_days(self):
+        entries = PriceHistory.objects.filter(item=self.item)
+        series = PriceSeries.load(entries)
+        expected = sorted((entry.store_id, entry.date_recorded.timestamp()) for entry in entries)
+        self.assertEqual(list(zip(series.store_ids.tolist(), series.timestamps.tolist())), expected)
+        stamp = datetime.datetime(2024, 3, 31, 0, 30, 15, 250, tzinfo=datetime.timezone.utc)
+        with timezone.override('Europe/Budapest'):
+            # 00:30 UTC is 01:30 local before the switch to summer time at 01:00 UTC.
+            self.assertEqual(
+                local_day_ordinals([stamp.timestamp(), (stamp + datetime.timedelta(hours=22)).timestamp()]).tolist(),
+                [datetime.date(2024, 3, 31).toordinal(), datetime.date(2024, 4, 1).toordinal()],
+            )
+
+    def test_item_detail_shows_statistics(self):
+        cache.clear()
+        response = self.client.get(reverse('catalog:item_detail', kwargs={'item_id': self.item.id}))
+        self.assertContains(response, "Price Statistics")
+        self.assertContains(response, "27.3% below")
+        self.assertContains(response, "<td>33%</td>", html=True)
+
+
+class PriceAlertTest(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.item = Item.objects.create(name="Headphones")
+        self.other_item = Item.objects.create(name="Speaker")
+        self.spar = Store.objects.create(name="Spar")
+        self.tesco = Store.objects.create(name="Tesco")
+
+    def alert(self, threshold, kind=PriceAlert.KIND_BELOW, store=None, email='buyer@example.com'):
+        return PriceAlert.objects.create(item=self.item, store=store, kind=kind, threshold=Decimal(threshold), email=email)
+
+    def record(self, price, store=None, item=None, days_ago=0):
+        return PriceHistory.objects.create(
+            item=item or self.item, store=store or self.spar, price=Decimal(price),
+            date_recorded=timezone.now() - timezone.timedelta(days=days_ago),
+        )
+
+    def test_threshold_index_bisects(self):
+        alerts = [
+            PriceAlert(pk=1, kind='below', threshold=Decimal('100')),
+            PriceAlert(pk=2, kind='below', threshold=Decimal('50')),
+            PriceAlert(pk=3, kind='below', threshold=Decimal('80'), store_id=7),
+            PriceAlert(pk=4, kind='drop_pct', threshold=Decimal('10')),
+            PriceAlert(pk=5, kind='drop_pct', threshold=Decimal('30')),
+        ]
+        index = ThresholdIndex(alerts)
+        self.assertEqual(index.below(store_id=7, price=Decimal('70')), [3, 1])
+        self.assertEqual(index.below(store_id=8, price=Decimal('70')), [1])
+        self.assertEqual(index.below(store_id=8, price=Decimal('100')), [])
+        self.assertEqual(index.dropped(store_id=8, drop_pct=Decimal('20')), [4])
+
+    def test_below_alert_fires_once_on_save(self):
+        alert = self.alert('500')
+        self.alert('300', email='patient@example.com')
+        with self.captureOnCommitCallbacks(execute=True):
+            self.record('600')
+        self.assertEqual(mail.outbox, [])
+        with self.captureOnCommitCallbacks(execute=True):
+            entry = self.record('450')
+        self.assertEqual([message.to for message in mail.outbox], [['buyer@example.com']])
+        self.assertIn("went below 500", mail.outbox[0].body)
+        alert.refresh_from_db()
+        self.assertFalse(alert.is_active)
+        self.assertEqual((alert.triggered_price, alert.triggered_entry_id), (Decimal('450.00'), entry.id))
+        with self.captureOnCommitCallbacks(execute=True):
+            self.record('400')
+        self.assertEqual(len(mail.outbox), 1)
+
+    def test_store_specific_alert(self):
+        self.alert('500', store=self.tesco)
+        with self.captureOnCommitCallbacks(execute=True):
+            self.record('100', store=self.spar)
+        self.assertEqual(mail.outbox, [])
+        with self.captureOnCommitCallbacks(execute=True):
+            self.record('100', store=self.tesco)
+        self.assertEqual(len(mail.outbox), 1)
+
+    def test_drop_from_recent_average(self):
+        self.alert('20', kind=PriceAlert.KIND_DROP_PCT)
+        self.record('1000', days_ago=40)  # Outside the 30-day window.
+        self.record('100', days_ago=10)
+        self.record('100', days_ago=5)
+        with self.captureOnCommitCallbacks(execute=True):
+            self.record('85')
+        self.assertEqual(mail.outbox, [])
+        with self.captureOnCommitCallbacks(execute=True):
+            self.record('75')
+        self.assertEqual(len(mail.outbox), 1)
+        self.assertIn("20.00% below its 30-day average", mail.outbox[0].body)
+
+    def test_backdated_rows_do_not_fire(self):
+        alert = self.alert('500')
+        self.record('900')
+        with self.captureOnCommitCallbacks(execute=True):
+            self.record('100', days_ago=30)
+            PriceIngestor().ingest([{
+                'item': self.item.id, 'store': 'Spar', 'price': '200',
+                'date_recorded': (timezone.now() - timezone.timedelta(days=60)).isoformat(),
+            }])
+        self.assertEqual(mail.outbox, [])
+        alert.refresh_from_db()
+        self.assertTrue(alert.is_active)
+
+    def test_currencies_are_not_mixed(self):
+        ExchangeRate.objects.create(currency='EUR', rate_date=timezone.localdate(), rate=Decimal('400'))
+        self.alert('20', kind=PriceAlert.KIND_DROP_PCT)
+        self.alert('1000')
+        self.record('100000', days_ago=5)
+        with self.captureOnCommitCallbacks(execute=True):
+            # 3 EUR is 1200 in the base currency, and no drop from earlier EUR prices.
+            PriceHistory.objects.create(item=self.item, store=self.spar, price=Decimal('3.00'), currency='EUR')
+        self.assertEqual(mail.outbox, [])
+        with self.captureOnCommitCallbacks(execute=True):
+            PriceHistory.objects.create(item=self.item, store=self.spar, price=Decimal('2.00'), currency='EUR')
+        self.assertEqual(len(mail.outbox), 2)
+        self.assertEqual({alert.kind for alert in PriceAlert.objects.filter(is_active=False)}, {'below', 'drop_pct'})
+
+    def test_items_without_alerts_cost_no_queries(self):
+        self.alert('500')
+        entry = self.record('900', item=self.other_item)
+        cache.clear()
+        evaluate_entries([entry])
+        with self.assertNumQueries(0):
+            evaluate_entries([entry])
+
+    def test_bulk_ingest_and_file_backend(self):
+        self.alert('500')
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, 'alerts.log')
+            with override_settings(CATALOG_ALERT_BACKEND='catalog.alerts.FileAlertBackend', CATALOG_ALERT_FILE=path):
+                with self.captureOnCommitCallbacks(execute=True):
+                    PriceIngestor().ingest([
+                        {'item': self.item.id, 'store': 'Spar', 'price': '700'},
+                        {'item': self.item.id, 'store': 'Tesco', 'price': '480'},
+                    ])
+            with open(path, encoding='utf-8') as handle:
+                lines = [json.loads(line) for line in handle]
+        self.assertEqual(len(lines), 1)
+        self.assertEqual((Decimal(lines[0]['price']), lines[0]['email']), (Decimal('480'), 'buyer@example.com'))
+        self.assertIn("at Tesco", lines[0]['body'])
+
+    def test_new_alert_invalidates_cached_index(self):
+        self.record('900')
+        self.alert('1000')
+        with self.captureOnCommitCallbacks(execute=True):
+            self.record('950')
+        self.assertEqual(len(mail.outbox), 1)
+
+
+class SpecificationFilterTest(TestCase):
+    def setUp(self):
+        cache.clear()
+        group = AttributeGroup.objects.create(name="Details")
+        self.weight = AttributeDefinition.objects.create(group=group, name="Weight", slug='weight', value_type='number', unit='g')
+        self.organic = AttributeDefinition.objects.create(group=group, name="Organic", slug='organic', value_type='boolean')
+        self.items = {}
+        for name, weight, organic in (("Oats", '250', 'yes'), ("Rice", '1000', 'no'), ("Beans", '500', 'yes'), ("Salt", None, None)):
+            item = Item.objects.create(name=name)
+            if weight:
+                ItemSpecification.objects.create(item=item, attribute=self.weight, value_text=weight)
+            if organic:
+                ItemSpecification.objects.create(item=item, attribute=self.organic, value_text=organic)
+            self.items[name] = item
+
+    def names(self, params):
+        filters = parse_spec_filters(params)
+        return sorted(item.name for item in filter_items_by_specs(Item.objects.all(), filters))
+
+    def test_numeric_and_boolean_filters(self):
+        self.assertEqual(self.names({'spec.weight__lte': '500'}), ["Beans", "Oats"])
+        self.assertEqual(self.names({'spec.weight__gt': '250', 'spec.organic': 'true'}), ["Beans"])
+        self.assertEqual(self.names({'spec.weight': '1000'}), ["Rice"])
+        self.assertEqual(self.names({'spec.organic': 'false'}), ["Rice"])
+
+    def test_unknown_attribute_or_bad_value_matches_nothing(self):
+        self.assertEqual(self.names({'spec.colour': 'red'}), [])
+        self.assertEqual(self.names({'spec.weight__lte': 'heavy'}), [])
+        self.assertEqual(self.names({'spec.organic__gt': '1'}), [])
+        self.assertEqual(len(self.names({'q': 'oats'})), 4)
+
+    def test_facets_use_a_fixed_number_of_queries(self):
+        with self.assertNumQueries(3):
+            facets = spec_facets(Item.objects.all())
+        weight = facets['weight']
+        self.assertEqual((weight['min'], weight['max'], weight['count']), (250.0, 1000.0, 3))
+        self.assertEqual(len(weight['histogram']), 10)
+        self.assertEqual([bucket['count'] for bucket in weight['histogram'] if bucket['count']], [1, 1, 1])
+        self.assertEqual(weight['histogram'][-1]['count'], 1)
+        self.assertEqual((facets['organic']['true'], facets['organic']['false']), (2, 1))
+
+        filtered = filter_items_by_specs(Item.objects.all(), parse_spec_filters({'spec.organic': 'yes'}))
+        self.assertEqual(spec_facets(filtered)['weight']['max'], 500.0)
+
+    def test_item_list_applies_filters_and_embeds_facets(self):
+        response = self.client.get(reverse('catalog:ajax_search_items'), {'spec.weight__gte': '500'})
+        self.assertContains(response, "Rice")
+        self.assertContains(response, "Beans")
+        self.assertNotContains(response, "Oats")
+        self.assertContains(response, 'id="specFacetsData"')
+
+        spec = ItemSpecification.objects.get(item=self.items["Oats"], attribute=self.weight)
+        spec.value_text = '750'
+        spec.save()
+        response = self.client.get(reverse('catalog:item_list'), {'spec.weight__gte': '500'})
+        self.assertContains(response, "Oats")
+
+
+class UnitPriceTest(TestCase):
+    def setUp(self):
+        cache.clear()
+        group = AttributeGroup.objects.create(name="Package")
+        self.weight = AttributeDefinition.objects.create(group=group, name="Net weight", slug='net-weight', value_type='number', unit='g')
+        self.volume = AttributeDefinition.objects.create(group=group, name="Volume", slug='volume', value_type='number', unit='dl')
+        self.tag = Tag.objects.create(name="Coffee")
+        self.spar = Store.objects.create(name="Spar")
+        self.tesco = Store.objects.create(name="Tesco")
+
+    def make_item(self, name, weight=None, volume=None):
+        item = Item.objects.create(name=name)
+        item.tags.add(self.tag)
+        with self.captureOnCommitCallbacks(execute=True):
+            if weight:
+                ItemSpecification.objects.create(item=item, attribute=self.weight, value_text=weight)
+            if volume:
+                ItemSpecification.objects.create(item=item, attribute=self.volume, value_text=volume)
+        return item
+
+    def record(self, item, store, price):
+        with self.captureOnCommitCallbacks(execute=True):
+            PriceHistory.objects.create(item=item, store=store, price=Decimal(price))
+
+    def test_unit_conversion(self):
+        self.assertEqual(to_base_unit(Decimal('250'), 'g'), (Decimal('0.250'), 'kg'))
+        self.assertEqual(to_base_unit(Decimal('5'), 'dl'), (Decimal('0.5'), 'l'))
+        self.assertEqual(to_base_unit(Decimal('1.5'), ' L '), (Decimal('1.5'), 'l'))
+        self.assertIsNone(to_base_unit(Decimal('3'), 'cm'))
+        self.assertIsNone(to_base_unit(Decimal('0'), 'kg'))
+
+    def test_refreshed_on_price_and_spec_change(self):
+        beans = self.make_item("Beans", weight='250')
+        self.record(beans, self.spar, '1000')
+        unit_price = UnitPrice.objects.get(item=beans, store=self.spar)
+        self.assertEqual((unit_price.unit_price, unit_price.base_unit), (Decimal('4000.0000'), 'kg'))
+
+        self.record(beans, self.spar, '900')
+        self.assertEqual(UnitPrice.objects.get(item=beans).unit_price, Decimal('3600.0000'))
+
+        spec = beans.specifications.get()
+        spec.value_text = '500'
+        with self.captureOnCommitCallbacks(execute=True):
+            spec.save()
+        self.assertEqual(UnitPrice.objects.get(item=beans).unit_price, Decimal('1800.0000'))
+
+        with self.captureOnCommitCallbacks(execute=True):
+            spec.delete()
+        self.assertFalse(UnitPrice.objects.exists())
+
+    def test_only_package_size_attributes_count(self):
+        nutrition = AttributeGroup.objects.create(name="Nutrition")
+        fat = AttributeDefinition.objects.create(group=nutrition, name="Fat", slug='fat', value_type='number', unit='g')
+        bar = self.make_item("Protein bar")
+        with self.captureOnCommitCallbacks(execute=True):
+            ItemSpecification.objects.create(item=bar, attribute=fat, value_text='10')
+        self.record(bar, self.spar, '500')
+        self.assertFalse(UnitPrice.objects.filter(item=bar).exists())
+
+        with self.captureOnCommitCallbacks(execute=True):
+            ItemSpecification.objects.create(item=bar, attribute=self.weight, value_text='50')
+        unit_price = UnitPrice.objects.get(item=bar)
+        self.assertEqual((unit_price.specification.attribute, unit_price.unit_price), (self.weight, Decimal('10000.0000')))
+
+        package = AttributeDefinition.objects.create(group=nutrition, name="Pack", slug='pack', value_type='number', unit='kg', is_package_size=True)
+        beans = self.make_item("Beans")
+        with self.captureOnCommitCallbacks(execute=True):
+            ItemSpecification.objects.create(item=beans, attribute=package, value_text='2')
+        self.record(beans, self.spar, '5000')
+        self.assertEqual(UnitPrice.objects.get(item=beans).unit_price, Decimal('2500.0000'))
+
+    def test_bulk_ingest_refreshes(self):
+        beans = self.make_item("Beans", weight='1000')
+        with self.captureOnCommitCallbacks(execute=True):
+            PriceIngestor().ingest([
+                {'item': beans.id, 'store': 'Spar', 'price': '3000'},
+                {'item': beans.id, 'store': 'Tesco', 'price': '2800'},
+            ])
+        self.assertEqual(UnitPrice.objects.filter(item=beans).count(), 2)
+
+    def test_best_value_ranking(self):
+        small = self.make_item("Espresso 250g", weight='250')
+        large = self.make_item("Espresso 1kg", weight='1000')
+        drink = self.make_item("Cold brew", volume='3')
+        self.make_item("No size")
+        self.record(small, self.spar, '1000')
+        self.record(large, self.spar, '3000')
+        self.record(large, self.tesco, '3500')
+        self.record(drink, self.tesco, '600')
+
+        ranking = best_value('coffee', 'kg')
+        self.assertEqual(
+            [(row.item.name, row.store.name) for row in ranking],
+            [("Espresso 1kg", "Spar"), ("Espresso 1kg", "Tesco"), ("Espresso 250g", "Spar")],
+        )
+        self.assertEqual([row.unit_price for row in best_value('Coffee', 'l')], [Decimal('2000.0000')])
+        self.assertEqual(best_value('Tea', 'kg'), [])
+
+        response = self.client.get(reverse('catalog:tag_best_value', kwargs={'tag_name': 'coffee'}))
+        self.assertContains(response, "3000.00 HUF/kg")
+        self.assertContains(response, "Price per l")
+
+        UnitPrice.objects.all().delete()
+        self.assertEqual(rebuild_unit_prices(), 4)
+
+    def test_ranking_converts_currencies(self):
+        beans = self.make_item("Beans", weight='1000')
+        imported = self.make_item("Imported beans", weight='1000')
+        self.record(beans, self.spar, '3000')
+        with self.captureOnCommitCallbacks(execute=True):
+            PriceHistory.objects.create(item=imported, store=self.spar, price=Decimal('10.00'), currency='EUR')
+        # No EUR rate yet: the EUR price can't be ranked.
+        self.assertEqual([row.item for row in best_value('coffee', 'kg')], [beans])
+
+        with self.captureOnCommitCallbacks(execute=True):
+            ExchangeRate.objects.create(currency='EUR', rate_date=timezone.localdate(), rate=Decimal('400'))
+        ranking = best_value('coffee', 'kg')
+        self.assertEqual([row.item for row in ranking], [beans, imported])
+        self.assertEqual(ranking[1].base_unit_price, Decimal('4000.0000'))
+
+        call_command('load_exchange_rates', self.write_rates('EUR', '250'), stdout=StringIO())
+        self.assertEqual([row.item for row in best_value('coffee', 'kg')], [imported, beans])
+
+    def write_rates(self, currency, rate):
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory)
+        path = os.path.join(directory, 'rates.csv')
+        with open(path, 'w', encoding='utf-8') as handle:
+            handle.write(f"date,currency,rate\n{timezone.localdate().isoformat()},{currency},{rate}\n")
+        return path
+
+
+class CurrencyTest(TestCase):
+    def setUp(self):
+        cache.clear()
+        load_rates([
+            {'date': '2024-01-01', 'currency': 'EUR', 'rate': '380'},
+            {'date': '2024-02-01', 'currency': 'EUR', 'rate': '400'},
+            {'date': '2024-01-01', 'currency': 'USD', 'rate': '350'},
+        ])
+        self.item = Item.objects.create(name="Kettle")
+        self.spar = Store.objects.create(name="Spar")
+        self.shop = Store.objects.create(name="Euroshop")
+
+    def test_rate_lookup_uses_latest_rate_on_or_before_day(self):
+        rates = RateCache.load()
+        self.assertEqual(rates.rate('EUR', datetime.date(2024, 1, 15)), Decimal('380'))
+        self.assertEqual(rates.rate('EUR', datetime.date(2024, 2, 1)), Decimal('400'))
+        self.assertEqual(rates.rate('EUR', datetime.date(2023, 6, 1)), Decimal('380'))
+        self.assertEqual(rates.rate('HUF'), Decimal(1))
+        self.assertEqual(rates.convert(Decimal('10'), 'EUR', 'USD', datetime.date(2024, 3, 1)), Decimal('11.43'))
+        with self.assertRaises(MissingRate):
+            rates.rate('GBP')
+
+    def test_convert_array(self):
+        rates = RateCache.load()
+        days = [datetime.date(2024, 1, 10).toordinal(), datetime.date(2024, 2, 10).toordinal(), 0, 0]
+        converted = rates.convert_array([10, 10, 1000, 5], ['EUR', 'EUR', 'HUF', 'GBP'], days, 'HUF')
+        self.assertEqual(list(converted[:3]), [3800.0, 4000.0, 1000.0])
+        self.assertTrue(converted[3] != converted[3])
+
+    def test_load_rates_upserts_and_reloads_cache(self):
+        self.assertEqual(get_rate_cache().rate('USD'), Decimal('350'))
+        load_rates([{'date': '2024-01-01', 'currency': 'usd', 'rate': '360'}])
+        self.assertEqual(ExchangeRate.objects.filter(currency='USD').count(), 1)
+        self.assertEqual(get_rate_cache().rate('USD'), Decimal('360'))
+        with self.assertRaises(ValueError):
+            load_rates([{'date': 'yesterday', 'currency': 'EUR', 'rate': '1'}])
+
+    def test_command(self):
+        with tempfile.NamedTemporaryFile('w', suffix='.csv', delete=False) as handle:
+            handle.write("date,currency,rate\n2024-03-01,GBP,450\n")
+        self.addCleanup(os.remove, handle.name)
+        out = StringIO()
+        call_command('load_exchange_rates', handle.name, stdout=out)
+        self.assertIn("Loaded 1 exchange rates", out.getvalue())
+        self.assertTrue(ExchangeRate.objects.filter(currency='GBP', rate=Decimal('450')).exists())
+
+    def test_listing_compares_offers_in_display_currency(self):
+        PriceHistory.objects.create(item=self.item, store=self.spar, price=Decimal('9000'))
+        PriceHistory.objects.create(item=self.item, store=self.shop, price=Decimal('25'), currency='EUR')
+        latest, amount = best_offer(LatestPrice.objects.filter(item=self.item), get_rate_cache(), 'HUF')
+        self.assertEqual((latest.store, amount), (self.spar, Decimal('9000')))
+
+        response = self.client.get(reverse('catalog:item_list'))
+        self.assertContains(response, "9000.00 HUF")
+
+        ExchangeRate.objects.create(currency='EUR', rate_date=timezone.localdate(), rate=Decimal('300'))
+        response = self.client.get(reverse('catalog:item_list'))
+        self.assertContains(response, "25.00 EUR")
+        self.assertContains(response, "7500.00 HUF")
+
+    def test_statistics_and_downsampling_convert(self):
+        day = timezone.make_aware(datetime.datetime(2024, 1, 10, 12))
+        PriceHistory.objects.create(item=self.item, store=self.shop, price=Decimal('10'), currency='EUR', date_recorded=day)
+        PriceHistory.objects.create(
+            item=self.item, store=self.shop, price=Decimal('10'), currency='EUR',
+            date_recorded=day + datetime.timedelta(days=30),
+        )
+        stats = price_stats(PriceHistory.objects.filter(item=self.item), currency='HUF', now=day + datetime.timedelta(days=31))
+        self.assertEqual((stats[0]['all_time_low'], stats[0]['all_time_high']), (3800.0, 4000.0))
+
+        buckets = downsample_price_history(PriceHistory.objects.filter(item=self.item), 'month', currency='HUF')
+        self.assertEqual([(row['last'], row['currency']) for row in buckets], [(Decimal('3800.00'), 'HUF'), (Decimal('4000.00'), 'HUF')])
+
+        url = reverse('catalog:api_price_history', kwargs={'item_id': self.item.id})
+        self.assertEqual(self.client.get(url, {'resolution': 'month', 'currency': 'usd'}).status_code, 200)
+        self.assertEqual(self.client.get(url, {'resolution': 'month', 'currency': 'GBP'}).status_code, 400)
+
+    def test_downsampling_merges_a_stores_currencies(self):
+        day = timezone.make_aware(datetime.datetime(2024, 1, 10, 12))
+        PriceHistory.objects.create(item=self.item, store=self.shop, price=Decimal('10'), currency='EUR', date_recorded=day)
+        PriceHistory.objects.create(
+            item=self.item, store=self.shop, price=Decimal('3900'), currency='HUF',
+            date_recorded=day + datetime.timedelta(days=2), observation_count=3,
+        )
+        bucket, = downsample_price_history(PriceHistory.objects.filter(item=self.item), 'month', currency='HUF')
+        self.assertEqual(
+            (bucket['min'], bucket['max'], bucket['avg'], bucket['last'], bucket['count'], bucket['currency']),
+            (Decimal('3800.00'), Decimal('3900.00'), Decimal('3875.00'), Decimal('3900'), 4, 'HUF'),
+        )
+
+
+class PriceExportTest(TestCase):
+    def setUp(self):
+        self.milk = Item.objects.create(name="Milk, 1l")
+        self.bread = Item.objects.create(name="Bread")
+        self.spar = Store.objects.create(name="Spar")
+        self.start = timezone.make_aware(datetime.datetime(2024, 5, 1))
+        for day in range(5):
+            PriceHistory.objects.create(
+                item=self.milk, store=self.spar, price=Decimal(400 + day),
+                date_recorded=self.start + timezone.timedelta(days=day),
+            )
+        PriceHistory.objects.create(item=self.bread, store=self.spar, price=Decimal('650'), on_sale=True, pre_sale_price=Decimal('700'))
+
+    def read_csv(self, data):
+        return list(csv.DictReader(data.decode().splitlines()))
+
+    def test_rows_are_plain_tuples_in_id_order(self):
+        rows = list(export_rows(item=self.milk.id, since=self.start + timezone.timedelta(days=1), chunk_size=2))
+        self.assertEqual([row[5] for row in rows], [Decimal(401), Decimal(402), Decimal(403), Decimal(404)])
+        self.assertTrue(all(isinstance(row, tuple) for row in rows))
+
+    def test_csv_and_ndjson(self):
+        rows = self.read_csv(b''.join(export_chunks(export_rows(), 'csv')))
+        self.assertEqual(len(rows), 6)
+        self.assertEqual((rows[0]['item'], rows[0]['price']), ("Milk, 1l", '400.00'))
+        self.assertEqual((rows[-1]['on_sale'], rows[-1]['pre_sale_price']), ('True', '700.00'))
+        self.assertEqual(rows[0]['pre_sale_price'], '')
+
+        lines = b''.join(export_chunks(export_rows(store=self.spar.id), 'ndjson')).decode().splitlines()
+        self.assertEqual(json.loads(lines[-1])['item'], "Bread")
+        self.assertEqual(json.loads(lines[0])['price'], '400.00')
+
+    def test_gzip(self):
+        data = gzip.decompress(b''.join(export_chunks(export_rows(item=self.bread.id), 'csv', compress=True)))
+        self.assertEqual([row['item'] for row in self.read_csv(data)], ["Bread"])
+
+    @override_settings(CATALOG_INGEST_TOKEN='secret')
+    def test_endpoint(self):
+        url = reverse('catalog:api_export_prices')
+        self.assertEqual(self.client.get(url).status_code, 403)
+
+        response = self.client.get(url, {'item': self.milk.id, 'until': '2024-05-03'}, HTTP_AUTHORIZATION='Bearer secret')
+        self.assertTrue(response.streaming)
+        self.assertEqual(response['Content-Disposition'], 'attachment; filename="price-history.csv"')
+        self.assertEqual(len(self.read_csv(b''.join(response.streaming_content))), 2)
+
+        response = self.client.get(url, {'format': 'ndjson', 'gzip': '1'}, HTTP_AUTHORIZATION='Bearer secret')
+        self.assertEqual(response['Content-Type'], 'application/gzip')
+        self.assertEqual(len(gzip.decompress(b''.join(response.streaming_content)).splitlines()), 6)
+
+        self.assertEqual(self.client.get(url, {'format': 'xml'}, HTTP_AUTHORIZATION='Bearer secret').status_code, 400)
+        self.assertEqual(self.client.get(url, {'since': 'soon'}, HTTP_AUTHORIZATION='Bearer secret').status_code, 400)
+
+    def test_command(self):
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, 'prices.ndjson.gz')
+            call_command('export_prices', path, format='ndjson', gzip=True, store=self.spar.id, stderr=StringIO())
+            with gzip.open(path, 'rt') as handle:
+                self.assertEqual(len(handle.readlines()), 6)
+
+
+class ThumbnailTest(TestCase):
+    def setUp(self):
+        cache.clear()
+        media = tempfile.TemporaryDirectory()
+        self.addCleanup(media.cleanup)
+        settings_override = override_settings(
+            MEDIA_ROOT=media.name, CATALOG_THUMBNAIL_WIDTHS=[80, 200], CATALOG_THUMBNAIL_WORKERS=0,
+        )
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+        self.media_root = media.name
+
+    def upload(self, name, mode='RGBA', size=(400, 300)):
+        buffer = BytesIO()
+        Image.new(mode, size, (200, 30, 30, 128) if mode == 'RGBA' else (200, 30, 30)).save(
+            buffer, format='PNG' if name.endswith('.png') else 'JPEG',
+        )
+        return SimpleUploadedFile(name, buffer.getvalue())
+
+    def test_thumbnails_made_on_upload(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            item = Item.objects.create(name="Teapot", image=self.upload('teapot.png'))
+        variants = available_variants(item.image.name)
+        self.assertEqual(sorted(variants), ['png', 'webp'])
+        self.assertEqual([width for width, url in variants['webp']], [80, 200])
+        with Image.open(os.path.join(self.media_root, thumbnail_name(item.image.name, 80, 'webp'))) as thumb:
+            self.assertEqual(thumb.size, (80, 60))
+            self.assertEqual(thumb.format, 'WEBP')
+
+        response = self.client.get(reverse('catalog:item_list'))
+        self.assertContains(response, '<source type="image/webp"')
+        self.assertContains(response, 'loading="lazy"')
+        self.assertContains(response, '-80w.webp 80w')
+
+    def test_original_served_until_thumbnails_exist(self):
+        with self.captureOnCommitCallbacks(execute=False):
+            item = Item.objects.create(name="Kettle", image=self.upload('kettle.jpg', mode='RGB'))
+        response = self.client.get(reverse('catalog:item_detail', kwargs={'item_id': item.id}))
+        self.assertContains(response, f'src="{item.image.url}"')
+        # Rendering the page queued the missing thumbnails.
+        self.assertEqual(sorted(available_variants(item.image.name)), ['jpeg', 'webp'])
+
+    def test_backfill_command(self):
+        with self.captureOnCommitCallbacks(execute=False):
+            item = Item.objects.create(name="Mug", image=self.upload('mug.jpg', mode='RGB', size=(120, 90)))
+        out = StringIO()
+        call_command('generate_thumbnails', workers=1, stdout=out)
+        self.assertIn("Wrote 4 thumbnails for 1 images", out.getvalue())
+        with Image.open(os.path.join(self.media_root, thumbnail_name(item.image.name, 200, 'jpeg'))) as thumb:
+            # Never upscaled.
+            self.assertEqual(thumb.size, (120, 90))
+
+
+class AsyncViewTest(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.factory = AsyncRequestFactory()
+        self.item = Item.objects.create(name="Organic Milk")
+        self.spar = Store.objects.create(name="Spar")
+        for day in range(3):
+            PriceHistory.objects.create(
+                item=self.item, store=self.spar, price=Decimal(400 + day), product_url='https://spar.example/milk',
+                date_recorded=timezone.now() - timezone.timedelta(days=3 - day),
+            )
+
+    def call(self, view, path, data=None, **kwargs):
+        return async_to_sync(view)(self.factory.get(path, data or {}), **kwargs)
+
+    def test_search_matches_sync_view(self):
+        path = reverse('catalog:ajax_search_items')
+        response = self.call(async_views.ajax_search_items, path, {'q': 'milk'})
+        self.assertContains(response, "Organic Milk")
+        self.assertEqual(response.content, self.client.get(path, {'q': 'milk'}).content)
+
+    def test_last_purchase_details(self):
+        path = reverse('catalog:ajax_get_last_purchase_details', kwargs={'item_id': self.item.id})
+        response = self.call(async_views.ajax_get_last_purchase_details, path, item_id=self.item.id)
+        self.assertEqual(json.loads(response.content), {'store_id': self.spar.id, 'product_url': 'https://spar.example/milk'})
+
+        empty = Item.objects.create(name="Bread")
+        response = self.call(async_views.ajax_get_last_purchase_details, path, item_id=empty.id)
+        self.assertEqual(json.loads(response.content), {'store_id': None, 'product_url': None})
+        with self.assertRaises(Http404):
+            self.call(async_views.ajax_get_last_purchase_details, path, item_id=empty.id + 100)
+
+    def test_price_history_pages_match_sync_view(self):
+        path = reverse('catalog:api_price_history', kwargs={'item_id': self.item.id})
+        first = json.loads(self.call(async_views.api_price_history, path, {'limit': 2}, item_id=self.item.id).content)
+        self.assertEqual([row['price'] for row in first['results']], ['402.00', '401.00'])
+        second = self.call(
+            async_views.api_price_history, path, {'limit': 2, 'cursor': first['next_cursor']}, item_id=self.item.id,
+        )
+        self.assertEqual(
+            json.loads(second.content),
+            json.loads(self.client.get(path, {'limit': 2, 'cursor': first['next_cursor']}).content),
+        )
+        response = self.call(async_views.api_price_history, path, {'resolution': 'day'}, item_id=self.item.id)
+        self.assertEqual(len(json.loads(response.content)['results']), 3)
+        self.assertEqual(self.call(async_views.api_price_history, path, {'cursor': '!!'}, item_id=self.item.id).status_code, 400)
+
+    def test_load_generator(self):
+        server = ThreadingHTTPServer(('127.0.0.1', 0), _StubShopHandler)
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        self.addCleanup(server.server_close)
+        self.addCleanup(server.shutdown)
+        result = run_load(f"http://127.0.0.1:{server.server_port}", ['/product/1', '/broken'], concurrency=4, total=20)
+        self.assertEqual((result['requests'], result['errors']), (20, 10))
+        self.assertLessEqual(result['p50_ms'], result['p99_ms'])
+
+
+class LastPurchaseBatchTest(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.spar = Store.objects.create(name="Spar")
+        self.tesco = Store.objects.create(name="Tesco")
+        self.milk = Item.objects.create(name="Milk")
+        self.bread = Item.objects.create(name="Bread")
+        self.salt = Item.objects.create(name="Salt")
+        now = timezone.now()
+        PriceHistory.objects.create(item=self.milk, store=self.spar, price=Decimal('400'), date_recorded=now - timezone.timedelta(days=2))
+        PriceHistory.objects.create(
+            item=self.milk, store=self.tesco, price=Decimal('390'), product_url='https://tesco.example/milk',
+            date_recorded=now - timezone.timedelta(days=1),
+        )
+        PriceHistory.objects.create(item=self.bread, store=self.spar, price=Decimal('650'), date_recorded=now)
+        self.url = reverse('catalog:ajax_get_last_purchase_details_batch')
+        self.expected = {
+            str(self.milk.id): {'store_id': self.tesco.id, 'product_url': 'https://tesco.example/milk'},
+            str(self.bread.id): {'store_id': self.spar.id, 'product_url': None},
+            str(self.salt.id): {'store_id': None, 'product_url': None},
+        }
+
+    def test_one_query_for_many_items(self):
+        ids = f"{self.milk.id},{self.bread.id},{self.salt.id},{self.milk.id}"
+        with self.assertNumQueries(1):
+            response = self.client.get(self.url, {'ids': ids})
+        self.assertEqual(response.json()['results'], self.expected)
+        # Agrees with the per-item endpoint.
+        single = self.client.get(reverse('catalog:ajax_get_last_purchase_details', kwargs={'item_id': self.milk.id}))
+        self.assertEqual(single.json(), self.expected[str(self.milk.id)])
+
+    def test_invalid_ids(self):
+        self.assertEqual(self.client.get(self.url).status_code, 400)
+        self.assertEqual(self.client.get(self.url, {'ids': '1,x'}).status_code, 400)
+        self.assertEqual(self.client.get(self.url, {'ids': ','.join(map(str, range(1, 502)))}).status_code, 400)
+
+    def test_async_view(self):
+        request = AsyncRequestFactory().get(self.url, {'ids': f"{self.milk.id},{self.bread.id},{self.salt.id}"})
+        response = async_to_sync(async_views.ajax_get_last_purchase_details_batch)(request)
+        self.assertEqual(json.loads(response.content)['results'], self.expected)
+
+    def test_item_list_embeds_last_purchases(self):
+        response = self.client.get(reverse('catalog:item_list'))
+        match = re.search(r'<script id="lastPurchaseData" type="application/json">(.*?)</script>', response.content.decode())
+        self.assertEqual(json.loads(match.group(1)), self.expected)
+
+
+@override_settings(CATALOG_PROFILING=True, CATALOG_PROFILING_SAMPLE_RATE=1.0, CATALOG_PROFILING_REPEAT_THRESHOLD=3)
+class ProfilingMiddlewareTest(TestCase):
+    def setUp(self):
+        cache.clear()
+        profiling.stats.reset()
+        self.addCleanup(profiling.uninstall_template_timer)
+        store = Store.objects.create(name="Spar")
+        for n in range(3):
+            item = Item.objects.create(name=f"Tea {n}")
+            PriceHistory.objects.create(item=item, store=store, price=Decimal('500'))
+
+    def test_query_signatures(self):
+        self.assertEqual(
+            profiling.query_signature("SELECT * FROM t WHERE id = 12 AND name = 'x''y' AND pk IN (1, 2, 3)"),
+            "SELECT * FROM t WHERE id = ? AND name = ? AND pk IN (...)",
+        )
+
+    def test_server_timing_and_percentiles(self):
+        from django.contrib.auth.models import User
+        with self.modify_settings(MIDDLEWARE={'prepend': 'catalog.profiling.ProfilingMiddleware'}):
+            response = self.client.get(reverse('catalog:item_list'))
+            self.assertRegex(response['Server-Timing'], r'^total;dur=[\d.]+, db;dur=[\d.]+;desc="\d+ queries", render;dur=[\d.]+')
+            self.assertEqual(self.client.get(reverse('catalog:perf_stats'), REMOTE_ADDR='127.0.0.1').status_code, 403)
+            self.client.force_login(User.objects.create_user('ops', is_staff=True))
+            report = self.client.get(reverse('catalog:perf_stats')).json()
+        self.assertNotIn('catalog:perf_stats', report['views'])
+        item_list = report['views']['catalog:item_list']
+        self.assertEqual(item_list['sampled_requests'], 1)
+        self.assertGreater(item_list['queries']['p50'], 0)
+        self.assertGreater(item_list['render_ms']['p99'], 0)
+
+    def test_repeated_queries_are_flagged(self):
+        def n_plus_one(request):
+            names = [Item.objects.get(pk=item.pk).name for item in Item.objects.all()]
+            return HttpResponse(', '.join(names))
+
+        middleware = profiling.ProfilingMiddleware(n_plus_one)
+        response = middleware(RequestFactory().get('/'))
+        self.assertIn('dup;desc="1 repeated queries"', response['Server-Timing'])
+        repeated = profiling.stats.report()['unresolved']['repeated_queries']
+        self.assertIn('WHERE "catalog_item"."id" = ?', repeated[0]['signature'])
+
+    def test_unsampled_requests_pass_through(self):
+        with override_settings(CATALOG_PROFILING_SAMPLE_RATE=0):
+            response = profiling.ProfilingMiddleware(lambda request: HttpResponse())(RequestFactory().get('/'))
+        self.assertNotIn('Server-Timing', response)
+        self.assertEqual(profiling.stats.report(), {})
+
+    def test_disabled_middleware_leaves_templates_alone(self):
+        render = Template.render
+        with override_settings(CATALOG_PROFILING=False):
+            with self.assertRaises(MiddlewareNotUsed):
+                profiling.ProfilingMiddleware(lambda request: HttpResponse())
+        self.assertIs(Template.render, render)
+
+        profiling.ProfilingMiddleware(lambda request: HttpResponse())
+        self.assertTrue(Template.render.profiling)
+        profiling.uninstall_template_timer()
+        self.assertIs(Template.render, render)
+
+    async def test_async_requests_are_profiled(self):
+        async def view(request):
+            names = [item.name async for item in Item.objects.order_by('name')]
+            return HttpResponse(', '.join(names))
+
+        middleware = profiling.ProfilingMiddleware(view)
+        self.assertTrue(iscoroutinefunction(middleware))
+        response = await middleware(AsyncRequestFactory().get('/'))
+        self.assertEqual(response.content, b'Tea 0, Tea 1, Tea 2')
+        self.assertIn('db;dur=', response['Server-Timing'])
+        self.assertIn('desc="1 queries"', response['Server-Timing'])
+
+
+class SyntheticCatalogTest(TestCase):
+    SIZES = {'items': 30, 'tags': 5, 'stores': 4, 'prices': 601, 'attributes': 8, 'specs_per_item': 3, 'days': 30}
+
+    def test_generation_is_deterministic(self):
+        first, second, other = SyntheticCatalog(**self.SIZES), SyntheticCatalog(**self.SIZES), SyntheticCatalog(**self.SIZES, seed=7)
+        for catalog in (first, second, other):
+            catalog.item_ids, catalog.store_ids = list(range(1, 31)), [1, 2, 3, 4]
+        rows = list(first.price_rows())
+        self.assertEqual(len(rows), 601)
+        self.assertEqual(rows, list(second.price_rows()))
+        self.assertNotEqual(rows, list(other.price_rows()))
+
+    def test_large_vocabularies_stay_unique(self):
+        words = SyntheticCatalog(tags=10000).vocabulary
+        self.assertEqual(len(words), 20000)
+        self.assertEqual(len(set(words)), 20000)
+        self.assertEqual(words, SyntheticCatalog(tags=10000).vocabulary)
+
+    def test_seed_and_benchmark(self):
+        out = StringIO()
+        call_command('seed_synthetic', **self.SIZES, stdout=out)
+        self.assertEqual(Item.objects.count(), 30)
+        self.assertEqual(PriceHistory.objects.count(), 601)
+        self.assertEqual(ItemSpecification.objects.count(), 90)
+        self.assertEqual(LatestPrice.objects.count(), PriceHistory.objects.values('item', 'store').distinct().count())
+        numeric = ItemSpecification.objects.filter(attribute__value_type='number').first()
+        self.assertEqual(numeric.value_numeric, Decimal(numeric.value_text))
+        self.assertIn("Seeded 30 items and 601 price rows", out.getvalue())
+
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, 'bench.json')
+            call_command('run_benchmarks', repeat=1, warmup=0, output=path, stdout=StringIO())
+            with open(path) as handle:
+                report = json.load(handle)
+        self.assertEqual(PriceHistory.objects.count(), 601)
+        self.assertEqual(report['environment']['rows']['items'], 30)
+        self.assertIn('view:add_price_entry', report['results'])
+        self.assertGreater(report['results']['view:item_detail:cold']['queries'], report['results']['view:item_detail:warm']['queries'])
+        self.assertEqual(compare(report, report)['orm:item_price_stats']['ratio'], 1.0)
+
+
+class DatabaseRoutingTest(SimpleTestCase):
+    databases = {'default', READ_ALIAS}
+
+    def test_reads_go_to_the_read_alias_outside_write_transactions(self):
+        router = ReadWriteRouter()
+        self.assertEqual(router.db_for_read(Item), READ_ALIAS)
+        self.assertEqual(router.db_for_write(Item), 'default')
+        with patch.object(connections['default'], 'in_atomic_block', True):
+            self.assertEqual(router.db_for_read(Item), 'default')
+        self.assertTrue(router.allow_migrate('default', 'catalog'))
+        self.assertFalse(router.allow_migrate(READ_ALIAS, 'catalog'))
+
+    def test_cache_builders_read_from_the_writer(self):
+        router = ReadWriteRouter()
+        cache.clear()
+        self.assertEqual(get_or_build('routing', (), ('routing',), lambda: router.db_for_read(Item)), 'default')
+        self.assertEqual(
+            async_to_sync(aget_or_build)('routing', (1,), ('routing',), lambda: router.db_for_read(Item)), 'default',
+        )
+        self.assertEqual(router.db_for_read(Item), READ_ALIAS)
+
+    @skipUnless(
+        settings.DATABASES['default']['ENGINE'].endswith('sqlite3') and READ_ALIAS in settings.DATABASES,
+        "SQLite settings with a read alias only",
+    )
+    def test_reads_are_not_blocked_by_bulk_ingestion(self):
+        """The configured 'default' and read aliases, pointed at a file database:
+        ORM reads keep answering while the writer holds long bulk-insert transactions."""
+        hold = 0.2
+        reports, failures = [], []
+
+        def scenario():
+            try:
+                call_command('migrate', verbosity=0)
+                with connections['default'].cursor() as cursor:
+                    cursor.execute('PRAGMA journal_mode')
+                    self.assertEqual(cursor.fetchone()[0], 'wal')
+                store = Store.objects.create(name="Spar")
+                items = Item.objects.bulk_create([Item(name=f"Item {i}") for i in range(100)])
+                self.assertEqual(PriceHistory.objects.all().db, READ_ALIAS)
+
+                def read():
+                    list(PriceHistory.objects.values('item').annotate(top=Max('price')).order_by('item')[:20])
+
+                def write_batch(n):
+                    with transaction.atomic():
+                        PriceHistory.objects.bulk_create(
+                            PriceHistory(item=items[i % 100], store=store, price=n * i) for i in range(1000)
+                        )
+                        time.sleep(hold)
+
+                reports.append(ingestion_stress(write_batch, read, batches=5, readers=3))
+            except BaseException as exc:
+                failures.append(exc)
+            finally:
+                connections.close_all()
+
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, 'stress.sqlite3')
+            # Every thread's connections share these settings dicts. Only the
+            # threads started below connect with them; this thread keeps its
+            # open connections to the test database.
+            with patch.dict(connections['default'].settings_dict, NAME=path), \
+                    patch.dict(connections[READ_ALIAS].settings_dict, NAME=path):
+                thread = threading.Thread(target=scenario)
+                thread.start()
+                thread.join()
+        if failures:
+            raise failures[0]
+
+        report = reports[0]
+        self.assertEqual(report['reads']['errors'], 0)
+        # Waiting for the writer would take a whole transaction per read.
+        self.assertGreater(report['reads']['requests'], 5 * 3)
+        self.assertLess(report['reads']['max_ms'], hold * 1000)
+
+
+class PriceArchiveTest(TransactionTestCase):
+    # Archive tables are created outside any transaction, as in production.
+    databases = '__all__'
+
+    def setUp(self):
+        cache.clear()
+        self.now = timezone.now()
+        self.item = Item.objects.create(name="Olive Oil")
+        self.spar = Store.objects.create(name="Spar")
+        self.tesco = Store.objects.create(name="Tesco")
+        for days_ago, hours, price, pre_sale, count in (
+            (500, 0, '1000.00', None, 1), (500, 5, '900.00', '1000.00', 3), (460, 0, '1100.00', None, 1),
+            (420, 1, '950.00', '1200.00', 2), (30, 0, '1050.00', None, 1), (10, 0, '990.00', None, 4),
+            (2, 0, '1010.00', None, 1),
+        ):
+            PriceHistory.objects.create(
+                item=self.item, store=self.spar, price=Decimal(price), on_sale=pre_sale is not None,
+                pre_sale_price=Decimal(pre_sale) if pre_sale else None, observation_count=count,
+                date_recorded=self.now - timezone.timedelta(days=days_ago) + timezone.timedelta(hours=hours),
+            )
+        # Tesco's only row is old, but it is the current price.
+        self.tesco_entry = PriceHistory.objects.create(
+            item=self.item, store=self.tesco, price=Decimal('1200.00'), date_recorded=self.now - timezone.timedelta(days=480),
+        )
+
+    def tearDown(self):
+        for month in _table_months('default'):
+            with connection.schema_editor() as editor:
+                editor.delete_model(archive_model(month))
+        cache.clear()
+
+    def history(self, **params):
+        url = reverse('catalog:api_price_history', kwargs={'item_id': self.item.id})
+        return self.client.get(url, params).json()
+
+    def all_pages(self):
+        rows, cursor = [], None
+        while True:
+            page = self.history(limit=2, **({'cursor': cursor} if cursor else {}))
+            rows.extend(page['results'])
+            cursor = page['next_cursor']
+            if not cursor:
+                return rows
+
+    def test_reads_are_unchanged_by_archival(self):
+        stats = item_price_stats(self.item.id, now=self.now)
+        by_month = self.history(resolution='month')
+        by_day = self.history(resolution='day', store=self.spar.id)
+        pages = self.all_pages()
+
+        stats_run = archive_price_history(after_days=365, batch_size=2, now=self.now)
+        self.assertEqual(stats_run.rows_archived, 4)
+        self.assertEqual(PriceHistory.objects.count(), 4)
+        self.assertTrue(PriceHistory.objects.filter(pk=self.tesco_entry.pk).exists())
+        self.assertEqual(PriceRollup.objects.aggregate(total=Sum('observations'))['total'], 7)
+
+        archived_stats = item_price_stats(self.item.id, now=self.now)
+        for before, after in zip(stats, archived_stats):
+            for key in ('observations', 'first_seen', 'current', 'all_time_low', 'all_time_high', 'sale_frequency',
+                        'avg_discount', 'max_discount', 'median'):
+                self.assertAlmostEqual(before[key], after[key], places=6, msg=key)
+            self.assertAlmostEqual(before['mean'], after['mean'], places=6)
+        self.assertEqual(self.history(resolution='month'), by_month)
+        self.assertEqual(self.history(resolution='day', store=self.spar.id), by_day)
+        self.assertEqual(self.all_pages(), pages)
+
+        response = self.client.get(reverse('catalog:item_detail', kwargs={'item_id': self.item.id}))
+        self.assertContains(response, "7 older observations")
+
+    def test_export_includes_archived_months(self):
+        before = list(export_rows())
+        archive_price_history(after_days=365, now=self.now)
+        self.assertEqual(list(export_rows()), before)
+        self.assertEqual(len(list(export_rows(store=self.spar.id, until=self.now - timezone.timedelta(days=450)))), 3)
+        with override_settings(CATALOG_INGEST_TOKEN='secret'):
+            response = self.client.get(reverse('catalog:api_export_prices'), {'format': 'ndjson'}, HTTP_AUTHORIZATION="Bearer secret")
+        rows = [json.loads(line) for line in b''.join(response.streaming_content).splitlines()]
+        self.assertEqual(len(rows), 8)
+        self.assertEqual((rows[0]['item'], rows[0]['store'], rows[0]['price']), ("Olive Oil", "Spar", '1000.00'))
+
+    def test_rerun_after_interrupted_batch(self):
+        old = list(PriceHistory.objects.filter(date_recorded__lt=self.now - timezone.timedelta(days=490)).values(
+            'id', 'item_id', 'store_id', 'price', 'currency', 'date_recorded', 'on_sale', 'pre_sale_price',
+            'product_url', 'last_seen', 'observation_count',
+        ))
+        # The archive copy committed, the hot delete did not.
+        model = ensure_archive_table(month_of(old[0]['date_recorded']))
+        model.objects.bulk_create([model(**row) for row in old])
+        self.assertEqual(len(self.all_pages()), 8)
+
+        archive_price_history(after_days=365, now=self.now)
+        self.assertEqual(archive_price_history(after_days=365, now=self.now).rows_archived, 0)
+        self.assertEqual(PriceRollup.objects.aggregate(total=Sum('observations'))['total'], 7)
+        self.assertEqual(len(self.all_pages()), 8)
@@ -0,0 +1,184 @@
+# PriceTracker/catalog/thumbnails.py
+import logging
+import multiprocessing
+import os
+import threading
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+from django.conf import settings
+from django.core.files.storage import default_storage
+from PIL import Image, ImageOps
+
+from .cache import invalidate, item_namespace
+
+logger = logging.getLogger(__name__)
+
+THUMBNAIL_DIR = 'thumbnails'
+DEFAULT_WIDTHS = (160, 320, 640)
+WEBP = 'webp'
+# Pillow format name and file extension of each output format.
+FORMATS = {'webp': ('WEBP', 'webp'), 'jpeg': ('JPEG', 'jpg'), 'png': ('PNG', 'png')}
+QUALITY = 80
+
+
+def thumbnail_widths():
+    return tuple(sorted(getattr(settings, 'CATALOG_THUMBNAIL_WIDTHS', DEFAULT_WIDTHS)))
+
+
+def fallback_format(name):
+    """The non-WebP format for browsers without WebP: PNG keeps transparency, everything else is JPEG."""
+    return 'png' if os.path.splitext(name)[1].lower() in ('.png', '.gif', '.webp') else 'jpeg'
+
+
+def thumbnail_name(name, width, fmt):
+    stem = os.path.splitext(name)[0]
+    return f"{THUMBNAIL_DIR}/{stem}-{width}w.{FORMATS[fmt][1]}"
+
+
+def variant_names(name):
+    """(width, format, storage name) of every thumbnail of the image ``name``."""
+    return [
+        (width, fmt, thumbnail_name(name, width, fmt))
+        for fmt in (WEBP, fallback_format(name))
+        for width in thumbnail_widths()
+    ]
+
+
+def render_thumbnails(source, targets, quality=QUALITY):
+    """Writes the (width, format, path) targets for the image file ``source``.
+
+    Runs in a worker process, so it only touches the filesystem. Sizes are
+    made largest first, each from the previous one, and never upscaled.
+    Files are written under a temporary name and renamed into place so a
+    request never sees half a thumbnail. Returns the paths written.
+    """
+    written = []
+    with Image.open(source) as original:
+        image = ImageOps.exif_transpose(original)
+        image.load()
+    by_width = {}
+    for width, fmt, path in targets:
+        by_width.setdefault(width, []).append((fmt, path))
+    current = image
+    for width in sorted(by_width, reverse=True):
+        if current.width > width:
+            current = current.copy()
+            current.thumbnail((width, current.height), Image.LANCZOS)
+        for fmt, path in by_width[width]:
+            output = current
+            if fmt == 'jpeg' and output.mode not in ('RGB', 'L'):
+                output = output.convert('RGB')
+            elif output.mode == 'P':
+                output = output.convert('RGBA')
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            partial = f"{path}.{os.getpid()}.tmp"
+            output.save(partial, format=FORMATS[fmt][0], quality=quality)
+            os.replace(partial, path)
+            written.append(path)
+    return written
+
+
+def _local_path(name):
+    try:
+        return default_storage.path(name)
+    except NotImplementedError:
+        # Remote storages have no local files for the workers to read.
+        return None
+
+
+def missing_targets(name, force=False):
+    """Targets for render_thumbnails() that don't exist yet (all of them with ``force``)."""
+    source = _local_path(name)
+    if source is None or not os.path.exists(source):
+        return None, []
+    targets = [(width, fmt, _local_path(thumbnail)) for width, fmt, thumbnail in variant_names(name)]
+    return source, [target for target in targets if force or not os.path.exists(target[2])]
+
+
+def available_variants(name):
+    """{format: [(width, url), ...]} for the thumbnails of ``name`` already on disk."""
+    variants = {}
+    for width, fmt, thumbnail in variant_names(name):
+        path = _local_path(thumbnail)
+        if path is not None and os.path.exists(path):
+            variants.setdefault(fmt, []).append((width, default_storage.url(thumbnail)))
+    return variants
+
+
+_executor = None
+_executor_lock = threading.Lock()
+_pending = set()
+
+
+def get_executor():
+    """The shared worker pool, or None when CATALOG_THUMBNAIL_WORKERS is 0 (render inline)."""
+    global _executor
+    workers = getattr(settings, 'CATALOG_THUMBNAIL_WORKERS', 2)
+    if workers <= 0:
+        return None
+    with _executor_lock:
+        if _executor is None:
+            # Spawned, not forked: the web server's threads and database
+            # connections must not be copied into the workers.
+            _executor = ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context('spawn'))
+        return _executor
+
+
+def _finished(item_id, name, future):
+    with _executor_lock:
+        _pending.discard(name)
+    try:
+        future.result()
+    except Exception:
+        logger.exception("Thumbnail generation failed for %s", name)
+        return
+    # Pages rendered before the thumbnails existed point at the original.
+    invalidate('items', item_namespace(item_id))
+
+
+def generate_thumbnails(item_id, name):
+    """Makes the missing thumbnails of an item's image in the background.
+
+    Returns immediately; duplicate requests for an image already being
+    processed are dropped. Without a worker pool the work is done inline.
+    """
+    source, targets = missing_targets(name)
+    if not targets:
+        return
+    executor = get_executor()
+    if executor is None:
+        render_thumbnails(source, targets)
+        invalidate('items', item_namespace(item_id))
+        return
+    with _executor_lock:
+        if name in _pending:
+            return
+        _pending.add(name)
+    future = executor.submit(render_thumbnails, source, targets)
+    future.add_done_callback(lambda future: _finished(item_id, name, future))
+
+
+def backfill_thumbnails(images, force=False, workers=None):
+    """Renders thumbnails for (item id, image name) pairs on a dedicated pool and waits.
+
+    Returns (images processed, files written, failures).
+    """
+    workers = workers or os.cpu_count() or 1
+    processed = written = 0
+    failures = []
+    with ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context('spawn')) as executor:
+        futures = {}
+        for item_id, name in images:
+            source, targets = missing_targets(name, force=force)
+            if targets:
+                futures[executor.submit(render_thumbnails, source, targets)] = (item_id, name)
+        for future in as_completed(futures):
+            item_id, name = futures[future]
+            try:
+                written += len(future.result())
+            except Exception as exc:
+                failures.append((name, exc))
+                continue
+            processed += 1
+            invalidate('items', item_namespace(item_id))
+    return processed, written, failures
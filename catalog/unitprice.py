@@ -0,0 +1,151 @@
+# PriceTracker/catalog/unitprice.py
+from decimal import Decimal
+
+from django.conf import settings
+from django.db import router, transaction
+
+from .cache import invalidate
+from .currency import MissingRate, base_currency, get_rate_cache
+from .models import ItemSpecification, LatestPrice, UnitPrice
+from .tagging import ItemTag, resolve_tag_ids
+
+# Package-size units we can compare, as (base unit, factor to the base unit).
+UNIT_CONVERSIONS = {
+    'mg': ('kg', Decimal('0.000001')),
+    'g': ('kg', Decimal('0.001')),
+    'dkg': ('kg', Decimal('0.01')),
+    'kg': ('kg', Decimal('1')),
+    'ml': ('l', Decimal('0.001')),
+    'cl': ('l', Decimal('0.01')),
+    'dl': ('l', Decimal('0.1')),
+    'l': ('l', Decimal('1')),
+}
+BASE_UNITS = ('kg', 'l')
+# Slugs taken as package sizes without the is_package_size flag.
+PACKAGE_SIZE_SLUGS = ('weight', 'net-weight', 'net_weight', 'volume', 'net-volume', 'net_volume')
+UNIT_PRICE_PLACES = Decimal('0.0001')
+REFRESH_BATCH_SIZE = 500
+
+
+def to_base_unit(value, unit):
+    """Returns (quantity in kg or l, base unit), or None if ``unit`` isn't a mass or volume."""
+    conversion = UNIT_CONVERSIONS.get((unit or '').strip().lower())
+    if conversion is None or value is None or value <= 0:
+        return None
+    base_unit, factor = conversion
+    return value * factor, base_unit
+
+
+def is_package_size(attribute, preferred=()):
+    return attribute.is_package_size or attribute.slug in preferred or attribute.slug in PACKAGE_SIZE_SLUGS
+
+
+def pick_quantity(specifications):
+    """The specification that gives an item's package size, with its converted quantity.
+
+    Only package-size attributes count: those flagged is_package_size,
+    listed in ``CATALOG_UNIT_PRICE_ATTRIBUTES`` or with a PACKAGE_SIZE_SLUGS
+    slug, so per-serving values such as "Fat 10 g" are never used. Listed
+    slugs win, in that order; otherwise the first in display order.
+    Returns (specification, quantity, base unit) or None.
+    """
+    preferred = list(getattr(settings, 'CATALOG_UNIT_PRICE_ATTRIBUTES', []))
+    usable = []
+    for spec in specifications:
+        if spec.attribute.value_type != 'number' or not is_package_size(spec.attribute, preferred):
+            continue
+        converted = to_base_unit(spec.value_numeric, spec.attribute.unit)
+        if converted:
+            usable.append((spec, *converted))
+    if not usable:
+        return None
+    ranked = sorted(
+        usable,
+        key=lambda row: preferred.index(row[0].attribute.slug) if row[0].attribute.slug in preferred else len(preferred),
+    )
+    return ranked[0]
+
+
+def _base_unit_price(rates, unit_price, currency):
+    try:
+        return rates.convert(unit_price, currency, base_currency()).quantize(UNIT_PRICE_PLACES)
+    except MissingRate:
+        return None
+
+
+def refresh_unit_prices(item_ids):
+    """Recomputes the UnitPrice rows of the given items from LatestPrice.
+
+    Two reads (specifications and latest prices) and one delete plus one
+    bulk insert per batch of items.
+    """
+    item_ids = sorted(set(item_ids))
+    using = router.db_for_write(UnitPrice)
+    rates = get_rate_cache()
+    for start in range(0, len(item_ids), REFRESH_BATCH_SIZE):
+        batch = item_ids[start:start + REFRESH_BATCH_SIZE]
+        specifications = {}
+        for spec in (
+            ItemSpecification.objects.filter(item_id__in=batch, value_numeric__gt=0)
+            .select_related('attribute')
+            .order_by('item_id', 'attribute__display_order', 'attribute__name')
+        ):
+            specifications.setdefault(spec.item_id, []).append(spec)
+        quantities = {item_id: pick_quantity(specs) for item_id, specs in specifications.items()}
+
+        rows = []
+        for latest in LatestPrice.objects.filter(item_id__in=[item_id for item_id, q in quantities.items() if q]):
+            spec, quantity, base_unit = quantities[latest.item_id]
+            unit_price = (latest.price / quantity).quantize(UNIT_PRICE_PLACES)
+            rows.append(UnitPrice(
+                item_id=latest.item_id, store_id=latest.store_id, specification=spec,
+                price=latest.price, currency=latest.currency, quantity=quantity, base_unit=base_unit,
+                unit_price=unit_price, base_unit_price=_base_unit_price(rates, unit_price, latest.currency),
+            ))
+        with transaction.atomic(using=using):
+            UnitPrice.objects.filter(item_id__in=batch).delete()
+            UnitPrice.objects.bulk_create(rows)
+    invalidate('unit_prices')
+
+
+def schedule_refresh(item_ids, using=None):
+    """Refreshes the items' unit prices once the current transaction commits,
+    when LatestPrice and the specifications are final."""
+    item_ids = set(item_ids)
+    if item_ids:
+        transaction.on_commit(lambda: refresh_unit_prices(item_ids), using=using)
+
+
+def refresh_currency_unit_prices(currencies):
+    """Recomputes the unit prices quoted in ``currencies``, after their exchange rates changed."""
+    refresh_unit_prices(
+        UnitPrice.objects.filter(currency__in=set(currencies)).values_list('item_id', flat=True).distinct()
+    )
+
+
+def rebuild_unit_prices(batch_size=REFRESH_BATCH_SIZE):
+    """Recomputes every item's unit prices; returns the number of rows written."""
+    sized = ItemSpecification.objects.filter(value_numeric__gt=0).order_by()
+    UnitPrice.objects.exclude(item_id__in=sized.values('item_id')).delete()
+    item_ids = list(sized.values_list('item_id', flat=True).distinct())
+    for start in range(0, len(item_ids), batch_size):
+        refresh_unit_prices(item_ids[start:start + batch_size])
+    return UnitPrice.objects.count()
+
+
+def best_value(tag_name, base_unit, limit=50):
+    """The cheapest unit prices among items carrying ``tag_name``, best first.
+
+    Ranked in the base currency, so prices in different currencies compare;
+    prices in a currency without a rate are left out. Walks the
+    (base_unit, base_unit_price) index, so it stops after ``limit`` rows.
+    """
+    tag_ids = resolve_tag_ids([tag_name])
+    if not tag_ids:
+        return []
+    tagged = ItemTag.objects.filter(tag_id__in=tag_ids).values('item_id')
+    return list(
+        UnitPrice.objects.filter(base_unit=base_unit, base_unit_price__isnull=False, item_id__in=tagged)
+        .select_related('item', 'store', 'specification__attribute')
+        .order_by('base_unit_price', 'id')[:limit]
+    )
@@ -1,13 +1,23 @@
 # PriceTracker/catalog/urls.py
+from django.conf import settings
 from django.urls import path
-from . import views
+from . import async_views, views
+
+# Under ASGI the read-only AJAX/API endpoints can run as coroutines.
+read_views = async_views if getattr(settings, 'CATALOG_ASYNC_VIEWS', False) else views
 
 app_name = 'catalog'
 
 urlpatterns = [
     path('items/', views.item_list, name='item_list'),
     path('item/<int:item_id>/', views.item_detail, name='item_detail'),
-    path('ajax/search-items/', views.ajax_search_items, name='ajax_search_items'),
+    path('tag/<str:tag_name>/best-value/', views.tag_best_value, name='tag_best_value'),
+    path('ajax/search-items/', read_views.ajax_search_items, name='ajax_search_items'),
     path('item/<int:item_id>/add_price/', views.add_price_entry, name='add_price_entry'),
-    path('ajax/item/<int:item_id>/last-purchase-details/', views.ajax_get_last_purchase_details, name='ajax_get_last_purchase_details'),
+    path('ajax/item/<int:item_id>/last-purchase-details/', read_views.ajax_get_last_purchase_details, name='ajax_get_last_purchase_details'),
+    path('ajax/last-purchase-details/', read_views.ajax_get_last_purchase_details_batch, name='ajax_get_last_purchase_details_batch'),
+    path('api/item/<int:item_id>/price-history/', read_views.api_price_history, name='api_price_history'),
+    path('api/prices/ingest/', views.api_ingest_prices, name='api_ingest_prices'),
+    path('api/prices/export/', views.api_export_prices, name='api_export_prices'),
+    path('_perf/', views.perf_stats, name='perf_stats'),
 ]
\ No newline at end of file
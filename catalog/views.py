@@ -1,90 +1,220 @@
 # PriceTracker/catalog/views.py
 from django.shortcuts import render, get_object_or_404, redirect
-from .models import Item, PriceHistory, Tag, Store
-from django.db.models import Q
-from django.http import HttpResponse, JsonResponse
+from .models import Item, LatestPrice, PriceHistory, Tag, Store
+from django.db.models import Max, Min, Prefetch, Q, Sum
+from django.db.models.functions import Lower
+from django.http import HttpResponse, JsonResponse, StreamingHttpResponse
 from django.template.loader import render_to_string
 from django.contrib import messages
+from django.conf import settings
+from django.views.decorators.csrf import csrf_exempt
+from django.views.decorators.http import require_GET, require_POST
+import hmac
+from itertools import groupby
+import json
+from django.utils.safestring import mark_safe
+from .analytics import item_price_stats
+from .archive import archived_entries, rollup_entries
+from .cache import conditional, get_or_build, item_namespace
+from .currency import MissingRate, best_offer, display_currency, get_rate_cache
+from .export import EXPORT_FORMATS, export_chunks, export_filename, export_rows
+from .facets import filter_items_by_specs, parse_spec_filters, spec_facets
 from .forms import PriceHistoryForm
+from .ingest import PriceIngestor, read_ndjson
+from .history import InvalidCursor, RESOLUTIONS, downsample_price_history, page_price_history, parse_datetime_param
+from .profiling import stats as profiling_stats
+from .search import search_items
+from .tagging import filter_items_by_tags, parse_tag_names, tag_cloud
+from .unitprice import BASE_UNITS, best_value
 
-def item_list(request):
-    current_search_query = request.GET.get('q', '') 
-    selected_tag_names = [tag.strip() for tag in request.GET.get('tags', '').split(',') if tag.strip()]
+PRICE_HISTORY_PAGE_SIZE = 100
+PRICE_HISTORY_MAX_PAGE_SIZE = 1000
+INGEST_MAX_REPORTED_ERRORS = 100
+LAST_PURCHASE_BATCH_MAX = 500
 
-    items = Item.objects.all()
+def _filter_items(search_query, selected_tag_names, spec_filters=()):
+    """Shared by the full page and the live-search endpoint."""
+    items = Item.objects.prefetch_related(
+        Prefetch('latest_prices', queryset=LatestPrice.objects.select_related('store'))
+    )
+    items = filter_items_by_tags(items, selected_tag_names)
+    items = filter_items_by_specs(items, spec_filters)
+    return search_items(items, search_query)
 
-    if current_search_query:
-        items = items.filter(name__icontains=current_search_query)
-    
-    if selected_tag_names:
-        for tag_name in selected_tag_names:
-            items = items.filter(tags__name__iexact=tag_name)
+LISTING_NAMESPACES = ('items', 'tags', 'stores', 'attributes', 'exchange_rates')
+
+def _listing_builder(request, search_query, selected_tag_names, spec_filters):
+    def build():
+        items = _filter_items(search_query, selected_tag_names, spec_filters)
+        rates, currency = get_rate_cache(), display_currency()
+        last_purchases = {}
+        for item in items:
+            item.best_offer, item.best_offer_amount = best_offer(item.latest_prices.all(), rates, currency)
+            # Prefills the "Add Price" form without a request per item.
+            newest = max(item.latest_prices.all(), key=lambda latest: (latest.date_recorded, latest.price_entry_id), default=None)
+            last_purchases[item.pk] = _last_purchase_payload(newest and {'store_id': newest.store_id, 'product_url': newest.product_url})
+        all_tags = [{'name': tag.name, 'item_count': tag.item_count} for tag in tag_cloud(items)]
+        context = {
+            'items': items,
+            'search_query': search_query,
+            'selected_tags': selected_tag_names,
+            'tag_facets': {tag['name']: tag['item_count'] for tag in all_tags},
+            'spec_facets': spec_facets(items),
+            'display_currency': currency,
+            'last_purchases': last_purchases,
+        }
+        html = render_to_string('catalog/_item_list_fragment.html', context, request=request)
+        return {'html': html, 'tags': all_tags}
+    return build
 
-    items = items.distinct().order_by('name')
+def _listing_key(search_query, selected_tag_names, spec_filters):
+    return (search_query, tuple(selected_tag_names), tuple(spec_filters))
+
+def _search_key(request):
+    """_listing_key() of the search in the query string."""
+    return _listing_key(
+        request.GET.get('q', ''), parse_tag_names(request.GET.get('tags', '')), parse_spec_filters(request.GET),
+    )
+
+def _item_listing(request, search_query, selected_tag_names, spec_filters):
+    """The rendered result fragment and tag cloud for one search, cached per (query, tags, specs)."""
+    return get_or_build(
+        'item_listing', _listing_key(search_query, selected_tag_names, spec_filters), LISTING_NAMESPACES,
+        _listing_builder(request, search_query, selected_tag_names, spec_filters),
+    )
+
+def item_list(request):
+    current_search_query = request.GET.get('q', '') 
+    selected_tag_names = parse_tag_names(request.GET.get('tags', ''))
+    spec_filters = parse_spec_filters(request.GET)
+
+    listing = _item_listing(request, current_search_query, selected_tag_names, spec_filters)
 
     price_form = PriceHistoryForm()
-    all_tags = Tag.objects.all().order_by('name')
 
     context = {
-        'items': items,
+        'item_list_html': mark_safe(listing['html']),
         'page_title': 'All Items',
         'search_query': current_search_query,
         'selected_tags': selected_tag_names,
-        'all_tags': all_tags,
+        'all_tags': listing['tags'],
         'price_form': price_form,
     }
     return render(request, 'catalog/item_list.html', context)
 
+def _grouped_specifications(item):
+    """The item's specifications as [{'group': AttributeGroup, 'specifications': [...]}].
+
+    One query loads each spec with its attribute and group; ordering by the
+    group's id as well keeps groups that share a display_order contiguous.
+    """
+    specifications = item.specifications.select_related('attribute__group').order_by(
+        'attribute__group__display_order', 'attribute__group__name', 'attribute__group_id',
+        'attribute__display_order', 'attribute__name',
+    )
+    return [
+        {'group': group, 'specifications': list(specs)}
+        for group, specs in groupby(specifications, key=lambda spec: spec.attribute.group)
+    ]
+
+def _item_detail_namespaces(request, item_id):
+    return (item_namespace(item_id), 'tags', 'stores', 'attributes', 'exchange_rates')
+
+@conditional('item_detail', lambda request, item_id: (item_id,), _item_detail_namespaces)
 def item_detail(request, item_id):
-    item = get_object_or_404(Item, pk=item_id)
-    price_entries = item.price_entries.all().order_by('-date_recorded')
-    tags = item.tags.all()
-    context = {
-        'item': item,
-        'price_entries': price_entries,
-        'tags': tags,
-        'page_title': item.name,
-    }
-    return render(request, 'catalog/item_detail.html', context)
+    def build():
+        item = get_object_or_404(Item, pk=item_id)
+        price_entries = list(item.price_entries.select_related('store').order_by('-date_recorded'))
+        stores = {entry.store_id: entry.store for entry in price_entries}
+        stats_currency = display_currency()
+        price_stats = item_price_stats(item.pk, currency=stats_currency)
+        for row in price_stats:
+            row['store'] = stores[row['store_id']]
+        tags = item.tags.all()
+        # Archived rows are counted in price_stats through their daily rollups.
+        archived = item.price_rollups.aggregate(observations=Sum('observations'), first_day=Min('day'), last_day=Max('day'))
+        context = {
+            'item': item,
+            'spec_groups': _grouped_specifications(item),
+            'price_entries': price_entries,
+            'archived_history': archived if archived['observations'] else None,
+            'price_stats': price_stats,
+            'stats_currency': stats_currency,
+            'tags': tags,
+            'page_title': item.name,
+        }
+        return render_to_string('catalog/item_detail.html', context, request=request)
+
+    return HttpResponse(get_or_build('item_detail', (item_id,), _item_detail_namespaces(request, item_id), build))
 
+@conditional('item_listing', _search_key, LISTING_NAMESPACES)
 def ajax_search_items(request):
     current_search_query = request.GET.get('q', '')
-    selected_tag_names = [tag.strip() for tag in request.GET.get('tags', '').split(',') if tag.strip()]
+    selected_tag_names = parse_tag_names(request.GET.get('tags', ''))
+    spec_filters = parse_spec_filters(request.GET)
 
-    items = Item.objects.all()
+    listing = _item_listing(request, current_search_query, selected_tag_names, spec_filters)
+    return HttpResponse(listing['html'])
 
-    if current_search_query:
-        items = items.filter(name__icontains=current_search_query)
-    
-    if selected_tag_names:
-        for tag_name in selected_tag_names:
-            items = items.filter(tags__name__iexact=tag_name)
-            
-    items = items.distinct().order_by('name')
-    
-    context = {
-        'items': items, 
-        'search_query': current_search_query,
-        'selected_tags': selected_tag_names 
-    }
-    html_fragment = render_to_string('catalog/_item_list_fragment.html', context, request=request)
-    return HttpResponse(html_fragment)
+
+def tag_best_value(request, tag_name):
+    def build():
+        tag = get_object_or_404(Tag.objects.annotate(lower_name=Lower('name')), lower_name=tag_name.lower())
+        rankings = [
+            {'base_unit': base_unit, 'unit_prices': best_value(tag.name, base_unit)}
+            for base_unit in BASE_UNITS
+        ]
+        context = {
+            'tag': tag,
+            'rankings': [ranking for ranking in rankings if ranking['unit_prices']],
+            'page_title': f"Best value: {tag.name}",
+        }
+        return render_to_string('catalog/best_value.html', context, request=request)
+
+    namespaces = ('items', 'tags', 'stores', 'unit_prices')
+    return HttpResponse(get_or_build('best_value', (tag_name.lower(),), namespaces, build))
 
 
 def ajax_get_last_purchase_details(request, item_id):
-    item = get_object_or_404(Item, pk=item_id)
-    last_purchase = item.price_entries.order_by('-date_recorded').first()
+    last_purchase = LatestPrice.objects.last_for_item(item_id)
     
     data_to_return = {'store_id': None, 'product_url': None}
 
     if last_purchase:
-        if last_purchase.store:
-            data_to_return['store_id'] = last_purchase.store.id
+        data_to_return['store_id'] = last_purchase.store_id
         if last_purchase.product_url:
             data_to_return['product_url'] = last_purchase.product_url
+    else:
+        get_object_or_404(Item, pk=item_id)
             
     return JsonResponse(data_to_return)
 
+def _last_purchase_payload(row):
+    if not row:
+        return {'store_id': None, 'product_url': None}
+    return {'store_id': row['store_id'], 'product_url': row['product_url'] or None}
+
+def _parse_item_ids(raw):
+    """Parses ``1,2,3`` into unique ids in request order; raises ValueError."""
+    item_ids = list(dict.fromkeys(int(part) for part in raw.split(',') if part.strip()))
+    if not item_ids or len(item_ids) > LAST_PURCHASE_BATCH_MAX:
+        raise ValueError(raw)
+    return item_ids
+
+@require_GET
+def ajax_get_last_purchase_details_batch(request):
+    """Last store and product URL for up to LAST_PURCHASE_BATCH_MAX items (``?ids=1,2,3``).
+
+    One query, whatever the number of items. Unknown items and items
+    without prices both come back with null fields.
+    """
+    try:
+        item_ids = _parse_item_ids(request.GET.get('ids', ''))
+    except ValueError:
+        return JsonResponse({'error': f"ids must be 1 to {LAST_PURCHASE_BATCH_MAX} comma-separated item ids."}, status=400)
+    latest = LatestPrice.objects.last_for_items(item_ids)
+    return JsonResponse({'results': {item_id: _last_purchase_payload(latest.get(item_id)) for item_id in item_ids}})
+
 def add_price_entry(request, item_id):
     item = get_object_or_404(Item, pk=item_id)
     if request.method == 'POST':
@@ -104,4 +234,174 @@ def add_price_entry(request, item_id):
 
             return redirect('catalog:item_list')
 
-    return redirect('catalog:item_list')
\ No newline at end of file
+    return redirect('catalog:item_list')
+
+def _history_params(request):
+    """The store/since/until parameters as (store_id, since, until); raises ValueError on bad input."""
+    return (
+        int(request.GET['store']) if request.GET.get('store') else None,
+        parse_datetime_param(request.GET['since']) if request.GET.get('since') else None,
+        parse_datetime_param(request.GET['until']) if request.GET.get('until') else None,
+    )
+
+def _filter_price_history(request, entries):
+    """Applies the store/since/until parameters; raises ValueError on bad input."""
+    store_id, since, until = _history_params(request)
+    if store_id is not None:
+        entries = entries.filter(store_id=store_id)
+    if since is not None:
+        entries = entries.filter(date_recorded__gte=since)
+    if until is not None:
+        entries = entries.filter(date_recorded__lt=until)
+    return entries
+
+def _archived_price_history(request, item_id):
+    """The archive tables' rows matching the parameters, for page_price_history()."""
+    store_id, since, until = _history_params(request)
+    return [
+        (month_end, _filter_price_history(request, entries))
+        for month_end, entries in archived_entries(item_id, store_id, since, until)
+    ]
+
+def _price_rollups(request, item_id):
+    store_id, since, until = _history_params(request)
+    return rollup_entries(item_id, store_id, since, until)
+
+def _price_history_limit(request):
+    try:
+        limit = min(int(request.GET.get('limit', PRICE_HISTORY_PAGE_SIZE)), PRICE_HISTORY_MAX_PAGE_SIZE)
+    except ValueError:
+        limit = PRICE_HISTORY_PAGE_SIZE
+    return max(limit, 1)
+
+@require_GET
+def api_price_history(request, item_id):
+    item = get_object_or_404(Item.objects.only('id'), pk=item_id)
+
+    try:
+        entries = _filter_price_history(request, PriceHistory.objects.filter(item=item))
+    except ValueError:
+        return JsonResponse({'error': "Invalid store, since or until parameter."}, status=400)
+
+    resolution = request.GET.get('resolution')
+    if resolution:
+        if resolution not in RESOLUTIONS:
+            return JsonResponse({'error': f"resolution must be one of: {', '.join(RESOLUTIONS)}."}, status=400)
+        currency = request.GET.get('currency', '').strip().upper() or None
+        try:
+            results = downsample_price_history(
+                entries, resolution, currency=currency, rollups=_price_rollups(request, item.id),
+            )
+        except MissingRate as exc:
+            return JsonResponse({'error': f"No exchange rate for {exc.args[0]}."}, status=400)
+        return JsonResponse({
+            'item_id': item.id,
+            'resolution': resolution,
+            'results': results,
+        })
+
+    limit = _price_history_limit(request)
+    try:
+        rows, next_cursor = page_price_history(
+            entries, request.GET.get('cursor'), limit, archived=_archived_price_history(request, item.id),
+        )
+    except InvalidCursor:
+        return JsonResponse({'error': "Invalid cursor."}, status=400)
+    return JsonResponse({
+        'item_id': item.id,
+        'results': rows,
+        'next_cursor': next_cursor,
+    })
+
+def _has_ingest_token(request):
+    expected = getattr(settings, 'CATALOG_INGEST_TOKEN', '')
+    supplied = request.headers.get('Authorization', '').removeprefix('Bearer ').strip()
+    return bool(expected) and hmac.compare_digest(supplied.encode(), expected.encode())
+
+@csrf_exempt
+@require_POST
+def api_ingest_prices(request):
+    """Bulk price upload for scrapers.
+
+    Accepts a JSON array of rows (or ``{"rows": [...]}``), or NDJSON when the
+    content type is ``application/x-ndjson``. Authenticated with
+    ``Authorization: Bearer <CATALOG_INGEST_TOKEN>``. ``?mode=changes``
+    folds repeated prices into the existing run instead of adding rows.
+
+    NDJSON is streamed from the request a line at a time, so its size isn't
+    bound by DATA_UPLOAD_MAX_MEMORY_SIZE; a JSON body may be at most
+    CATALOG_INGEST_MAX_JSON_SIZE bytes.
+    """
+    if not _has_ingest_token(request):
+        return JsonResponse({'error': "Invalid or missing ingest token."}, status=403)
+
+    if request.content_type in ('application/x-ndjson', 'application/jsonl'):
+        rows = read_ndjson(request)
+    else:
+        max_size = getattr(settings, 'CATALOG_INGEST_MAX_JSON_SIZE', 64 * 1024 * 1024)
+        body = request.read(max_size + 1)
+        if len(body) > max_size:
+            return JsonResponse(
+                {'error': f"JSON body exceeds {max_size} bytes; upload large batches as NDJSON."}, status=413,
+            )
+        try:
+            payload = json.loads(body)
+        except (json.JSONDecodeError, UnicodeDecodeError):
+            return JsonResponse({'error': "Body is not valid JSON."}, status=400)
+        rows = payload.get('rows') if isinstance(payload, dict) else payload
+        if not isinstance(rows, list):
+            return JsonResponse({'error': "Expected a list of rows."}, status=400)
+
+    batch_size = getattr(settings, 'CATALOG_INGEST_BATCH_SIZE', 1000)
+    changes_only = request.GET.get('mode') == 'changes'
+    report = PriceIngestor(batch_size=batch_size, changes_only=changes_only).ingest(rows)
+    status = 201 if report.created or report.merged else 400
+    return JsonResponse(report.as_dict(max_errors=INGEST_MAX_REPORTED_ERRORS), status=status)
+
+@require_GET
+def api_export_prices(request):
+    """Streams price history as CSV or NDJSON, optionally gzipped.
+
+    For staff users, or ``Authorization: Bearer <CATALOG_INGEST_TOKEN>``.
+    Filters: ``item``, ``store``, ``since``, ``until``; ``format`` is csv
+    (default) or ndjson and ``gzip=1`` compresses the stream.
+    """
+    if not (request.user.is_staff or _has_ingest_token(request)):
+        return JsonResponse({'error': "Staff login or ingest token required."}, status=403)
+
+    fmt = request.GET.get('format', 'csv')
+    if fmt not in EXPORT_FORMATS:
+        return JsonResponse({'error': f"format must be one of: {', '.join(EXPORT_FORMATS)}."}, status=400)
+    compress = request.GET.get('gzip') in ('1', 'true', 'yes')
+    try:
+        filters = {
+            'item': int(request.GET['item']) if request.GET.get('item') else None,
+            'store': int(request.GET['store']) if request.GET.get('store') else None,
+            'since': parse_datetime_param(request.GET['since']) if request.GET.get('since') else None,
+            'until': parse_datetime_param(request.GET['until']) if request.GET.get('until') else None,
+        }
+    except ValueError:
+        return JsonResponse({'error': "Invalid item, store, since or until parameter."}, status=400)
+
+    content_type = 'text/csv; charset=utf-8' if fmt == 'csv' else 'application/x-ndjson'
+    response = StreamingHttpResponse(
+        export_chunks(export_rows(**filters), fmt, compress),
+        content_type='application/gzip' if compress else content_type,
+    )
+    response['Content-Disposition'] = f'attachment; filename="{export_filename(fmt, compress)}"'
+    return response
+
+@require_GET
+def perf_stats(request):
+    """Per-view timing percentiles from catalog.profiling.ProfilingMiddleware.
+
+    Covers this server process only. Staff only: REMOTE_ADDR is the proxy's
+    address behind a reverse proxy, so it cannot vouch for the client.
+    """
+    if not request.user.is_staff:
+        return JsonResponse({'error': "Staff login required."}, status=403)
+    return JsonResponse({
+        'enabled': getattr(settings, 'CATALOG_PROFILING', False),
+        'sample_rate': getattr(settings, 'CATALOG_PROFILING_SAMPLE_RATE', None),
+        'views': profiling_stats.report(),
+    })